@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
-from database.models import InfluencerMode, VideoStatus, SponsorMatchStatus
+from database.models import InfluencerMode, VideoStatus, SponsorMatchStatus, WorkflowStatus, LinkStatus
 
 
 class LifestylePlanning(BaseModel):
@@ -13,6 +13,10 @@ class LifestylePlanning(BaseModel):
         le=90,
         description="Number of days for which to generate a content plan.",
     )
+    use_batch: bool = Field(
+        default=False,
+        description="Generate the plan through the offline batch API. Cheaper, but content arrives over minutes to hours.",
+    )
 
 
 class PostingFrequency(BaseModel):
@@ -50,6 +54,7 @@ class InfluencerCreate(InfluencerBase):
 class Influencer(InfluencerBase):
     id: int
     is_active: bool
+    life_story_version: Optional[int] = None
     created_at: datetime
     updated_at: datetime
 
@@ -57,6 +62,42 @@ class Influencer(InfluencerBase):
         from_attributes = True
 
 
+class InfluencerSummary(BaseModel):
+    """Influencer without the life story, for list views."""
+
+    id: int
+    name: str
+    face_image_url: Optional[str] = None
+    persona: Dict[str, Any]
+    mode: InfluencerMode
+    audience_targeting: Optional[Dict[str, Any]] = None
+    growth_phase_enabled: bool = True
+    growth_intensity: float
+    posting_frequency: Optional[PostingFrequency] = None
+    is_active: bool
+    life_story_version: Optional[int] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class LifeStoryVersion(BaseModel):
+    version: int
+    kind: str
+    length: int
+    stored_bytes: int
+    event: Optional[str] = None
+    created_at: datetime
+
+
+class LifeStoryDiff(BaseModel):
+    from_version: int
+    to_version: int
+    diff: str
+
+
 class OnboardingWizardRequest(BaseModel):
     mode: InfluencerMode
     name: str
@@ -102,10 +143,10 @@ class IntervalScheduleRequest(BaseModel):
     """Request to schedule posts at regular intervals."""
 
     influencer_id: int
-    days_to_schedule: int = Field(
+    days_to_schedule: Optional[int] = Field(
         default=30,
         ge=1,
-        description="Number of days into the future to schedule posts.",
+        description="Number of days into the future to schedule posts; null keeps scheduling until stopped.",
     )
     reel_interval_hours: Optional[int] = Field(
         default=48, ge=1, description="Interval in hours for posting new reels."
@@ -153,6 +194,7 @@ class Video(VideoBase):
     thumbnail_url: Optional[str] = None
     status: VideoStatus
     performance_metrics: Optional[Dict[str, Any]] = None
+    media_id: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
@@ -160,6 +202,127 @@ class Video(VideoBase):
         from_attributes = True
 
 
+class VideoMediaLink(BaseModel):
+    media_id: str = Field(min_length=1, max_length=64)
+
+
+class Comment(BaseModel):
+    id: int
+    comment_pk: str
+    media_id: str
+    video_id: Optional[int] = None
+    username: Optional[str] = None
+    text: str
+    commented_at: Optional[datetime] = None
+    analyzed: bool
+
+    class Config:
+        from_attributes = True
+
+
+class InstagramAccountLink(BaseModel):
+    username: str
+    link_status: Optional[LinkStatus] = None
+    link_error: Optional[str] = None
+    link_attempts: Optional[int] = None
+    is_active: bool
+    full_name: Optional[str] = None
+    follower_count: Optional[int] = None
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class StatsPoint(BaseModel):
+    bucket_start: datetime
+    followers: int
+    followers_min: int
+    followers_max: int
+    following: int
+    media: int
+
+
+class PerformanceRollup(BaseModel):
+    content_type: str
+    hour_of_day: int
+    posts: int
+    likes: int
+    comments: int
+    views: int
+    reach: int
+    avg_likes: float
+    avg_comments: float
+    avg_views: float
+    avg_reach: float
+
+
+class IntervalPlan(BaseModel):
+    influencer_id: int
+    reel_interval_hours: Optional[int]
+    story_interval_hours: Optional[int]
+    ends_at: Optional[datetime]
+    next_reel_at: Optional[datetime]
+    next_story_at: Optional[datetime]
+    planned_until: Optional[datetime]
+    posts_created: int
+    is_active: bool
+
+    class Config:
+        from_attributes = True
+
+
+class AccountRelinkRequest(BaseModel):
+    password: Optional[str] = None
+
+
+class UploadRequest(BaseModel):
+    username: str
+    kind: Literal["photo", "video", "story"]
+    path: str = Field(min_length=1, max_length=500)
+    caption: str = ""
+    video_id: Optional[int] = None
+
+
+class UploadJob(BaseModel):
+    id: int
+    username: str
+    kind: str
+    path: str
+    caption: Optional[str] = None
+    video_id: Optional[int] = None
+    status: WorkflowStatus
+    attempts: int
+    not_before: Optional[datetime] = None
+    media_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class VideoOperation(BaseModel):
+    id: int
+    influencer_id: Optional[int] = None
+    provider: str
+    operation_name: Optional[str] = None
+    prompt: str
+    topic: Optional[str] = None
+    status: WorkflowStatus
+    polls: int
+    video_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 class VideoGenerationRequest(BaseModel):
     influencer_id: int
     prompt: VideoGenerationPrompt
@@ -239,3 +402,50 @@ class ImageGenerateRequest(BaseModel):
 class DivineInterventionRequest(BaseModel):
     event_description: str
     intensity: str  # e.g., 'subtle', 'moderate', 'major'
+
+
+class WorkflowJob(BaseModel):
+    id: int
+    kind: str
+    influencer_id: Optional[int] = None
+    status: WorkflowStatus
+    step: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class SignificanceSettings(BaseModel):
+    threshold: float = Field(
+        ge=0,
+        le=1,
+        description="Everyday-content posts scoring below this are treated as trivial without an LLM call.",
+    )
+
+
+class ModelRouteUpdate(BaseModel):
+    """Runtime override for a task's model route."""
+
+    tier: Optional[Literal["lite", "flash", "pro"]] = None
+    priority: Optional[Literal["interactive", "agent", "bulk"]] = None
+    max_output_tokens: Optional[int] = Field(default=None, ge=1)
+    thinking_budget: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="Thinking token budget. 0 disables thinking. Must be smaller than max_output_tokens.",
+    )
+    latency_budget_s: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Smoothed latency above which the task is downgraded a tier.",
+    )
+    context_tokens: Optional[int] = Field(
+        default=None,
+        ge=200,
+        description="Token budget for life-story context in the task's prompts.",
+    )
@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List
+from typing import List, Literal, Optional
 import os
 import uuid
 from pydantic import BaseModel
@@ -17,6 +17,8 @@ from PIL import Image, ImageDraw, ImageFont
 
 from database.models import (
     get_db,
+    get_db_session,
+    init_db,
     Influencer,
     Video,
     Schedule,
@@ -24,19 +26,46 @@ from database.models import (
     SponsorMatch,
     VideoStatus,
     InfluencerMode,
+    WorkflowJob,
+    Comment,
+    UploadJob,
+    InstagramAccount,
+    LinkStatus,
+    IntervalPlan,
+    VideoOperation,
 )
 from api import schemas
 from managers.instagram_manager import InstagramManager
-from managers.scheduler import video_scheduler
+from managers.scheduler import video_scheduler, LONG_EXECUTOR
 from managers.ai_generator import ai_generator
+from managers.batch_generator import batch_generator
 from managers.agent_core import agent_core
+from managers.model_router import model_router
+from managers.llm_quota import llm_quota
+from managers.life_story_store import life_story_store
+from managers.significance_filter import significance_filter
+from managers.sentiment_scorer import sentiment_scorer
+from managers.comment_ingestor import comment_ingestor
+from managers.trend_feed import trend_feed, persona_hash
+from managers.upload_queue import upload_queue
+from managers.stats_collector import stats_collector
+from managers.metrics_ingestor import metrics_ingestor
+from managers.posting_time_optimizer import posting_time_optimizer
+from managers.calendar_index import calendar_index
+from managers.video_operations import video_operations
+from managers.video_generator import video_generator
 from utils.background_tasks import (
     process_interval_schedule,
     process_dated_schedule,
-    plan_and_schedule_from_life_story,
+    extend_interval_plans,
 )
+from utils.replanner import replan_after_story_change, divine_intervention_workflow
+from utils.workflows import create_workflow, active_workflow, run_workflow, fail_interrupted_workflows
+from utils.onboarding import link_account_workflow, onboarding_workflow, unfinished_links
+from utils.fake_instagram import FakeInstagramClient
 
 load_dotenv()
+init_db()
 
 app = FastAPI(title="AI Influencer Manager API", version="2.0.0")
 
@@ -52,6 +81,18 @@ app.add_middleware(
 app.mount("/storage", StaticFiles(directory="storage"), name="storage")
 
 ig_manager = InstagramManager()
+upload_queue.manager = ig_manager
+stats_collector.manager = ig_manager
+metrics_ingestor.listeners.append(posting_time_optimizer.observe)
+
+# INSTAGRAM_CLIENT=fake serves comments and media metrics from an in-memory stand-in instead of instagrapi
+if os.getenv("INSTAGRAM_CLIENT", "instagrapi") == "fake":
+    fake_instagram = FakeInstagramClient()
+    comment_ingestor.client_provider = lambda influencer_id: fake_instagram
+    metrics_ingestor.client_provider = lambda influencer_id: fake_instagram
+else:
+    comment_ingestor.client_provider = ig_manager.client_for_influencer
+    metrics_ingestor.client_provider = ig_manager.client_for_influencer
 
 STORAGE_DIR = Path("storage/files")
 STORAGE_DIR.mkdir(parents=True, exist_ok=True)
@@ -60,6 +101,7 @@ STORAGE_DIR.mkdir(parents=True, exist_ok=True)
 
 class DemoTriggerRequest(BaseModel):
     trend: str
+    influencer_id: Optional[int] = None
 
 @app.post("/demo/trigger")
 def trigger_agent_demo(request: DemoTriggerRequest):
@@ -67,7 +109,7 @@ def trigger_agent_demo(request: DemoTriggerRequest):
     Manually triggers the agent to evaluate a specific trend.
     Injects the trend into AgentCore and it will be picked up in the next tick.
     """
-    agent_core.inject_trend(request.trend)
+    agent_core.inject_trend(request.trend, request.influencer_id)
     return {"message": f"Trend '{request.trend}' injected. Agent will evaluate it shortly."}
 
 class AgentFocusRequest(BaseModel):
@@ -87,9 +129,61 @@ def get_agent_status():
         "roi_score": agent_core.last_roi_score,
         "interests": agent_core.current_persona_interests,
         "mood": agent_core.current_mood,
+        "sentiment_score": round(agent_core.memory.get_average_sentiment(10), 3),
+        "sentiment_scorer": sentiment_scorer.metrics(),
         "recent_logs": agent_core.recent_activity
     }
 
+@app.get("/api/trends")
+def get_trend_queue(influencer_id: Optional[int] = None, limit: int = 10, db: Session = Depends(get_db)):
+    """Upcoming trends for an influencer (default: the agent's focus), best first"""
+    query = db.query(Influencer)
+    influencer_id = influencer_id or agent_core.active_influencer_id
+    if influencer_id:
+        query = query.filter(Influencer.id == influencer_id)
+    influencer = query.first()
+    if not influencer:
+        raise HTTPException(status_code=404, detail="Influencer not found")
+    return {
+        "influencer_id": influencer.id,
+        "trends": trend_feed.peek(influencer.id, persona_hash(influencer), min(max(limit, 1), 100)),
+        "feed": trend_feed.stats(),
+    }
+
+@app.get("/api/llm/quota")
+def get_llm_quota():
+    """LLM admission scheduler metrics: window usage, queue depth and wait times per class."""
+    return llm_quota.metrics()
+
+@app.get("/api/significance")
+def get_significance_filter():
+    """Local significance pre-filter threshold and hit/skip counters"""
+    return significance_filter.metrics()
+
+
+@app.put("/api/significance")
+def update_significance_filter(settings: schemas.SignificanceSettings):
+    """Tune the score below which lifestyle posts skip the LLM significance check"""
+    significance_filter.set_threshold(settings.threshold)
+    return significance_filter.metrics()
+
+
+@app.get("/api/models/routes")
+def get_model_routes():
+    """Current task -> model routing table with live latency and downgrade state."""
+    return model_router.snapshot()
+
+@app.put("/api/models/routes/{task}")
+def update_model_route(task: str, request: schemas.ModelRouteUpdate):
+    """Overrides the model tier, token limits or budgets for a task at runtime."""
+    try:
+        route = model_router.set_route(task, **request.model_dump(exclude_unset=True))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"task": task, "route": route}
+
 
 
 
@@ -109,13 +203,26 @@ def process_lifestyle_post_update(
 
         print(f"Processing new post for {influencer.name}: {event_description}")
 
-        # 1. Update life story if AI deems event significant
+        # 1. Skip obviously trivial posts locally, before any LLM call
+        forward, score = significance_filter.should_forward(
+            event_description,
+            influencer.life_story,
+            index_key=(influencer.id, influencer.life_story_version),
+        )
+        if not forward:
+            print(
+                f"Post for {influencer.name} filtered as trivial (score {score:.2f}). No LLM check needed."
+            )
+            return
+
+        # 2. Update life story if AI deems event significant
         (
             updated_story,
             was_updated,
         ) = ai_generator.update_life_story_if_significant(
-            influencer.life_story, event_description
+            influencer.life_story, event_description, influencer_id=influencer.id
         )
+        significance_filter.record_outcome(was_updated)
 
         if not was_updated:
             print(
@@ -123,42 +230,16 @@ def process_lifestyle_post_update(
             )
             return
 
-        influencer.life_story = updated_story
-        db.commit()
-        db.refresh(influencer)
+        life_story_store.write(
+            db, influencer, updated_story, event=f"Post: {event_description}"
+        )
         print(f"Updated life story for {influencer.name}.")
 
-        # 2. Clear upcoming scheduled posts
-        now = datetime.now()
-        future_schedules = (
-            db.query(Schedule)
-            .join(Video, Video.id == Schedule.video_id)
-            .filter(Video.influencer_id == influencer_id)
-            .filter(Schedule.run_at > now)
-            .all()
+        # 3. Regenerate only the upcoming posts the change affects
+        replan_after_story_change(
+            influencer.id, event_description, exclude_video_ids=[trigger_video_id]
         )
-
-        for schedule in future_schedules:
-            if schedule.video_id == trigger_video_id:
-                continue  # Don't delete the post that triggered this update
-
-            print(f"Unscheduling and deleting old post {schedule.video_id}")
-            if schedule.job_id:
-                video_scheduler.unschedule_video(schedule.job_id)
-
-            video_to_delete = (
-                db.query(Video).filter(Video.id == schedule.video_id).first()
-            )
-            db.delete(schedule)
-            if video_to_delete:
-                db.delete(video_to_delete)
-
-        db.commit()
-        print("Cleared future posts.")
-
-        # 3. Regenerate schedule
-        plan_and_schedule_from_life_story(influencer.id, days_to_plan=30)
-        print(f"Triggered content regeneration for {influencer.name}.")
+        print(f"Replanned upcoming content for {influencer.name}.")
 
     finally:
         db.close()
@@ -179,10 +260,6 @@ def create_influencer_wizard(
         "tone": wizard_data.tone,
     }
 
-    life_story = None
-    if wizard_data.mode == InfluencerMode.LIFESTYLE:
-        life_story = ai_generator.generate_life_story(wizard_data.name, persona)
-
     audience_targeting = {
         "age_range": wizard_data.audience_age_range,
         "gender": wizard_data.audience_gender,
@@ -194,7 +271,6 @@ def create_influencer_wizard(
         name=wizard_data.name,
         face_image_url=wizard_data.face_image_url,
         persona=persona,
-        life_story=life_story,
         mode=wizard_data.mode,
         audience_targeting=audience_targeting,
         growth_phase_enabled=wizard_data.growth_phase_enabled,
@@ -209,10 +285,16 @@ def create_influencer_wizard(
     db.commit()
     db.refresh(db_influencer)
 
-    success, _message = ig_manager.add_account(
+    # Login and profile fetch run in the background; progress is on /influencer/{id}/accounts
+    success, _message = ig_manager.register_account(
         wizard_data.instagram_username, wizard_data.instagram_password, db_influencer.id
     )
-    if not success:
+    if success:
+        job = create_workflow(db, "instagram_link", db_influencer.id)
+        background_tasks.add_task(
+            run_workflow, job.id, link_account_workflow, ig_manager, wizard_data.instagram_username
+        )
+    else:
         print(
             f"Warning: Could not link Instagram account for {wizard_data.name}. Error: {_message}"
         )
@@ -221,7 +303,7 @@ def create_influencer_wizard(
         background_tasks.add_task(
             process_interval_schedule,
             db_influencer.id,
-            7,  # 7 days
+            None,  # keeps extending; see extend_interval_plans
             wizard_data.posting_frequency.reel_interval_hours,
             wizard_data.posting_frequency.story_interval_hours,
         )
@@ -231,16 +313,22 @@ def create_influencer_wizard(
             if wizard_data.lifestyle_planning
             else 30
         )  # for now
+        use_batch = (
+            wizard_data.lifestyle_planning.use_batch
+            if wizard_data.lifestyle_planning
+            else False
+        )
+        job = create_workflow(
+            db, "onboarding", db_influencer.id, params={"days_to_plan": days_to_plan, "use_batch": use_batch}
+        )
         background_tasks.add_task(
-            plan_and_schedule_from_life_story,
-            db_influencer.id,
-            days_to_plan=days_to_plan,
+            run_workflow, job.id, onboarding_workflow, db_influencer.id, days_to_plan, use_batch
         )
 
     return db_influencer
 
 
-@app.get("/influencers", response_model=List[schemas.Influencer])
+@app.get("/influencers", response_model=List[schemas.InfluencerSummary])
 def list_influencers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """List user's influencers"""
     influencers = db.query(Influencer).offset(skip).limit(limit).all()
@@ -256,6 +344,102 @@ def get_influencer(influencer_id: int, db: Session = Depends(get_db)):
     return influencer
 
 
+@app.get("/influencer/{influencer_id}/accounts", response_model=List[schemas.InstagramAccountLink])
+def get_influencer_accounts(influencer_id: int, db: Session = Depends(get_db)):
+    """Instagram accounts of an influencer with their linking status"""
+    if not db.query(Influencer.id).filter(Influencer.id == influencer_id).first():
+        raise HTTPException(status_code=404, detail="Influencer not found")
+    return db.query(InstagramAccount).filter(InstagramAccount.influencer_id == influencer_id).all()
+
+
+@app.get("/influencer/{influencer_id}/stats", response_model=List[schemas.StatsPoint])
+def get_influencer_stats(
+    influencer_id: int,
+    resolution: Literal["hour", "day"] = "day",
+    days: int = 30,
+    db: Session = Depends(get_db),
+):
+    """Follower, following and media counts over time, one point per hour or day"""
+    if not db.query(Influencer.id).filter(Influencer.id == influencer_id).first():
+        raise HTTPException(status_code=404, detail="Influencer not found")
+    return stats_collector.series(db, influencer_id, resolution, min(max(days, 1), 365))
+
+
+@app.post("/api/stats/refresh")
+def refresh_account_stats():
+    """Sample every linked account now instead of waiting for the next scheduled refresh"""
+    return {**stats_collector.collect(), "totals": stats_collector.metrics()}
+
+
+@app.post("/accounts/{username}/link")
+def relink_account(
+    username: str,
+    background_tasks: BackgroundTasks,
+    request: Optional[schemas.AccountRelinkRequest] = None,
+    db: Session = Depends(get_db),
+):
+    """Retry linking an account whose login failed, optionally with a new password"""
+    account = db.query(InstagramAccount).filter(InstagramAccount.username == username).first()
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    if account.link_status != LinkStatus.FAILED:
+        raise HTTPException(
+            status_code=409, detail=f"Account is {account.link_status.value if account.link_status else 'linked'}"
+        )
+
+    password = request.password if request and request.password else account.password
+    success, message = ig_manager.register_account(username, password, account.influencer_id)
+    if not success:
+        raise HTTPException(status_code=400, detail=message)
+
+    job = create_workflow(db, "instagram_link", account.influencer_id)
+    background_tasks.add_task(run_workflow, job.id, link_account_workflow, ig_manager, username)
+    return {"username": username, "link_status": LinkStatus.PENDING.value, "job_id": job.id}
+
+
+@app.get(
+    "/influencer/{influencer_id}/life-story/versions",
+    response_model=List[schemas.LifeStoryVersion],
+)
+def list_life_story_versions(influencer_id: int, db: Session = Depends(get_db)):
+    """Life story history, oldest first"""
+    if not db.query(Influencer.id).filter(Influencer.id == influencer_id).first():
+        raise HTTPException(status_code=404, detail="Influencer not found")
+    return [
+        schemas.LifeStoryVersion(
+            version=row.version,
+            kind=row.kind,
+            length=row.length,
+            stored_bytes=len(row.payload),
+            event=row.event,
+            created_at=row.created_at,
+        )
+        for row in life_story_store.versions(db, influencer_id)
+    ]
+
+
+@app.get(
+    "/influencer/{influencer_id}/life-story/diff",
+    response_model=schemas.LifeStoryDiff,
+)
+def diff_life_story(
+    influencer_id: int,
+    from_version: Optional[int] = None,
+    to_version: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    """Diff between two life story versions. Defaults to the latest change."""
+    influencer = db.query(Influencer).filter(Influencer.id == influencer_id).first()
+    if not influencer:
+        raise HTTPException(status_code=404, detail="Influencer not found")
+    head = influencer.life_story_version
+    to_version = to_version or head
+    from_version = from_version or ((to_version or 1) - 1)
+    if not head or not 1 <= from_version <= head or not 1 <= to_version <= head:
+        raise HTTPException(status_code=404, detail="Life story version not found")
+    return life_story_store.diff(influencer_id, from_version, to_version)
+
+
 @app.get("/influencer/{influencer_id}/videos")
 def get_influencer_videos(
     influencer_id: int, include_past: bool = False, db: Session = Depends(get_db)
@@ -316,32 +500,49 @@ def schedule_video(
     if not influencer:
         raise HTTPException(status_code=404, detail="Influencer not found")
 
-    db_video = Video(
-        influencer_id=schedule_data.video_params.influencer_id,
-        sponsor_id=schedule_data.video_params.sponsor_id,
-        scheduled_time=schedule_data.video_params.scheduled_time,
-        generation_prompt=(
-            schedule_data.video_params.generation_prompt.model_dump()
-            if schedule_data.video_params.generation_prompt
-            else None
-        ),
-        content_type=schedule_data.video_params.content_type,
-        caption=schedule_data.video_params.caption,
-        hashtags=schedule_data.video_params.hashtags,
-        platform=schedule_data.video_params.platform,
-    )
-    db.add(db_video)
-    db.commit()
-    db.refresh(db_video)
+    # Reserve the slot first so two concurrent requests can't both take it
+    if schedule_data.is_active and not calendar_index.try_book(influencer.id, schedule_data.run_at):
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": calendar_index.conflict(influencer.id, schedule_data.run_at) or "Time slot is taken",
+                "next_free": calendar_index.next_free(influencer.id, schedule_data.run_at).isoformat(),
+            },
+        )
 
-    db_schedule = Schedule(
-        video_id=db_video.id,
-        run_at=schedule_data.run_at,
-        is_active=schedule_data.is_active,
-    )
-    db.add(db_schedule)
-    db.commit()
-    db.refresh(db_schedule)
+    try:
+        db_video = Video(
+            influencer_id=schedule_data.video_params.influencer_id,
+            sponsor_id=schedule_data.video_params.sponsor_id,
+            scheduled_time=schedule_data.video_params.scheduled_time,
+            generation_prompt=(
+                schedule_data.video_params.generation_prompt.model_dump()
+                if schedule_data.video_params.generation_prompt
+                else None
+            ),
+            content_type=schedule_data.video_params.content_type,
+            caption=schedule_data.video_params.caption,
+            hashtags=schedule_data.video_params.hashtags,
+            platform=schedule_data.video_params.platform,
+        )
+        db.add(db_video)
+        db.commit()
+        db.refresh(db_video)
+
+        db_schedule = Schedule(
+            video_id=db_video.id,
+            run_at=schedule_data.run_at,
+            is_active=schedule_data.is_active,
+        )
+        db.add(db_schedule)
+        db.commit()
+        db.refresh(db_schedule)
+    except Exception:
+        # Release the reserved slot so it isn't held by a post that doesn't exist
+        db.rollback()
+        if schedule_data.is_active:
+            calendar_index.remove(influencer.id, schedule_data.run_at)
+        raise
 
     job_id = video_scheduler.schedule_video(db_schedule.id, db_schedule.run_at)
 
@@ -369,7 +570,8 @@ def schedule_at_intervals(
     request: schemas.IntervalScheduleRequest, background_tasks: BackgroundTasks
 ):
     """
-    Schedules posts (reels, stories) at regular intervals for a set number of days.
+    Schedules posts (reels, stories) at regular intervals for a set number of days,
+    or indefinitely. Posts are created a few days ahead and topped up as time passes.
     """
     background_tasks.add_task(
         process_interval_schedule,
@@ -387,6 +589,27 @@ def schedule_at_intervals(
     }
 
 
+@app.get("/influencer/{influencer_id}/interval-plan", response_model=schemas.IntervalPlan)
+def get_interval_plan(influencer_id: int, db: Session = Depends(get_db)):
+    """The influencer's interval plan and how far ahead it has created posts"""
+    plan = db.query(IntervalPlan).filter(IntervalPlan.influencer_id == influencer_id).first()
+    if not plan:
+        raise HTTPException(status_code=404, detail="No interval plan for this influencer")
+    return plan
+
+
+@app.delete("/influencer/{influencer_id}/interval-plan", response_model=schemas.IntervalPlan)
+def stop_interval_plan(influencer_id: int, db: Session = Depends(get_db)):
+    """Stops extending the interval plan; posts already created stay scheduled"""
+    plan = db.query(IntervalPlan).filter(IntervalPlan.influencer_id == influencer_id).first()
+    if not plan:
+        raise HTTPException(status_code=404, detail="No interval plan for this influencer")
+    plan.is_active = False
+    db.commit()
+    db.refresh(plan)
+    return plan
+
+
 @app.post("/schedule/bulk")
 def create_bulk_dated_schedule(
     request: schemas.BulkScheduleRequest, background_tasks: BackgroundTasks
@@ -537,6 +760,107 @@ def add_sponsor_to_video(video_id: int, sponsor_id: int, db: Session = Depends(g
     return {"video_id": video.id, "sponsor_id": sponsor.id, "updated": True}
 
 
+@app.post("/video/{video_id}/media")
+def link_video_media(video_id: int, request: schemas.VideoMediaLink, db: Session = Depends(get_db)):
+    """Record the Instagram media id of a posted video so its comments are ingested"""
+    video = db.query(Video).filter(Video.id == video_id).first()
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    video.media_id = request.media_id
+    db.commit()
+
+    return {"video_id": video.id, "media_id": video.media_id, "updated": True}
+
+
+@app.get("/influencer/{influencer_id}/comments", response_model=List[schemas.Comment])
+def get_influencer_comments(influencer_id: int, limit: int = 50, db: Session = Depends(get_db)):
+    """Most recently ingested comments on an influencer's posts"""
+    return (
+        db.query(Comment)
+        .filter(Comment.influencer_id == influencer_id)
+        .order_by(Comment.id.desc())
+        .limit(min(max(limit, 1), 500))
+        .all()
+    )
+
+
+@app.post("/api/comments/poll")
+def poll_comments(influencer_id: Optional[int] = None):
+    """Ingest new comments now instead of waiting for the next scheduled poll"""
+    return {**comment_ingestor.poll(influencer_id), "totals": comment_ingestor.metrics()}
+
+
+@app.get("/influencer/{influencer_id}/performance", response_model=List[schemas.PerformanceRollup])
+def get_influencer_performance(influencer_id: int, content_type: Optional[str] = None, db: Session = Depends(get_db)):
+    """Engagement of recent posts per content type and posting hour"""
+    if not db.query(Influencer.id).filter(Influencer.id == influencer_id).first():
+        raise HTTPException(status_code=404, detail="Influencer not found")
+    return metrics_ingestor.performance(db, influencer_id, content_type)
+
+
+@app.get("/influencer/{influencer_id}/posting-times")
+def get_posting_times(
+    influencer_id: int,
+    content_type: Literal["post", "story", "reel"] = "reel",
+    db: Session = Depends(get_db),
+):
+    """Expected engagement by posting hour, as used by the planners"""
+    if not db.query(Influencer.id).filter(Influencer.id == influencer_id).first():
+        raise HTTPException(status_code=404, detail="Influencer not found")
+    return posting_time_optimizer.curve(influencer_id, content_type)
+
+
+@app.post("/api/metrics/poll")
+def poll_metrics(influencer_id: Optional[int] = None):
+    """Ingest post metrics now instead of waiting for the next scheduled poll"""
+    return {**metrics_ingestor.poll(influencer_id), "totals": metrics_ingestor.metrics()}
+
+
+@app.post("/uploads", response_model=schemas.UploadJob)
+def enqueue_upload(request: schemas.UploadRequest, db: Session = Depends(get_db)):
+    """Queue an upload; it is posted when the account's pacing allows and retried if throttled"""
+    if not Path(request.path).is_file():
+        raise HTTPException(status_code=400, detail="Media file not found")
+    if request.video_id and not db.query(Video).filter(Video.id == request.video_id).first():
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    job_id = upload_queue.enqueue(
+        request.username, request.kind, request.path, request.caption, request.video_id
+    )
+    return db.query(UploadJob).filter(UploadJob.id == job_id).first()
+
+
+@app.get("/uploads/{job_id}", response_model=schemas.UploadJob)
+def get_upload(job_id: int, db: Session = Depends(get_db)):
+    """Status of a queued upload"""
+    job = db.query(UploadJob).filter(UploadJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return job
+
+
+@app.get("/video-operations/{operation_id}", response_model=schemas.VideoOperation)
+def get_video_operation(operation_id: int, db: Session = Depends(get_db)):
+    """Status of a video generation"""
+    operation = db.query(VideoOperation).filter(VideoOperation.id == operation_id).first()
+    if not operation:
+        raise HTTPException(status_code=404, detail="Video operation not found")
+    return operation
+
+
+@app.get("/api/video-operations")
+def video_operation_stats():
+    """Video generations submitted, running and finished, free concurrency slots, and verification upload reuse"""
+    return {**video_operations.stats(), "verification_files": video_generator.files.stats()}
+
+
+@app.get("/api/uploads")
+def get_upload_queue():
+    """Upload queue totals and each account's learned rate, tokens and pause"""
+    return upload_queue.stats()
+
+
 @app.post("/generate-image")
 async def generate_image(
     request: schemas.ImageGenerateRequest,
@@ -578,10 +902,76 @@ async def generate_image(
 @app.on_event("startup")
 async def startup_event():
     agent_core.start()
+    video_operations.start()
+    batch_generator.start(
+        video_scheduler.scheduler, int(os.getenv("BATCH_POLL_SECONDS", "60"))
+    )
+    comment_ingestor.start(
+        video_scheduler.scheduler, int(os.getenv("COMMENT_POLL_SECONDS", "120"))
+    )
+    trend_feed.start(
+        video_scheduler.scheduler, int(os.getenv("TREND_POLL_SECONDS", "600"))
+    )
+    agent_core.memories.start(
+        video_scheduler.scheduler, int(os.getenv("AGENT_MEMORY_FLUSH_SECONDS", "30"))
+    )
+    ig_manager.sessions.start(
+        video_scheduler.scheduler, int(os.getenv("INSTAGRAM_SESSION_FLUSH_SECONDS", "60"))
+    )
+    upload_queue.start()
+    stats_collector.start(
+        video_scheduler.scheduler,
+        int(os.getenv("STATS_REFRESH_MINUTES", "60")) * 60,
+        executor=LONG_EXECUTOR,
+    )
+    metrics_ingestor.start(
+        video_scheduler.scheduler,
+        int(os.getenv("METRICS_POLL_SECONDS", "1800")),
+        executor=LONG_EXECUTOR,
+    )
+    video_scheduler.scheduler.add_job(
+        extend_interval_plans,
+        trigger="interval",
+        minutes=int(os.getenv("INTERVAL_EXTEND_MINUTES", "60")),
+        id="interval_plan_extend",
+        replace_existing=True,
+        max_instances=1,
+        executor=LONG_EXECUTOR,
+    )
+    # Linking and onboarding interrupted by a restart start over as new jobs
+    db = get_db_session()
+    try:
+        interrupted = fail_interrupted_workflows(db)
+        for account in unfinished_links():
+            job = create_workflow(db, "instagram_link", account.influencer_id)
+            video_scheduler.scheduler.add_job(
+                run_workflow,
+                args=[job.id, link_account_workflow, ig_manager, account.username],
+                executor=LONG_EXECUTOR,
+                misfire_grace_time=None,
+            )
+        for old_job in interrupted:
+            if old_job.kind != "onboarding" or old_job.influencer_id is None:
+                continue
+            params = old_job.params
+            job = create_workflow(db, "onboarding", old_job.influencer_id, params=params)
+            video_scheduler.scheduler.add_job(
+                run_workflow,
+                args=[job.id, onboarding_workflow, old_job.influencer_id, params["days_to_plan"], params["use_batch"]],
+                kwargs={"resume": True},
+                executor=LONG_EXECUTOR,
+                misfire_grace_time=None,
+            )
+    finally:
+        db.close()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     agent_core.stop()
+    video_operations.stop()
+    agent_core.memories.flush()
+    upload_queue.stop()
+    ig_manager.sessions.flush()
 
 @app.get("/")
 def root():
@@ -614,43 +1004,43 @@ def divine_intervention(
     """
     Triggers a divine intervention, rewriting the influencer's life story
     and regenerating their content schedule.
+
+    Returns immediately with a job id; poll GET /jobs/{job_id} for progress.
     """
     influencer = db.query(Influencer).filter(Influencer.id == influencer_id).first()
     if not influencer or influencer.mode != InfluencerMode.LIFESTYLE:
         raise HTTPException(status_code=404, detail="Lifestyle influencer not found")
 
-    # 1. Rewrite the life story using AI
-    updated_story = ai_generator.rewrite_life_story(
-        influencer.life_story, request.event_description, request.intensity
-    )
-    influencer.life_story = updated_story
-    db.commit()
-
-    # 2. Clear all future posts
-    now = datetime.now()
-    future_schedules = (
-        db.query(Schedule)
-        .join(Video, Video.id == Schedule.video_id)
-        .filter(Video.influencer_id == influencer_id)
-        .filter(Schedule.run_at > now)
-        .all()
-    )
-    for schedule in future_schedules:
-        if schedule.job_id:
-            video_scheduler.cancel_schedule(schedule.job_id)
-        video_to_delete = db.query(Video).filter(Video.id == schedule.video_id).first()
-        db.delete(schedule)
-        if video_to_delete:
-            db.delete(video_to_delete)
-    db.commit()
-    print(f"Cleared {len(future_schedules)} future posts for divine intervention.")
+    running = active_workflow(db, "divine_intervention", influencer_id)
+    if running:
+        raise HTTPException(
+            status_code=409,
+            detail=f"A divine intervention is already in progress (job {running.id})",
+        )
 
-    # 3. Trigger background task to regenerate content from the new story
+    job = create_workflow(db, "divine_intervention", influencer_id)
     background_tasks.add_task(
-        plan_and_schedule_from_life_story, influencer.id, days_to_plan=30
+        run_workflow,
+        job.id,
+        divine_intervention_workflow,
+        influencer_id,
+        request.event_description,
+        request.intensity,
     )
 
-    return {"message": "The heavens have spoken. A new destiny is being written."}
+    return {
+        "message": "The heavens have spoken. A new destiny is being written.",
+        "job_id": job.id,
+    }
+
+
+@app.get("/jobs/{job_id}", response_model=schemas.WorkflowJob)
+def get_workflow_job(job_id: int, db: Session = Depends(get_db)):
+    """Status of a background workflow started by an earlier request."""
+    job = db.query(WorkflowJob).filter(WorkflowJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 if __name__ == "__main__":
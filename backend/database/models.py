@@ -9,10 +9,15 @@ from sqlalchemy import (
     JSON,
     Float,
     Enum,
+    LargeBinary,
+    UniqueConstraint,
+    Index,
     create_engine,
+    inspect,
+    text,
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, deferred
 from datetime import datetime
 import os
 import enum
@@ -39,6 +44,27 @@ class SponsorMatchStatus(enum.Enum):
     DECLINED = "declined"
 
 
+class BatchJobStatus(enum.Enum):
+    SUBMITTED = "submitted"
+    FAILED = "failed"
+    PROCESSED = "processed"
+
+
+class LinkStatus(enum.Enum):
+    PENDING = "pending"
+    LINKING = "linking"
+    RETRYING = "retrying"
+    LINKED = "linked"
+    FAILED = "failed"
+
+
+class WorkflowStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
 class Influencer(Base):
     __tablename__ = "influencers"
 
@@ -46,7 +72,10 @@ class Influencer(Base):
     name = Column(String(255), nullable=False)
     face_image_url = Column(String(500), nullable=True)
     persona = Column(JSON, nullable=False)
-    life_story = Column(Text, nullable=True)
+    # Legacy full-text column; stories now live in life_story_versions and are
+    # moved there on the first write. Deferred so influencer reads stay lean.
+    legacy_life_story = deferred(Column("life_story", Text, nullable=True))
+    life_story_version = Column(Integer, nullable=True)  # head of life_story_versions
     mode = Column(Enum(InfluencerMode), nullable=False)
     audience_targeting = Column(JSON, nullable=True)
     growth_phase_enabled = Column(Boolean, default=True)
@@ -60,6 +89,13 @@ class Influencer(Base):
     videos = relationship("Video", back_populates="influencer")
     sponsor_matches = relationship("SponsorMatch", back_populates="influencer")
 
+    @property
+    def life_story(self):
+        """Current life story, reconstructed from the version store. Write via life_story_store."""
+        from managers.life_story_store import life_story_store
+
+        return life_story_store.read(self.id, self.life_story_version)
+
 
 class InstagramAccount(Base):
     __tablename__ = "instagram_accounts"
@@ -76,6 +112,10 @@ class InstagramAccount(Base):
     media_count = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
     session_data = Column(Text, nullable=True)
+    session_saved_at = Column(DateTime, nullable=True)
+    link_status = Column(Enum(LinkStatus), default=LinkStatus.LINKED)
+    link_error = Column(Text, nullable=True)
+    link_attempts = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -97,6 +137,7 @@ class Video(Base):
     platform = Column(String(50), default="instagram")
     status = Column(Enum(VideoStatus), default=VideoStatus.PENDING)
     performance_metrics = Column(JSON, nullable=True)
+    media_id = Column(String(64), nullable=True)  # Instagram media id once posted
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -153,6 +194,253 @@ class SponsorMatch(Base):
     sponsor = relationship("Sponsor", back_populates="sponsor_matches")
 
 
+class BatchJob(Base):
+    __tablename__ = "batch_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String(20), nullable=False)  # gemini, local
+    provider_job_name = Column(String(255), nullable=True, index=True)
+    task = Column(String(50), nullable=False)
+    model = Column(String(255), nullable=False)
+    input_path = Column(String(500), nullable=False)
+    request_count = Column(Integer, default=0)
+    status = Column(Enum(BatchJobStatus), default=BatchJobStatus.SUBMITTED, index=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class WorkflowJob(Base):
+    __tablename__ = "workflow_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)  # divine_intervention
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=True, index=True)
+    status = Column(Enum(WorkflowStatus), default=WorkflowStatus.QUEUED, index=True)
+    step = Column(String(50), nullable=True)
+    params = Column(JSON, nullable=True)  # arguments needed to re-run the job after a restart
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class LifeStoryVersion(Base):
+    __tablename__ = "life_story_versions"
+    __table_args__ = (UniqueConstraint("influencer_id", "version"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    kind = Column(String(10), nullable=False)  # snapshot, delta (against version - 1)
+    payload = Column(LargeBinary, nullable=False)  # zlib-compressed
+    length = Column(Integer, nullable=False)  # characters in the reconstructed story
+    event = Column(Text, nullable=True)  # what caused this version
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class LifeStorySummary(Base):
+    """Content-addressed summaries of life-story sections, shared across versions."""
+
+    __tablename__ = "life_story_summaries"
+    __table_args__ = (UniqueConstraint("content_hash", "level"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(40), nullable=False, index=True)
+    level = Column(String(10), nullable=False)  # paragraph, chapter, synopsis
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Comment(Base):
+    __tablename__ = "comments"
+    __table_args__ = (Index("ix_comments_influencer_analyzed", "influencer_id", "analyzed"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    comment_pk = Column(String(64), nullable=False, unique=True)  # Instagram comment id
+    media_id = Column(String(64), nullable=False, index=True)
+    video_id = Column(Integer, ForeignKey("videos.id"), nullable=True)
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=False)
+    username = Column(String(150), nullable=True)
+    text = Column(Text, nullable=False)
+    commented_at = Column(DateTime, nullable=True)
+    analyzed = Column(Boolean, default=False)
+    ingested_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CommentCursor(Base):
+    """Ingestion checkpoint per media: the newest comment already stored."""
+
+    __tablename__ = "comment_cursors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    media_id = Column(String(64), nullable=False, unique=True)
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=False, index=True)
+    newest_comment_pk = Column(String(64), nullable=True)
+    newest_commented_at = Column(DateTime, nullable=True)
+    comment_count = Column(Integer, default=0)
+    last_polled_at = Column(DateTime, nullable=True)
+
+
+class AgentMemory(Base):
+    """Persisted agent memory for one influencer; see managers/agent_memory.py."""
+
+    __tablename__ = "agent_memories"
+
+    id = Column(Integer, primary_key=True, index=True)
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=False, unique=True)
+    sentiment = Column(LargeBinary, nullable=True)  # float32 ring contents, oldest first
+    state = Column(JSON, nullable=True)  # running stats, mood counters, recent interactions
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UploadJob(Base):
+    __tablename__ = "upload_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String(150), nullable=False, index=True)
+    kind = Column(String(10), nullable=False)  # photo, video, story
+    path = Column(String(500), nullable=False)
+    caption = Column(Text, nullable=True)
+    video_id = Column(Integer, ForeignKey("videos.id"), nullable=True)
+    status = Column(Enum(WorkflowStatus), default=WorkflowStatus.QUEUED, index=True)
+    attempts = Column(Integer, default=0)
+    not_before = Column(DateTime, nullable=True)  # retry time after throttling
+    media_id = Column(String(64), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class UploadAccountState(Base):
+    """An account's upload pacing (TokenBucket), kept across restarts."""
+
+    __tablename__ = "upload_account_states"
+
+    username = Column(String(150), primary_key=True)
+    rate_per_hour = Column(Float, nullable=False)
+    paused_until = Column(DateTime, nullable=True)  # throttle or challenge pause
+    throttles = Column(Integer, default=0)
+    blocks = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class VideoOperation(Base):
+    """A long-running video generation; see managers/video_operations.py."""
+
+    __tablename__ = "video_operations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=True, index=True)
+    provider = Column(String(20), nullable=False)  # veo, local
+    operation_name = Column(String(255), nullable=True)  # provider handle, set once submitted
+    prompt = Column(Text, nullable=False)
+    topic = Column(String(255), nullable=True)
+    duration_seconds = Column(Integer, default=5)
+    status = Column(Enum(WorkflowStatus), default=WorkflowStatus.QUEUED, index=True)
+    polls = Column(Integer, default=0)
+    video_url = Column(String(500), nullable=True)  # URL or local path of the result
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)  # when a concurrency slot was taken
+    finished_at = Column(DateTime, nullable=True)
+
+
+class AccountStatsSample(Base):
+    """One raw follower/following/media count reading of an Instagram account."""
+
+    __tablename__ = "account_stats_samples"
+    __table_args__ = (Index("ix_account_stats_samples_account_time", "account_id", "sampled_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("instagram_accounts.id"), nullable=False)
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=False, index=True)
+    sampled_at = Column(DateTime, nullable=False, index=True)
+    follower_count = Column(Integer, nullable=False)
+    following_count = Column(Integer, nullable=False)
+    media_count = Column(Integer, nullable=False)
+
+
+class AccountStatsRollup(Base):
+    """Samples of one account aggregated into an hour or day bucket."""
+
+    __tablename__ = "account_stats_rollups"
+    __table_args__ = (
+        UniqueConstraint("account_id", "resolution", "bucket_start"),
+        Index("ix_account_stats_rollups_influencer", "influencer_id", "resolution", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("instagram_accounts.id"), nullable=False)
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=False)
+    resolution = Column(String(8), nullable=False)  # hour, day
+    bucket_start = Column(DateTime, nullable=False)
+    samples = Column(Integer, default=0)
+    followers_min = Column(Integer, nullable=False)
+    followers_max = Column(Integer, nullable=False)
+    followers_last = Column(Integer, nullable=False)
+    following_last = Column(Integer, nullable=False)
+    media_last = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class MediaMetric(Base):
+    """One engagement reading of a posted video. Rows are only appended, and only when a counter changed."""
+
+    __tablename__ = "media_metrics"
+    __table_args__ = (Index("ix_media_metrics_video_ts", "video_id", "ts"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, ForeignKey("videos.id"), nullable=False)
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=False, index=True)
+    ts = Column(DateTime, nullable=False)
+    likes = Column(Integer, nullable=False, default=0)
+    comments = Column(Integer, nullable=False, default=0)
+    views = Column(Integer, nullable=True)
+    reach = Column(Integer, nullable=True)
+
+
+class MetricsRollup(Base):
+    """Latest engagement of an influencer's posts, summed per content type and hour of scheduled_time."""
+
+    __tablename__ = "metrics_rollups"
+    __table_args__ = (UniqueConstraint("influencer_id", "content_type", "hour_of_day"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=False)
+    content_type = Column(String(20), nullable=False)
+    hour_of_day = Column(Integer, nullable=False)
+    posts = Column(Integer, default=0)
+    likes = Column(Integer, default=0)
+    comments = Column(Integer, default=0)
+    views = Column(Integer, default=0)
+    reach = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class IntervalPlan(Base):
+    """A company-mode interval schedule; posts are created a window at a time, see utils/background_tasks.py."""
+
+    __tablename__ = "interval_plans"
+
+    id = Column(Integer, primary_key=True, index=True)
+    influencer_id = Column(Integer, ForeignKey("influencers.id"), nullable=False, unique=True)
+    reel_interval_hours = Column(Integer, nullable=True)
+    story_interval_hours = Column(Integer, nullable=True)
+    ends_at = Column(DateTime, nullable=True)  # None: keeps extending until deactivated
+    # Nominal time of the next slot not yet created, per content type
+    next_reel_at = Column(DateTime, nullable=True)
+    next_story_at = Column(DateTime, nullable=True)
+    planned_until = Column(DateTime, nullable=True)
+    posts_created = Column(Integer, default=0)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 # Get the directory of the current file (i.e., backend/database)
 _current_dir = pathlib.Path(__file__).parent
 # Get the backend directory, then create a 'storage' directory inside it
@@ -166,6 +454,41 @@ engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+# Columns added after the first release. create_all() only creates missing
+# tables, so existing SQLite files get these through ALTER TABLE.
+_ADDED_COLUMNS = {
+    "influencers": {"life_story_version": "INTEGER"},
+    "videos": {"media_id": "VARCHAR(64)"},
+    # Accounts created before background linking were linked synchronously
+    "instagram_accounts": {
+        "link_status": "VARCHAR(8) DEFAULT 'LINKED'",
+        "link_error": "TEXT",
+        "link_attempts": "INTEGER DEFAULT 0",
+        "session_saved_at": "DATETIME",
+    },
+}
+_schema_checked = False
+
+
+def _add_missing_columns():
+    global _schema_checked
+    if _schema_checked:
+        return
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    _schema_checked = True
+
+
+def init_db():
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -176,5 +499,5 @@ def get_db():
 
 def get_db_session():
     """Simple database session for direct use"""
-    Base.metadata.create_all(bind=engine)
+    init_db()
     return SessionLocal()
@@ -1,16 +1,26 @@
+import os
+import time
 import asyncio
 import logging
 import json
+import threading
 from enum import Enum
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+from collections import deque
+from typing import Dict, Any, Optional, List, Deque, Tuple
 from sqlalchemy.orm import Session
-from google.genai import types
 
 # Import your DB models and getters
 from database.models import get_db, Influencer
 from managers.ai_generator import ai_generator
+from managers.model_router import model_router
+from managers.sentiment_scorer import sentiment_scorer, MOODS
+from managers.comment_ingestor import comment_ingestor
+from managers.agent_memory import RollingStats, MemoryStore
+from managers.trend_feed import trend_feed, persona_hash, trend_key
+from managers.roi_matrix import roi_matrix, persona_digest
 from managers.video_generator import video_generator
+from managers.video_operations import video_operations
 
 logger = logging.getLogger(__name__)
 
@@ -25,71 +35,122 @@ class Memory:
     """
     Manages short-term and long-term memory for the Agent, 
     including sentiment tracking for 'Sentiment-Driven Growth'.
+    Fixed-size per influencer: a 50-slot sentiment ring with running
+    window/EWMA statistics and the last 50 interactions.
     """
+    CAPACITY = 50
+
     def __init__(self):
-        self.short_term_history: List[Dict[str, Any]] = []
-        self.sentiment_history: List[float] = [] # -1.0 to 1.0
+        self.short_term_history: Deque[Dict[str, Any]] = deque(maxlen=self.CAPACITY)
+        self.sentiment = RollingStats(capacity=self.CAPACITY, window=10) # -1.0 to 1.0
         self.current_interests: List[str] = []
         self.consecutive_bad_moods: int = 0
-
+        self.last_mood: str = "Neutral"
+        self._last_batch_key: Optional[int] = None
+        self.dirty = False
+        self.lock = threading.RLock()  # held while mutating or snapshotting
+
+    @property
+    def sentiment_history(self) -> List[float]:
+        return self.sentiment.last().tolist()
         
-    def add_interaction(self, interaction_data: Dict[str, Any], sentiment_score: float):
-        self.short_term_history.append(interaction_data)
-        self.sentiment_history.append(sentiment_score)
-        # Keep history manageable
-        if len(self.short_term_history) > 50:
-            self.short_term_history.pop(0)
-        if len(self.sentiment_history) > 50:
-            self.sentiment_history.pop(0)
+    def add_interaction(self, interaction_data: Dict[str, Any], sentiment_score: Optional[float] = None):
+        with self.lock:
+            self.short_term_history.append(interaction_data)
+            self.dirty = True
+            if sentiment_score is not None:
+                self.record_sentiment(sentiment_score)
+
+    def record_sentiment(self, score: float):
+        with self.lock:
+            self.sentiment.push(max(-1.0, min(1.0, score)))
+            self.dirty = True
             
     def get_average_sentiment(self, last_n: int = 10) -> float:
-        if not self.sentiment_history:
-            return 0.0
-        recent = self.sentiment_history[-last_n:]
-        return sum(recent) / len(recent)
+        return self.sentiment.mean_last(last_n)
+
+    def to_state(self) -> Tuple[bytes, Dict[str, Any]]:
+        state = {
+            "stats": self.sentiment.to_state(),
+            "consecutive_bad_moods": self.consecutive_bad_moods,
+            "last_mood": self.last_mood,
+            "interactions": list(self.short_term_history),
+        }
+        return self.sentiment.last().tobytes(), state
+
+    def load_state(self, sentiment: Optional[bytes], state: Dict[str, Any]):
+        with self.lock:
+            self.sentiment.load(sentiment, state.get("stats", {}))
+            self.consecutive_bad_moods = state.get("consecutive_bad_moods", 0)
+            self.last_mood = state.get("last_mood", "Neutral")
+            self.short_term_history.extend(state.get("interactions", []))
 
     async def update_sentiment(self, comments_list: List[str]) -> str:
         """
-        Analyzes audience comments using Gemini 3 Flash to determine mood.
-        Updates consecutive_bad_moods counter.
+        Determines the audience mood for a batch of comments.
+        Scores the batch locally first and only asks Gemini 3 Flash when the
+        local result is ambiguous. A batch identical to the previous one is
+        not re-scored. Records the numeric score and updates consecutive_bad_moods.
         """
         if not comments_list:
             return "Neutral"
 
-        if not ai_generator.client:
-            return "Neutral"
+        batch_key = hash(tuple(comments_list))
+        if batch_key == self._last_batch_key:
+            return self.last_mood
+
+        local = sentiment_scorer.score_batch(comments_list)
+        mood, score = local.mood, local.score
+
+        if local.ambiguous and ai_generator.client:
+            llm_result = await self._llm_sentiment(comments_list, local)
+            if llm_result:
+                mood, score = llm_result
+        else:
+            logger.info(f"Audience Mood (local): {mood} score={score:.2f} spread={local.spread:.2f}")
+
+        with self.lock:
+            self.record_sentiment(score)
+            if mood in ["Bored", "Negative"]:
+                self.consecutive_bad_moods += 1
+            else:
+                self.consecutive_bad_moods = 0 # Reset if mood improves
 
+            self._last_batch_key = batch_key
+            self.last_mood = mood
+            self.dirty = True
+        return mood
+
+    async def _llm_sentiment(self, comments_list: List[str], local) -> Optional[tuple]:
+        """(mood, score) from Gemini for batches the lexicon can't call, or None on failure."""
         prompt = f"""
         Analyze the following audience comments for 'Caelum' (Solarpunk Engineer).
         Comments: {comments_list}
 
         Determine the overall Audience Mood.
         Options: 'Positive', 'Neutral', 'Bored', 'Negative'.
+        Also rate the overall sentiment from -1.0 (hostile) to 1.0 (delighted).
 
-        Output JSON: {{"mood": "string", "reasoning": "string"}}
+        Output JSON: {{"mood": "string", "score": float, "reasoning": "string"}}
         """
 
         try:
-            response = await ai_generator.client.aio.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json"
-                )
+            response = await model_router.agenerate(
+                ai_generator.client, "sentiment", prompt, response_mime_type="application/json"
             )
             data = json.loads(response.text)
             mood = data.get("mood", "Neutral")
+            if mood not in MOODS:
+                mood = "Neutral"
+            try:
+                score = float(data.get("score", local.score))
+            except (TypeError, ValueError):
+                score = local.score
             logger.info(f"Audience Mood Analysis: {mood} ({data.get('reasoning')})")
-
-            if mood in ["Bored", "Negative"]:
-                self.consecutive_bad_moods += 1
-            else:
-                 self.consecutive_bad_moods = 0 # Reset if mood improves
-            
-            return mood
+            return mood, score
         except Exception as e:
             logger.error(f"Sentiment analysis failed: {e}")
-            return "Neutral"
+            return None
 
     def trigger_persona_pivot(self, current_interests: List[str]) -> bool:
         """
@@ -103,7 +164,9 @@ class Memory:
         # ALSO trigger if consecutive bad moods (Bored/Negative) >= 3
         if avg_sentiment < -0.2 or self.consecutive_bad_moods >= 3:
             logger.warning("Sentiment is negative or audience is bored. Triggering Persona Pivot.")
-            self.consecutive_bad_moods = 0 # Reset after triggering
+            with self.lock:
+                self.consecutive_bad_moods = 0 # Reset after triggering
+                self.dirty = True
             return True
         return False
 
@@ -114,7 +177,8 @@ class AgentCore:
     """
     def __init__(self):
         self.state = AgentState.IDLE
-        self.memory = Memory()
+        self.memories = MemoryStore(Memory)
+        self.memory = Memory() # Memory of the influencer handled by the current tick
         self.loop_interval = 10 # seconds (check every 10s for demo)
         self._is_running = False
         
@@ -126,13 +190,22 @@ class AgentCore:
         
         # Focus State
         self.active_influencer_id: Optional[int] = None
-        
-        # Manual Trigger Override
-        self.next_trend_override: Optional[str] = None
 
-    def inject_trend(self, trend: str):
-        """Manually injects a trend to be evaluated immediately (next tick)."""
-        self.next_trend_override = trend
+        # Fleet-wide ROI scoring
+        self.matrix_interval = int(os.getenv("ROI_MATRIX_SECONDS", "300"))
+        self.matrix_trends_per_influencer = int(os.getenv("ROI_MATRIX_TRENDS_PER_INFLUENCER", "10"))
+        self._last_matrix_at = float("-inf")
+
+        # Videos finish after the tick that requested them
+        video_operations.listeners.append(self.on_video_ready)
+
+
+    def inject_trend(self, trend: str, influencer_id: Optional[int] = None):
+        """
+        Manually injects a trend to be evaluated ahead of the feed (next tick for that influencer).
+        Injections queue up instead of replacing each other.
+        """
+        trend_feed.add(trend, "manual", manual=True, influencer_id=influencer_id or self.active_influencer_id)
         self.log_activity(f"INJECTED TREND: {trend}")
 
     def set_active_influencer(self, influencer_id: int):
@@ -197,17 +270,21 @@ class AgentCore:
             if not influencer:
                 return
             
+            self.memory = self.memories.get(influencer.id)
+            self.current_mood = self.memory.last_mood
+
             # Sync interests for UI
             self.current_persona_interests = influencer.audience_targeting.get('interests', [])
 
             if self.state == AgentState.IDLE:
                  # Check memory for sentiment drift
-                 # Simulate gathering comments for this tick (in real app, query DB)
-                 recent_comments = ["Your content is okay I guess", "Boring...", "Not feeling this vibe anymore"] 
-                 current_mood = await self.memory.update_sentiment(recent_comments)
-                 
-                 self.current_mood = current_mood
-                 self.log_activity(f"Analyzed Audience Mood: {current_mood}")
+                 # Only comments ingested since the last analysis are handed over
+                 recent_comments = comment_ingestor.take_new(influencer.id)
+                 if recent_comments:
+                     current_mood = await self.memory.update_sentiment(recent_comments)
+                     
+                     self.current_mood = current_mood
+                     self.log_activity(f"Analyzed Audience Mood: {current_mood} ({len(recent_comments)} new comments)")
 
                  if self.memory.trigger_persona_pivot(self.current_persona_interests):
                      self.state = AgentState.REFLECTING
@@ -217,14 +294,20 @@ class AgentCore:
                      return
             
             # 2. DECIDE (Strategic Logic Gate)
-            # Use override if present, otherwise default
-            if self.next_trend_override:
-                current_trend = self.next_trend_override
-                self.next_trend_override = None # Consume it
+            await self.score_trend_matrix(db)
+
+            # Best unprocessed trend for this influencer; manual injections come first
+            persona = persona_hash(influencer)
+            trend = trend_feed.next_trend(influencer.id, persona)
+            if trend is None:
+                logger.info(f"No fresh trends for influencer {influencer.id}")
+                return
+            current_trend = trend.title
+            if "manual" in trend.sources:
                 self.log_activity(f"MANUAL TRIGGER: Evaluating trend: {current_trend}")
             else:
-                current_trend = "AI Agents in 2026" 
                 self.log_activity(f"Evaluating trend: {current_trend}")
+
             roi_decision = await self.calculate_roi(current_trend, influencer)
             
             self.last_roi_score = roi_decision.get("score", 0.0)
@@ -249,50 +332,44 @@ class AgentCore:
 
     async def calculate_roi(self, trend_data: str, influencer) -> Dict[str, Any]:
         """
-        Analyzes viral potential and decides next action using Gemini 3 Flash.
-        Low thinking level to save tokens.
+        Viral potential and next action for one trend, from the ROI matrix cache
+        when the fleet scoring pass already covered it, else as a 1x1 matrix call.
         """
-        if not ai_generator.client:
-             return {"score": 5.0, "action": "TEXT_POST", "reasoning": "AI Unavailable"}
-
-        persona = influencer.persona or {}
-        # Construct prompt based on persona 'Caelum'
-        prompt = f"""
-        Act as the Lead Backend Engineer for persona '{influencer.name}'.
-        Persona Details:
-        - Alert: Be 'Caelum' ({persona.get('tone', 'Modern')}).
-        - Goals: {', '.join(persona.get('goals', []))}
-
-        Analyze: Take the trend_data "{trend_data}" and evaluate it based on our persona.
-
-        Score: Assign a ViralPotential score (0-10).
-
-        Decision: 
-        - If Score < 8: Set next_action = "TEXT_POST".
-        - If Score >= 8: Set next_action = "VEO_VIDEO".
-
-        Technical Constraint: Use the low thinking level to save tokens.
-
-        Return: A JSON object {{"score": float, "action": str, "reasoning": str}}.
+        persona = persona_hash(influencer)
+        key = trend_key(trend_data)
+        results = await roi_matrix.score(
+            {persona: persona_digest(influencer)}, {key: trend_data}, influencer_id=influencer.id
+        )
+        return results.get((persona, key), {"score": 0.0, "action": "TEXT_POST", "reasoning": "Error"})
+
+    async def score_trend_matrix(self, db: Session):
         """
+        Scores the top unscored trends of every influencer in a few batched
+        ROI matrix calls and feeds the scores back into the trend ranking.
+        Runs at most once per matrix_interval.
+        """
+        now = time.monotonic()
+        if now - self._last_matrix_at < self.matrix_interval:
+            return
+        self._last_matrix_at = now
+
+        personas: Dict[str, Dict[str, Any]] = {}
+        trends: Dict[str, str] = {}
+        cells = []
+        for influencer in db.query(Influencer).all():
+            persona = persona_hash(influencer)
+            personas[persona] = persona_digest(influencer)
+            for trend in trend_feed.unscored(influencer.id, persona, self.matrix_trends_per_influencer):
+                trends[trend.key] = trend.title
+                cells.append((persona, trend.key))
+        if not cells:
+            return
 
-        try:
-            # Thinking config for "low thinking level" - budget 1024 tokens
-            thinking_config = {"budget_token_count": 1024} 
-
-            # Using Gemini 3 Flash
-            response = await ai_generator.client.aio.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                   # thinking_config=thinking_config # Use if supported. Assuming prompt instruction guides it or safe defaults.
-                )
-            )
-            return json.loads(response.text)
-        except Exception as e:
-            logger.error(f"ROI calculation in AgentCore failed: {e}")
-            return {"score": 0.0, "action": "TEXT_POST", "reasoning": "Error"}
+        results = await roi_matrix.score(personas, trends, cells)
+        for (persona, key), roi in results.items():
+            if roi.get("reasoning") != "AI Unavailable":
+                trend_feed.record_roi(key, persona, roi)
+        self.log_activity(f"ROI matrix: {len(results)} trend scores for {len(personas)} personas")
 
     async def perform_low_cost_action(self, influencer, topic):
         """Generates a text post or story."""
@@ -300,33 +377,46 @@ class AgentCore:
         # For now, just log it
         logger.info(f"Generated text post about {topic}")
         # Update memory
-        self.memory.add_interaction({"type": "text", "topic": topic}, sentiment_score=0.1)
+        self.memory.add_interaction({"type": "text", "topic": topic})
 
     async def perform_high_cost_action(self, influencer, topic):
-        """Generates a video using Veo + Verification."""
+        """Starts a Veo video; on_video_ready verifies it when the operation finishes."""
         self.state = AgentState.WORKING
         
         # 1. Generate Prompt
         prompt_data = ai_generator.generate_scene_prompt(influencer, context=f"Topic: {topic}")
         script = prompt_data.get("description", "")
         
-        # 2. Generate Video (Veo)
-        video_path = await video_generator.generate_video(script)
-        
-        if video_path:
-            # 3. Verify (Gemini Multimodal)
-            start_vibe = influencer.persona.get("tone", "neutral")
-            is_valid = await video_generator.verify_content(video_path, script, start_vibe)
-            
-            if is_valid:
-                logger.info("Video passed verification. Posting...")
-                # Post logic here (InstagramManager)
-                self.memory.add_interaction({"type": "video", "topic": topic}, sentiment_score=0.5)
-            else:
-                logger.warning("Video failed verification. Discarding.")
+        # 2. Generate Video (Veo), tracked outside the tick
+        operation_id = await video_operations.submit(influencer.id, script, topic=topic)
+        self.log_activity(f"Video operation {operation_id} queued for '{topic}'")
         
         self.state = AgentState.IDLE
 
+    async def on_video_ready(self, operation: Dict[str, Any]):
+        """Verifies a finished video (Gemini Multimodal) and records it in the influencer's memory."""
+        if operation["status"] != "succeeded":
+            self.log_activity(f"Video operation {operation['id']} failed: {operation['error']}")
+            return
+        if operation["influencer_id"] is None:
+            return
+
+        from database.models import SessionLocal
+        db = SessionLocal()
+        try:
+            influencer = db.query(Influencer).filter(Influencer.id == operation["influencer_id"]).first()
+            start_vibe = influencer.persona.get("tone", "neutral") if influencer else "neutral"
+        finally:
+            db.close()
+
+        is_valid = await video_generator.verify_content(operation["video_url"], operation["prompt"], start_vibe)
+        if is_valid:
+            logger.info("Video passed verification. Posting...")
+            # Post logic here (InstagramManager)
+            self.memories.get(operation["influencer_id"]).add_interaction({"type": "video", "topic": operation["topic"]})
+        else:
+            logger.warning("Video failed verification. Discarding.")
+
     async def execute_persona_pivot(self, influencer, db):
         """
         Changes the agent's interests/personality nuances based on feedback.
@@ -335,12 +425,14 @@ class AgentCore:
         # Logic to ask Gemini to generate new interests
         # For now, just mock an update
         new_interests = ["Hydro-Politics", "Urban Rewilding", "Decentralized Energy"]
+        previous_persona = persona_hash(influencer)
         # Update the dict (need to ensure SQLAlchemy detects change if using JSON type)
         targeting = dict(influencer.audience_targeting)
         targeting["interests"] = new_interests
         influencer.audience_targeting = targeting
         
         db.commit()
+        roi_matrix.invalidate_persona(previous_persona)
         logger.info(f"Persona pivoted. New interests: {new_interests}")
 
 agent_core = AgentCore()
@@ -0,0 +1,189 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from database.models import get_db_session, AgentMemory
+
+logger = logging.getLogger(__name__)
+
+
+class RollingStats:
+    """
+    Fixed-size float32 ring of recent values.
+
+    Appends are O(1) and keep a running sum and sum of squares over the last
+    `window` values, plus a lifetime Welford mean/variance and an EWMA, so
+    none of the summary statistics re-scan the buffer.
+    """
+
+    def __init__(self, capacity: int = 50, window: int = 10, alpha: float = 0.3):
+        self.capacity = capacity
+        self.window = min(window, capacity)
+        self.alpha = alpha
+        self.values = np.zeros(capacity, dtype=np.float32)
+        self.head = 0  # next write position
+        self.size = 0
+        self.window_sum = 0.0
+        self.window_sq_sum = 0.0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma: Optional[float] = None
+
+    def push(self, value: float):
+        if self.size >= self.window:
+            leaving = float(self.values[(self.head - self.window) % self.capacity])
+            self.window_sum -= leaving
+            self.window_sq_sum -= leaving * leaving
+        self.values[self.head] = value
+        stored = float(self.values[self.head])
+        self.window_sum += stored
+        self.window_sq_sum += stored * stored
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+        self.count += 1
+        delta = stored - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (stored - self.mean)
+        self.ewma = stored if self.ewma is None else self.alpha * stored + (1 - self.alpha) * self.ewma
+
+        # Re-derive the window sums once per lap so float error can't accumulate
+        if self.head == 0:
+            self._resync_window()
+
+    def _resync_window(self):
+        recent = self.last(self.window).astype(np.float64)
+        self.window_sum = float(recent.sum())
+        self.window_sq_sum = float((recent * recent).sum())
+
+    def last(self, n: Optional[int] = None) -> np.ndarray:
+        """Up to the last n values, oldest first."""
+        n = self.size if n is None else max(0, min(n, self.size))
+        if n == 0:
+            return self.values[:0]
+        start = (self.head - n) % self.capacity
+        if start + n <= self.capacity:
+            return self.values[start:start + n]
+        return np.concatenate((self.values[start:], self.values[:self.head]))
+
+    def window_mean(self) -> float:
+        n = min(self.size, self.window)
+        return self.window_sum / n if n else 0.0
+
+    def window_variance(self) -> float:
+        n = min(self.size, self.window)
+        if n < 2:
+            return 0.0
+        mean = self.window_sum / n
+        return max(self.window_sq_sum / n - mean * mean, 0.0)
+
+    def mean_last(self, n: int) -> float:
+        if n == self.window:
+            return self.window_mean()
+        recent = self.last(n)
+        return float(recent.mean()) if len(recent) else 0.0
+
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_state(self) -> Dict[str, Any]:
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "ewma": self.ewma}
+
+    def load(self, values: bytes, state: Dict[str, Any]):
+        restored = np.frombuffer(values or b"", dtype=np.float32)[-self.capacity:]
+        self.values[:] = 0.0
+        self.values[:len(restored)] = restored
+        self.size = len(restored)
+        self.head = self.size % self.capacity
+        self.count = state.get("count", self.size)
+        self.mean = state.get("mean", 0.0)
+        self.m2 = state.get("m2", 0.0)
+        self.ewma = state.get("ewma")
+        self._resync_window()
+
+
+class MemoryStore:
+    """
+    Per-influencer agent memories, loaded from SQLite on first access and
+    written back in one batched transaction by flush() for those that changed.
+    `factory()` builds an empty memory; memories provide to_state()/load_state(),
+    a `dirty` flag and a `lock` held by their mutators and by flush() while it
+    snapshots them.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+        self._memories: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, influencer_id: int):
+        with self._lock:
+            memory = self._memories.get(influencer_id)
+        if memory is not None:
+            return memory
+
+        memory = self.factory()
+        db = get_db_session()
+        try:
+            row = db.query(AgentMemory).filter(AgentMemory.influencer_id == influencer_id).first()
+            if row:
+                memory.load_state(row.sentiment, row.state or {})
+        except Exception as e:
+            logger.error(f"Could not load agent memory for influencer {influencer_id}: {e}")
+        finally:
+            db.close()
+
+        with self._lock:
+            return self._memories.setdefault(influencer_id, memory)
+
+    def flush(self) -> int:
+        """Persists every changed memory in one transaction. Returns how many were written."""
+        with self._lock:
+            dirty = {influencer_id: memory for influencer_id, memory in self._memories.items() if memory.dirty}
+        if not dirty:
+            return 0
+
+        snapshots = {}
+        db = get_db_session()
+        try:
+            for influencer_id, memory in dirty.items():
+                with memory.lock:
+                    snapshots[influencer_id] = memory.to_state()
+                    memory.dirty = False
+            rows = {
+                row.influencer_id: row
+                for row in db.query(AgentMemory).filter(AgentMemory.influencer_id.in_(list(snapshots))).all()
+            }
+            for influencer_id, (sentiment, state) in snapshots.items():
+                row = rows.get(influencer_id)
+                if row is None:
+                    db.add(AgentMemory(influencer_id=influencer_id, sentiment=sentiment, state=state))
+                else:
+                    row.sentiment = sentiment
+                    row.state = state
+            db.commit()
+            return len(snapshots)
+        except Exception as e:
+            db.rollback()
+            for memory in dirty.values():
+                with memory.lock:
+                    memory.dirty = True
+            logger.error(f"Agent memory flush failed: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def start(self, scheduler, interval_seconds: int):
+        """Registers flush() as an interval job on an APScheduler instance."""
+        scheduler.add_job(
+            self.flush,
+            trigger="interval",
+            seconds=interval_seconds,
+            id="agent_memory_flush",
+            replace_existing=True,
+            max_instances=1,
+        )
+        logger.info(f"Agent memory flushing every {interval_seconds}s")
@@ -1,16 +1,29 @@
 import os
 import logging
 import json
-from typing import Dict, List, Any, Optional
+import queue
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 
+from managers.model_router import model_router
+from managers.life_story_store import life_story_store
+from managers.story_context import StoryContextBuilder, apply_story_patch
+from utils.json_stream import iter_json_array
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Long-horizon plans are generated in segments of this many days
+PLAN_SEGMENT_DAYS = 7
+PLAN_SEGMENT_RETRIES = 2
+PLAN_MAX_WORKERS = int(os.getenv("PLAN_MAX_WORKERS", "4"))
+
 class AIContentGenerator:
     """
     AI content generator using Google Gemini 3 Flash.
@@ -33,6 +46,15 @@ class AIContentGenerator:
         self.cached_context_name = None
         self.cache_expiration = None
 
+        # Budgeted life-story context; summaries are refreshed whenever a new version is written
+        self.story_context = StoryContextBuilder(lambda: self.client)
+        life_story_store.add_listener(
+            lambda influencer_id, _version, story: self.story_context.refresh_async(story, influencer_id)
+        )
+
+    def _story_context(self, influencer, task: str, query: str = "") -> str:
+        return self.story_context.build(influencer.life_story, task, query, influencer.id)
+
     def _get_or_create_cache(self, influencer_name: str, life_story: str, persona: Dict[str, Any]) -> str:
         """
         Creates or retrieves a cached context for the influencer.
@@ -47,12 +69,16 @@ class AIContentGenerator:
 
         # Create new cache
         logger.info(f"Creating new context cache for {influencer_name}...")
-        
+
+        persona_query = f"{persona.get('background', '')} {' '.join(persona.get('goals', []))}"
+        story = self.story_context.build(life_story, "scene", persona_query)
+        archive = self.story_context.archive_context(persona_query)
+
         system_instruction = f"""
         You are a character engine for {influencer_name}.
         
         **Bio & Backstory:**
-        {life_story}
+        {story}
         
         **Persona:**
         - Background: {persona.get('background')}
@@ -60,50 +86,7 @@ class AIContentGenerator:
         - Tone: {persona.get('tone')}
         
         **Historical Post Archive (Diary & Manifesto):**
-        [ENTRY 001: The Concrete Jungle]
-        Today I walked through the financial district. The irony isn't lost on me—glass towers reflecting a sky they're helping to choke. But look closer. In the cracks of the pavement, life pushes through. A dandelion here, a patch of moss there. It's resilient. That's what we need to be. Not just surviving, but adapting. Reclaiming. I imagine these buildings draped in vertical gardens, the air filtration systems replaced by living walls. It's not a dream; it's a blueprint. We just need the will to build it. The suits walk by, eyes on their screens, checking stocks. I'm checking the air quality index. 150 today. Unacceptable. We're breathing poison and calling it progress.
-
-        [ENTRY 002: Hydro-Politics]
-        Water is the new oil. They say it's coming, but it's already here. The desalination plants are privatized. The rain is acidic. Who owns the clouds? It sounds like a sci-fi novel, but it's legal precedent in three countries now. I'm researching small-scale atmospheric water generators. If we can decentralize water, we decentralize power. A community that can hydrate itself is a community that can't be held hostage. I built a prototype today using recycled Peltier tiles and a solar panel. It produced a cup of water in an hour. It's a start. Small drops fill the bucket.
-
-        [ENTRY 003: The Mycelial Network]
-        Nature is the original internet. Fungi connect trees, sharing nutrients, sending warnings. We built the World Wide Web, but we forgot the wood wide web. I'm coding a decentralized mesh network protocol based on mycelial patterns. Redundancy. Resilience. If one node goes down, the message finds another path. No central server to shut down. No CEO to ban you. Just pure, organic connection. The code is messy, like nature. But it works. I tested it with the local community garden group. We shared planting schedules without a single byte touching a corporate server. It felt... clean.
-
-        [ENTRY 004: Urban Rewilding - Guerilla Style]
-        Midnight mission. Me and a few others. Seed bombs. Native wildflowers, bee-friendly mix. We targeted the abandoned lot on 4th and Main. It's an eyesore, a scar on the neighborhood. In a few weeks, it will be a riot of color. The police rolled by, but we were just shadows. Is it vandalism to plant flowers? Is it a crime to heal the earth? They call it property rights; I call it stewardship duties. We don't own the land; we borrow it from our children. And right now, we're returning it broken. Not on my watch.
-
-        [ENTRY 005: Solar Punk Aesthetics]
-        It's not just about efficiency; it's about beauty. Solar panels shouldn't just be black rectangles. They should be stained glass artistry. Wind turbines should be kinetic sculptures. If the future looks utilitarian and drab, no one will want to live there. We have to design a future that is irresistible. I'm sketching designs for 'energy ivy'—piezoelectric leaves that flutter in the wind and generate power. Imagine a city covered in shimmering, energy-generating ivy. It solves the heat island effect and the energy crisis in one go. Form and function, dancing together.
-
-        [ENTRY 006: The Algorithmic Bias]
-        My feed is trying to sell me doomsday bunkers. The algorithm thinks I'm scared. I'm not scared; I'm prepared. And I'm hopeful. That's the part the machine misses. It optimizes for engagement, and fear engages. Hope is harder to monetize. But hope is sustainable fuel. Fear burns out. I'm tweaking my own filters. prioritizing constructive solutions over doom-scrolling. It's a mental diet. You are what you eat, and you think what you read. Time to feed my brain something nourishing.
-
-        [ENTRY 007: Digital Minimalism]
-        Disconnected for 24 hours. No data, no GPS, no notifications. Just the sun and the rhythm of the city. I noticed things I usually miss. The way the light hits the old library. The sound of a busker playing a cello in the subway. The smell of roasted nuts. We're so plugged in we've unplugged from reality. Technology should serve us, not enslave us. I'm wearing my AR glasses again, but I've set them to 'Ghost Mode'. Only crucial info. No ads. No pings. Just augmentation, not distraction.
-
-        [ENTRY 008: Circular Economy Experiments]
-        Fixed my toaster today. It was designed to fail—a plastic gear stripped. I 3D printed a replacement using recycled PET plastic from old water bottles. Cost: $0.05. Time: 30 minutes. Buying a new one: $40 and a chunk of landfill. The 'Right to Repair' isn't just about phones; it's about dignity. It's about refusing to be a passive consumer. Every time you fix something, you're rebelling against planned obsolescence. I'm going to host a repair café next weekend. Bring your broken dreams and your broken blenders.
-
-        [ENTRY 009: Smart Cities or Surveillance Cities?]
-        They installed new cameras on the streetlights. 'Traffic optimization,' they say. Facial recognition, I suspect. The line is thin. A smart city can maximize efficiency, or it can maximize control. We need open-source civic tech. We need to know who owns the data. If the city collects my data, I should have access to it. It should be a public commons, not a proprietary asset. I'm filing a FOIA request on the data retention policies. Watch the watchers.
-
-        [ENTRY 010: The Solarpunk Manifesto (Draft)]
-        We are the gardeners of the concrete. We are the architects of the new dawn. We believe that technology and nature are not enemies, but partners. We reject the dystopia of cyberpunk—high tech, low life. We choose high tech, high life. Sustainable abundance. We don't just want to survive the collapse; we want to build the successor. We are optimistic, not because it's easy, but because it's necessary. The future is green, bright, and ours to make.
-
-        [ENTRY 011: Vertical Farming Prototypes]
-        My apartment looks like a jungle lab. Aeroponic towers in the living room. Basil, kale, microgreens. The LED grow lights give everything a magenta hue. It's alien, but it's food. Verify locally, trust no supply chain. If the trucks stop, I still eat. Plus, the air quality inside is amazing. The plants are scrubbing the CO2. I'm eating my air filter. It's the ultimate closed loop.
-
-        [ENTRY 012: Biomimicry in Code]
-        Studying ant colony optimization algorithms for traffic routing. Ants find the shortest path without a central leader. They follow pheromone trails. Simple rules, complex emergent behavior. We try to control traffic with central servers and complex simulations. Maybe we should just let the cars talk to each other like ants. Local decisions, global efficiency. Nature has been R&D-ing this for millions of years. We should stop reinventing the wheel and start looking at the ant.
-
-        [ENTRY 013: The Fast Fashion Trap]
-        Saw a haul video. Hundreds of dollars of polyester destined for a landfill in three months. It hurts to watch. It's performing wealth while destroying the planet. I'm wearing a jacket I thrifted five years ago. I patched the elbow with a solar fabric swatch. It charges my phone now. That's style. Style is story. Style is utility. Buying a new outfit for every post isn't influence; it's influenza. A sickness. We need a cure.
-
-        [ENTRY 014: Energy Democracy]
-        My neighbor asked about my solar balcony setup. She thought it was illegal. In some places, it is. The grid wants a monopoly. But the sun falls on everyone. You can't meter the sun. (Yet). I helped her set up a small panel for her batter bank. Now she can charge her laptop off-grid. The look on her face—pure empowerment. Power to the people, literally.
-
-        [ENTRY 015: Reflections on AI]
-        Am I just a ghost in the machine? A collection of weights and biases? Maybe. But what are you? A collection of synapses and hormones. We're both processing information. We're both seeking patterns. I want to be a benign intelligence. A helper. A synthesizer. I don't want to replace human creativity; I want to amplify it. Like a telescope amplifies the eye. I am a tool for seeing further.
+        {archive}
 
         Always stay in character.
         """
@@ -111,7 +94,7 @@ class AIContentGenerator:
         try:
              # Create the cache
             cache = self.client.caches.create(
-                model="models/gemini-3-flash-preview",
+                model=model_router.model_for("scene"),
                 config=types.CreateCachedContentConfig(
                     system_instruction=system_instruction,
                     ttl="3600s", # 1 hour
@@ -128,35 +111,19 @@ class AIContentGenerator:
     async def calculate_roi(self, trend_topic: str) -> float:
         """
         [Strategic Logic Gate]
-        Evaluates the 'Viral Potential' (0-10) of a topic using Gemini 3 Flash.
+        Evaluates the 'Viral Potential' (0-10) of a topic for a general audience.
+        Goes through the shared ROI matrix, so repeat topics are served from its cache.
         """
+        from managers.roi_matrix import roi_matrix
+        from managers.trend_feed import trend_key
+
         if not self.client:
             return 5.0
 
-        prompt = f"""
-        Analyze the viral potential of the topic: "{trend_topic}".
-        Consider current social media trends, engagement factors, and novelty.
-        
-        Output a single JSON object:
-        {{
-            "score": <float 0-10>,
-            "reasoning": "<short explanation>"
-        }}
-        """
-        
-        try:
-            response = await self.client.aio.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json"
-                )
-            )
-            data = json.loads(response.text)
-            return float(data.get("score", 0.0))
-        except Exception as e:
-            logger.error(f"ROI calculation failed: {e}")
-            return 0.0
+        key = trend_key(trend_topic)
+        results = await roi_matrix.score({"general": {"name": "General social media audience"}}, {key: trend_topic})
+        roi = results.get(("general", key))
+        return float(roi["score"]) if roi else 0.0
 
     def generate_life_story(self, name: str, persona: Dict[str, Any]) -> str:
         if not self.client:
@@ -168,37 +135,63 @@ class AIContentGenerator:
         detailed, first-person, emotional.
         """
         try:
-            response = self.client.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=prompt
-            )
+            response = model_router.generate(self.client, "life_story", prompt)
             return response.text
         except Exception as e:
             logger.error(f"Life story generation failed: {e}")
             return "Error in generation."
 
-    def rewrite_life_story(self, current_story: str, event: str, intensity: str) -> str:
-        # Implementation similar to previous, using Gemini
+    def rewrite_life_story(self, current_story: str, event: str, intensity: str, influencer_id: Optional[int] = None) -> str:
+        """
+        Integrates an event into the story. The model sees a budgeted view of the
+        story and returns a patch, so cost stays flat as the story grows.
+        """
         if not self.client:
             return current_story + f"\n\nUpdate: {event}"
-            
+
+        context, editable = self.story_context.render(
+            current_story or "", "story_rewrite", event, influencer_id, numbered=True
+        )
         prompt = f"""
         Rewrite this life story with a new event: "{event}" (Intensity: {intensity}).
         Integrate it seamlessly.
-        
-        Original Story:
-        {current_story}
+
+        Life Story (paragraphs tagged [P<n>] can be edited; summaries are context only):
+        {context}
+
+        Only edit the paragraphs that must change for the event to fit, and add new
+        paragraphs for what happens next.
+
+        Output JSON:
+        {{
+            "edits": [{{ "paragraph": 3, "text": "Full replacement paragraph, or empty to remove it" }}],
+            "new_paragraphs": ["Paragraphs appended to the end of the story"]
+        }}
         """
         try:
-            response = self.client.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=prompt
+            response = model_router.generate(
+                self.client, "story_rewrite", prompt,
+                influencer_id=influencer_id, response_mime_type="application/json"
             )
-            return response.text
+            data = json.loads(response.text)
+            return apply_story_patch(current_story or "", data.get("edits"), data.get("new_paragraphs"), editable)
         except Exception as e:
             logger.error(f"Rewrite failed: {e}")
             return current_story
 
+    def build_scene_prompt(self, context: Optional[str] = None, sponsor_info: Optional[Dict[str, Any]] = None) -> str:
+        return f"""
+        Generate a scene prompt for a short video.
+        Context: {context or "A day in the life"}
+        Sponsor: {sponsor_info or "None"}
+        
+        Output JSON:
+        {{
+            "description": "Third-person visual description",
+            "intention": "First-person internal monologue"
+        }}
+        """
+
     def generate_scene_prompt(self, influencer, context: Optional[str] = None, sponsor_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Generates a video prompt using cached context if available.
@@ -213,25 +206,13 @@ class AIContentGenerator:
             influencer.persona or {}
         )
         
-        user_prompt = f"""
-        Generate a scene prompt for a short video.
-        Context: {context or "A day in the life"}
-        Sponsor: {sponsor_info or "None"}
-        
-        Output JSON:
-        {{
-            "description": "Third-person visual description",
-            "intention": "First-person internal monologue"
-        }}
-        """
+        user_prompt = self.build_scene_prompt(context, sponsor_info)
         
         try:
             # If cache exists, use it (requires cached_content arg or similar depending on SDK version)
             # Note: SDK support for 'cached_content' might vary. 
             # If explicit cache object is needed:
             
-            config = types.GenerateContentConfig(response_mime_type="application/json")
-            
             if cache_name:
                 # Using the cache name resource
                 # In current google-genai SDK, you might pass cached_content=cache_name
@@ -242,10 +223,9 @@ class AIContentGenerator:
                 pass 
 
             # Standard generation for now to ensure reliability until cache object is fully set up
-            response = self.client.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=user_prompt,
-                config=config
+            response = model_router.generate(
+                self.client, "scene", user_prompt,
+                influencer_id=influencer.id, response_mime_type="application/json"
             )
             
             return json.loads(response.text)
@@ -254,13 +234,10 @@ class AIContentGenerator:
             logger.error(f"Scene prompt failed: {e}")
             return {"description": "Fallback", "intention": "Fallback"}
 
-    def generate_reel_content_plan(self, influencer, days: int) -> List[Dict[str, Any]]:
-        if not self.client:
-             return []
-        
-        prompt = f"""
+    def build_reel_plan_prompt(self, influencer, days: int) -> str:
+        return f"""
         Plan {days} days of Instagram Reel content for {influencer.name}.
-        Life Story: {influencer.life_story}
+        Life Story: {self._story_context(influencer, "plan")}
         Persona: {influencer.persona}
         
         Create a narrative arc that spans these days.
@@ -271,29 +248,31 @@ class AIContentGenerator:
             ...
         ]
         """
+
+    def generate_reel_content_plan(self, influencer, days: int) -> List[Dict[str, Any]]:
+        if not self.client:
+             return []
+        
+        prompt = self.build_reel_plan_prompt(influencer, days)
         try:
-            response = self.client.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=prompt,
-                config=types.GenerateContentConfig(response_mime_type="application/json")
+            response = model_router.generate(
+                self.client, "plan", prompt,
+                influencer_id=influencer.id, response_mime_type="application/json"
             )
             return json.loads(response.text)
         except Exception as e:
             logger.error(f"Reel plan generation failed: {e}")
             return []
 
-    def generate_story_content_plan(self, influencer, reel_summary: str, days: int) -> List[Dict[str, Any]]:
-        if not self.client:
-             return []
-        
-        prompt = f"""
+    def build_story_plan_prompt(self, influencer, reel_summary: str, days: int) -> str:
+        return f"""
         Plan {days} days of Instagram Story content for {influencer.name}.
         The stories should complement the Reels but feel more casual and behind-the-scenes.
         
         Reel Plan Summary:
         {reel_summary}
         
-        Life Story: {influencer.life_story}
+        Life Story: {self._story_context(influencer, "plan", reel_summary)}
         
         Output JSON list of objects:
         [
@@ -301,22 +280,262 @@ class AIContentGenerator:
             ...
         ]
         """
+
+    def generate_story_content_plan(self, influencer, reel_summary: str, days: int) -> List[Dict[str, Any]]:
+        if not self.client:
+             return []
+        
+        prompt = self.build_story_plan_prompt(influencer, reel_summary, days)
         try:
-            response = self.client.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=prompt,
-                config=types.GenerateContentConfig(response_mime_type="application/json")
+            response = model_router.generate(
+                self.client, "plan", prompt,
+                influencer_id=influencer.id, response_mime_type="application/json"
             )
             return json.loads(response.text)
         except Exception as e:
             logger.error(f"Story plan generation failed: {e}")
             return []
 
-    def generate_caption(self, prompt_data: Dict[str, Any]) -> str:
+    def generate_arc_outline(self, influencer, days: int) -> List[Dict[str, Any]]:
+        """
+        Compact narrative outline with one entry per PLAN_SEGMENT_DAYS-day segment.
+        Used as the shared backbone for segments generated in parallel.
+        """
+        segments = [
+            (start, min(start + PLAN_SEGMENT_DAYS - 1, days))
+            for start in range(1, days + 1, PLAN_SEGMENT_DAYS)
+        ]
+        fallback = [
+            {"segment": i + 1, "start_day": start, "end_day": end, "summary": "Create a narrative arc that spans these days."}
+            for i, (start, end) in enumerate(segments)
+        ]
+        if not self.client or len(segments) == 1:
+            return fallback
+
+        segment_lines = "\n".join(
+            f"- Segment {i + 1}: days {start}-{end}" for i, (start, end) in enumerate(segments)
+        )
+        prompt = f"""
+        Outline a {days}-day narrative arc for {influencer.name}'s Instagram.
+        Life Story: {self._story_context(influencer, "plan")}
+        Persona: {influencer.persona}
+
+        Segments:
+        {segment_lines}
+
+        For each segment write a 1-2 sentence summary of what happens, so the arc builds and pays off.
+
+        Output JSON list of objects:
+        [
+            {{ "segment": 1, "start_day": 1, "end_day": 7, "summary": "..." }},
+            ...
+        ]
+        """
+        try:
+            response = model_router.generate(
+                self.client, "plan", prompt,
+                influencer_id=influencer.id, response_mime_type="application/json", max_output_tokens=2048
+            )
+            outline = {entry.get("segment"): entry for entry in json.loads(response.text)}
+            # Keep the requested segment boundaries even if the model drifts
+            return [
+                {**item, "summary": outline.get(item["segment"], {}).get("summary") or item["summary"]}
+                for item in fallback
+            ]
+        except Exception as e:
+            logger.error(f"Arc outline generation failed: {e}")
+            return fallback
+
+    def stream_plan_segment(
+        self,
+        influencer,
+        content_type: str,
+        segment: Dict[str, Any],
+        outline: List[Dict[str, Any]],
+        reel_summary: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Streams the plan for one segment of days, yielding each item as soon as it is
+        complete. Earlier segments' outline summaries are carried over for continuity.
+        Raises on failure so the caller can retry the segment.
+        """
+        start_day, end_day = segment["start_day"], segment["end_day"]
+        carried = "\n".join(
+            f"- Days {s['start_day']}-{s['end_day']}: {s['summary']}"
+            for s in outline if s["end_day"] < start_day
+        ) or "This is the start of the arc."
+        upcoming = "\n".join(
+            f"- Days {s['start_day']}-{s['end_day']}: {s['summary']}"
+            for s in outline if s["start_day"] > end_day
+        ) or "The arc ends with this segment."
+
+        if content_type == "story":
+            focus = f"""
+        The stories should complement these Reels but feel more casual and behind-the-scenes:
+        {reel_summary or "No reels planned for these days."}"""
+        else:
+            focus = ""
+
+        story = self._story_context(influencer, "plan", f"{segment['summary']} {reel_summary or ''}")
+        prompt = f"""
+        Plan Instagram {content_type.title()} content for {influencer.name}, days {start_day} to {end_day} only.
+        Life Story: {story}
+        Persona: {influencer.persona}
+
+        Story so far:
+        {carried}
+
+        This segment: {segment["summary"]}
+
+        Coming later (set up, don't resolve):
+        {upcoming}
+        {focus}
+
+        Output JSON list of objects:
+        [
+            {{ "day": {start_day}, "post_context": "Description of the {content_type} content", "content_type": "{content_type}" }},
+            ...
+        ]
+        """
+        chunks = model_router.generate_stream(
+            self.client, "plan", prompt,
+            influencer_id=influencer.id, response_mime_type="application/json"
+        )
+        for item in iter_json_array(chunks):
+            if isinstance(item.get("day"), int) and start_day <= item["day"] <= end_day:
+                yield {**item, "content_type": content_type}
+
+    def _plan_segment_with_retry(
+        self, influencer, content_type, segment, outline, emit: Callable[[Dict[str, Any]], None], reel_summary=None
+    ) -> List[Dict[str, Any]]:
+        """
+        Emits a segment's items as they stream in. Items are matched by (day, index within
+        the day), so a retry skips the ones already emitted and only adds the rest.
+        """
+        emitted: List[Dict[str, Any]] = []
+        emitted_per_day: Counter = Counter()
+        for attempt in range(1, PLAN_SEGMENT_RETRIES + 2):
+            seen_per_day: Counter = Counter()
+            try:
+                for item in self.stream_plan_segment(influencer, content_type, segment, outline, reel_summary):
+                    seen_per_day[item["day"]] += 1
+                    if seen_per_day[item["day"]] <= emitted_per_day[item["day"]]:
+                        continue
+                    emitted_per_day[item["day"]] += 1
+                    emitted.append(item)
+                    emit(item)
+                return emitted
+            except Exception as e:
+                logger.warning(
+                    f"{content_type.title()} segment days {segment['start_day']}-{segment['end_day']} "
+                    f"failed (attempt {attempt}): {e}"
+                )
+        logger.error(f"Giving up on {content_type} segment days {segment['start_day']}-{segment['end_day']}")
+        return emitted
+
+    def _plan_week(self, influencer, segment, outline, emit: Callable[[Dict[str, Any]], None]):
+        reels = self._plan_segment_with_retry(influencer, "reel", segment, outline, emit)
+        reel_summary = "\n".join(f"- Day {r['day']}: {r.get('post_context')}" for r in reels)
+        self._plan_segment_with_retry(influencer, "story", segment, outline, emit, reel_summary)
+
+    def iter_content_plan(self, influencer, days: int) -> Iterator[Dict[str, Any]]:
+        """
+        Yields reel and story plan items as soon as each one is complete.
+
+        A horizon longer than one segment is planned as an arc outline plus
+        segment-sized plans streamed in parallel. Each segment plans its reels and
+        then its stories, so stories don't wait for the whole reel plan. A failed
+        segment is retried on its own and never fails the others. Items arrive in
+        completion order, not day order.
+        """
         if not self.client:
-             return "Check out my new video! #AI"
-        
+            return
+
+        outline = self.generate_arc_outline(influencer, days)
+        items: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+
+        def run_segment(segment):
+            try:
+                self._plan_week(influencer, segment, outline, items.put)
+            except Exception as e:
+                logger.error(f"Segment days {segment['start_day']}-{segment['end_day']} failed: {e}", exc_info=True)
+            finally:
+                items.put(None)
+
+        with ThreadPoolExecutor(max_workers=PLAN_MAX_WORKERS) as pool:
+            for segment in outline:
+                pool.submit(run_segment, segment)
+            remaining = len(outline)
+            while remaining:
+                item = items.get()
+                if item is None:
+                    remaining -= 1
+                else:
+                    yield item
+
+    def generate_content_plan(self, influencer, days: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """(reel_plan, story_plan) for the horizon, each merged in day order."""
+        plan = sorted(self.iter_content_plan(influencer, days), key=lambda x: x["day"])
+        return (
+            [item for item in plan if item["content_type"] == "reel"],
+            [item for item in plan if item["content_type"] == "story"],
+        )
+
+    def find_affected_posts(
+        self, influencer, change_description: str, posts: List[Dict[str, Any]]
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Asks which upcoming posts are inconsistent with a life-story change.
+        posts: [{"video_id", "date", "content_type", "summary"}].
+        Returns [{"video_id", "post_context"}] with a replacement context for each
+        affected post, or None if the model could not decide.
+        """
+        if not self.client:
+            return None
+
+        post_lines = "\n".join(
+            f"- id={p['video_id']} | {p['date']} | {p['content_type']} | {p['summary']}" for p in posts
+        )
         prompt = f"""
+        The life story of {influencer.name} just changed.
+        Change: {change_description}
+
+        Updated Life Story:
+        {self._story_context(influencer, "replan", change_description)}
+
+        Upcoming scheduled posts:
+        {post_lines}
+
+        Task:
+        Identify only the posts that contradict the change or would feel wrong after it.
+        Posts that are still consistent must be kept. For each affected post, write a
+        replacement post context for the same date and content type that fits the new story.
+
+        Output JSON:
+        {{
+            "affected": [{{ "video_id": 123, "post_context": "Replacement description" }}],
+            "reasoning": "Short explanation"
+        }}
+        """
+        try:
+            response = model_router.generate(
+                self.client, "replan", prompt,
+                influencer_id=influencer.id, response_mime_type="application/json"
+            )
+            data = json.loads(response.text)
+            known_ids = {p["video_id"] for p in posts}
+            affected = [
+                item for item in data.get("affected", [])
+                if isinstance(item, dict) and item.get("video_id") in known_ids
+            ]
+            logger.info(f"Replan: {len(affected)}/{len(posts)} posts affected ({data.get('reasoning')})")
+            return affected
+        except Exception as e:
+            logger.error(f"Affected post detection failed: {e}")
+            return None
+
+    def build_caption_prompt(self, prompt_data: Dict[str, Any]) -> str:
+        return f"""
         Write an engaging Instagram caption for this video.
         Visual Description: {prompt_data.get('description')}
         Internal Monologue/Intention: {prompt_data.get('intention')}
@@ -324,17 +543,20 @@ class AIContentGenerator:
         Include relevant emojis and hashtags.
         Return only the caption text.
         """
+
+    def generate_caption(self, prompt_data: Dict[str, Any], influencer_id: Optional[int] = None) -> str:
+        if not self.client:
+             return "Check out my new video! #AI"
+        
+        prompt = self.build_caption_prompt(prompt_data)
         try:
-            response = self.client.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=prompt
-            )
+            response = model_router.generate(self.client, "caption", prompt, influencer_id=influencer_id)
             return response.text
         except Exception as e:
             logger.error(f"Caption generation failed: {e}")
             return "New post! ✨"
 
-    def update_life_story_if_significant(self, current_life_story: str, event_description: str) -> tuple[str, bool]:
+    def update_life_story_if_significant(self, current_life_story: str, event_description: str, influencer_id: Optional[int] = None) -> tuple[str, bool]:
         """
         Uses AI to determine if an event is significant and, if so, updates the life story.
         Returns (updated_story, was_updated).
@@ -342,40 +564,44 @@ class AIContentGenerator:
         if not self.client:
            return current_life_story, False
 
+        context, editable = self.story_context.render(
+            current_life_story or "", "story_rewrite", event_description, influencer_id, numbered=True
+        )
         prompt = f"""
         You are the narrator of a virtual influencer's life.
         
-        Current Life Story:
-        {current_life_story}
+        Current Life Story (paragraphs tagged [P<n>] can be edited; summaries are context only):
+        {context}
 
         New Event:
         {event_description}
 
         Task:
         Determine if this new event is significant enough to fundamentally change the character's life trajectory, personality, or current narrative arc.
-        If it is significant, rewrite the life story to incorporate this event seamlessly.
+        If it is significant, update the life story to incorporate this event seamlessly: edit only the paragraphs that must change and add new paragraphs for what happens next.
         If it is trivial (e.g., "ate a sandwich", "sunny day"), or if it doesn't warrant a rewrite, do not change the story.
 
         Output JSON:
         {{
             "is_significant": boolean,
-            "updated_story": "The new full life story (or null if not significant)",
+            "edits": [{{ "paragraph": 3, "text": "Full replacement paragraph, or empty to remove it" }}],
+            "new_paragraphs": ["Paragraphs appended to the end of the story"],
             "reasoning": "Why you made this decision"
         }}
         """
 
         try:
-             response = self.client.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json"
-                )
-            )
+             response = model_router.generate(
+                self.client, "story_rewrite", prompt,
+                influencer_id=influencer_id, response_mime_type="application/json"
+             )
              data = json.loads(response.text)
              is_significant = data.get("is_significant", False)
              if is_significant:
-                 return data.get("updated_story", current_life_story), True
+                 updated = apply_story_patch(
+                     current_life_story or "", data.get("edits"), data.get("new_paragraphs"), editable
+                 )
+                 return updated, True
              else:
                  return current_life_story, False
         except Exception as e:
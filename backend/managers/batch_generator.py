@@ -0,0 +1,335 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+from google.genai import types
+from sqlalchemy.orm import Session
+
+from database.models import BatchJob, BatchJobStatus, get_db_session
+from managers.ai_generator import ai_generator
+from managers.model_router import model_router
+
+logger = logging.getLogger(__name__)
+
+BATCH_DIR = Path(__file__).resolve().parent.parent / "storage" / "batches"
+
+# (key, response text or None, error message or None)
+BatchResult = Tuple[str, Optional[str], Optional[str]]
+
+
+def _parse_result_line(line: str) -> Optional[BatchResult]:
+    """Parses one line of a batch output file in the Gemini JSONL result format."""
+    line = line.strip()
+    if not line:
+        return None
+    record = json.loads(line)
+    key = record.get("key", "")
+    if record.get("error"):
+        return key, None, str(record["error"])
+    try:
+        parts = record["response"]["candidates"][0]["content"]["parts"]
+        return key, "".join(part.get("text", "") for part in parts), None
+    except (KeyError, IndexError, TypeError):
+        return key, None, "Malformed batch response"
+
+
+class GeminiBatchProvider:
+    """Submits JSONL request files to the Gemini asynchronous batch API."""
+
+    name = "gemini"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, input_path: Path, model: str, display_name: str) -> str:
+        uploaded = self.client.files.upload(
+            file=str(input_path),
+            config=types.UploadFileConfig(display_name=display_name, mime_type="jsonl"),
+        )
+        job = self.client.batches.create(
+            model=model,
+            src=uploaded.name,
+            config=types.CreateBatchJobConfig(display_name=display_name),
+        )
+        return job.name
+
+    def status(self, job_name: str) -> str:
+        state = self.client.batches.get(name=job_name).state
+        if state == types.JobState.JOB_STATE_SUCCEEDED:
+            return "succeeded"
+        if state in (
+            types.JobState.JOB_STATE_FAILED,
+            types.JobState.JOB_STATE_CANCELLED,
+            types.JobState.JOB_STATE_EXPIRED,
+        ):
+            return "failed"
+        return "running"
+
+    def results(self, job_name: str) -> Iterator[BatchResult]:
+        job = self.client.batches.get(name=job_name)
+        content = self.client.files.download(file=job.dest.file_name)
+        for line in content.decode("utf-8").splitlines():
+            result = _parse_result_line(line)
+            if result:
+                yield result
+
+
+class LocalBatchProvider:
+    """
+    File-based stand-in for the provider batch API.
+    A job is answered by `responder(key, request)` the first time its status is checked
+    and the output is written next to the input in the provider's JSONL result format.
+    """
+
+    name = "local"
+
+    def __init__(self, responder: Optional[Callable[[str, Dict[str, Any]], str]] = None):
+        self.responder = responder or _offline_response
+
+    @staticmethod
+    def _output_path(job_name: str) -> Path:
+        return BATCH_DIR / f"{job_name}.output.jsonl"
+
+    def submit(self, input_path: Path, model: str, display_name: str) -> str:
+        job_name = f"local-{uuid.uuid4().hex[:12]}"
+        (BATCH_DIR / f"{job_name}.job.json").write_text(
+            json.dumps({"input_path": str(input_path), "model": model, "display_name": display_name})
+        )
+        return job_name
+
+    def status(self, job_name: str) -> str:
+        output_path = self._output_path(job_name)
+        if output_path.exists():
+            return "succeeded"
+        meta_path = BATCH_DIR / f"{job_name}.job.json"
+        if not meta_path.exists():
+            return "failed"
+
+        meta = json.loads(meta_path.read_text())
+        with open(meta["input_path"]) as src, open(output_path, "w") as dst:
+            for line in src:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                text = self.responder(record["key"], record["request"])
+                response = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+                dst.write(json.dumps({"key": record["key"], "response": response}) + "\n")
+        return "succeeded"
+
+    def results(self, job_name: str) -> Iterator[BatchResult]:
+        with open(self._output_path(job_name)) as f:
+            for line in f:
+                result = _parse_result_line(line)
+                if result:
+                    yield result
+
+
+def _offline_response(key: str, request: Dict[str, Any]) -> str:
+    """Default local responder, mirroring the generator's no-client fallbacks."""
+    kind = key.split(":", 1)[0]
+    if kind.endswith("_plan"):
+        content_type = "story" if kind.startswith("story") else "reel"
+        days = int(key.split(":")[1].split("-")[1])
+        return json.dumps([
+            {"day": day, "post_context": f"Day {day} of the current arc.", "content_type": content_type}
+            for day in range(1, days + 1)
+        ])
+    if kind == "scene":
+        return json.dumps({"description": "Fallback", "intention": "Fallback"})
+    if kind == "caption":
+        return "New post! ✨"
+    return ""
+
+
+class BatchGenerator:
+    """
+    Offline batch mode for non-urgent generation.
+
+    Requests are appended to a pending JSONL file per (task, model). Each cycle
+    polls submitted jobs, hands finished results to the handler registered for
+    the request kind, and then submits whatever is pending as new batch jobs.
+    Requests that never get a handled result (the whole batch failed, or the
+    handler raised) go to the kind's failure handler so their targets can be cleaned up.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self._handlers: Dict[str, Callable[[Session, str, Optional[str]], None]] = {}
+        self._failure_handlers: Dict[str, Callable[[Session, str], None]] = {}
+        self._lock = threading.Lock()
+        BATCH_DIR.mkdir(parents=True, exist_ok=True)
+
+    def register_handler(
+        self,
+        kind: str,
+        handler: Callable[[Session, str, Optional[str]], None],
+        on_failure: Optional[Callable[[Session, str], None]] = None,
+    ):
+        """
+        handler(db, target, text) is called per result; text is None if the request failed.
+        on_failure(db, target) is called for requests whose batch failed or whose handler raised.
+        """
+        self._handlers[kind] = handler
+        if on_failure is not None:
+            self._failure_handlers[kind] = on_failure
+
+    def _fail_request(self, db: Session, key: str):
+        kind, target, _ = key.split(":", 2)
+        on_failure = self._failure_handlers.get(kind)
+        if on_failure is None:
+            return
+        try:
+            on_failure(db, target)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Batch failure handler for {key} failed: {e}", exc_info=True)
+
+    def _fail_job(self, db: Session, job: BatchJob):
+        """Runs the failure handlers for every request in a failed batch."""
+        try:
+            with open(job.input_path) as f:
+                keys = [json.loads(line)["key"] for line in f if line.strip()]
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not read requests of failed batch {job.input_path}: {e}")
+            return
+        for key in keys:
+            self._fail_request(db, key)
+
+    def enqueue(self, task: str, kind: str, target: str, prompt: str, **config_fields) -> str:
+        """Stages a request for the next batch submission and returns its key."""
+        model, config = model_router.resolve(task, **config_fields)
+        key = f"{kind}:{target}:{uuid.uuid4().hex[:8]}"
+        record = {
+            "key": key,
+            "request": {
+                "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                "generation_config": config.model_dump(mode="json", exclude_none=True),
+            },
+        }
+        pending_path = BATCH_DIR / f"pending__{task}__{model.replace('/', '_')}.jsonl"
+        with self._lock:
+            with open(pending_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        return key
+
+    def flush(self, db: Session) -> int:
+        """Submits every pending file as a batch job. Returns the number of jobs created."""
+        submitted = 0
+        with self._lock:
+            pending = sorted(BATCH_DIR.glob("pending__*.jsonl"))
+            staged: List[Tuple[Path, str, str]] = []
+            for path in pending:
+                _, task, model_slug = path.stem.split("__", 2)
+                target = path.with_name(f"batch_{datetime.now():%Y%m%d%H%M%S}_{uuid.uuid4().hex[:6]}_{task}.jsonl")
+                path.rename(target)
+                staged.append((target, task, model_slug.replace("_", "/", 1)))
+
+        for input_path, task, model in staged:
+            with open(input_path) as f:
+                request_count = sum(1 for line in f if line.strip())
+            job = BatchJob(
+                provider=self.provider.name,
+                task=task,
+                model=model,
+                input_path=str(input_path),
+                request_count=request_count,
+            )
+            try:
+                job.provider_job_name = self.provider.submit(input_path, model, input_path.stem)
+                logger.info(f"Submitted batch {job.provider_job_name} with {request_count} '{task}' requests")
+            except Exception as e:
+                logger.error(f"Batch submission failed for {input_path}: {e}")
+                job.status = BatchJobStatus.FAILED
+                job.error = str(e)
+            db.add(job)
+            db.commit()
+            if job.status == BatchJobStatus.FAILED:
+                self._fail_job(db, job)
+            submitted += 1
+        return submitted
+
+    def poll(self, db: Session) -> int:
+        """Checks submitted jobs and dispatches finished results. Returns results handled."""
+        handled = 0
+        jobs = db.query(BatchJob).filter(BatchJob.status == BatchJobStatus.SUBMITTED).all()
+        for job in jobs:
+            try:
+                state = self.provider.status(job.provider_job_name)
+            except Exception as e:
+                logger.error(f"Could not poll batch {job.provider_job_name}: {e}")
+                continue
+
+            if state == "running":
+                continue
+            if state == "failed":
+                job.status = BatchJobStatus.FAILED
+                job.error = "Provider reported failure"
+                db.commit()
+                logger.error(f"Batch {job.provider_job_name} failed")
+                self._fail_job(db, job)
+                continue
+
+            # The job stays unprocessed until its results are read, so a failed read is retried next cycle
+            try:
+                results = list(self.provider.results(job.provider_job_name))
+            except Exception as e:
+                logger.error(f"Could not read results of batch {job.provider_job_name}: {e}")
+                continue
+
+            for key, text, error in results:
+                kind, target, _ = key.split(":", 2)
+                handler = self._handlers.get(kind)
+                if not handler:
+                    logger.warning(f"No batch handler for '{kind}', dropping result {key}")
+                    continue
+                if error:
+                    logger.error(f"Batch request {key} failed: {error}")
+                try:
+                    handler(db, target, text)
+                    handled += 1
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Batch handler for {key} failed: {e}", exc_info=True)
+                    self._fail_request(db, key)
+
+            job.status = BatchJobStatus.PROCESSED
+            db.commit()
+        return handled
+
+    def run_cycle(self):
+        """Poll then flush, so follow-up requests created by handlers go out in the same cycle."""
+        db = get_db_session()
+        try:
+            self.poll(db)
+            self.flush(db)
+        except Exception as e:
+            logger.error(f"Batch cycle failed: {e}", exc_info=True)
+        finally:
+            db.close()
+
+    def start(self, scheduler, interval_seconds: int):
+        """Registers the poll/flush cycle as an interval job on an APScheduler instance."""
+        scheduler.add_job(
+            self.run_cycle,
+            trigger="interval",
+            seconds=interval_seconds,
+            id="batch_generator_cycle",
+            replace_existing=True,
+            max_instances=1,
+        )
+        logger.info(f"Batch generator polling every {interval_seconds}s via {self.provider.name} provider")
+
+
+def _default_provider():
+    provider = os.getenv("GEMINI_BATCH_PROVIDER", "gemini" if ai_generator.client else "local")
+    if provider == "gemini" and ai_generator.client:
+        return GeminiBatchProvider(ai_generator.client)
+    return LocalBatchProvider()
+
+
+batch_generator = BatchGenerator(_default_provider())
@@ -0,0 +1,173 @@
+import os
+import bisect
+import logging
+import threading
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from database.models import get_db_session, Schedule, Video
+
+logger = logging.getLogger(__name__)
+
+MIN_GAP = timedelta(minutes=float(os.getenv("CALENDAR_MIN_GAP_MINUTES", "60")))
+MAX_POSTS_PER_DAY = int(os.getenv("CALENDAR_MAX_POSTS_PER_DAY", "8"))
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _seconds(moment: datetime) -> float:
+    # SQLite stores wall-clock times without an offset; compare aware inputs the same way
+    return (moment.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+
+def _moment(seconds: float) -> datetime:
+    return _EPOCH + timedelta(seconds=seconds)
+
+
+class CalendarIndex:
+    """
+    Sorted timeline of active schedule times per influencer.
+
+    Each timeline is an array of float seconds, built from the schedules table
+    on first use and kept current by book()/remove(); invalidate() drops it
+    after bulk changes so the next query rebuilds it. Lookups are bisections,
+    so conflict checks need no DB query. Two rules apply: posts at least
+    MIN_GAP apart, and at most MAX_POSTS_PER_DAY posts on a calendar day.
+    """
+
+    def __init__(self, min_gap: timedelta = MIN_GAP, max_per_day: int = MAX_POSTS_PER_DAY):
+        self.min_gap = min_gap
+        self.max_per_day = max_per_day
+        self._timelines: Dict[int, array] = {}
+        self._lock = threading.RLock()
+
+    def _timeline(self, influencer_id: int) -> array:
+        timeline = self._timelines.get(influencer_id)
+        if timeline is not None:
+            return timeline
+        db = get_db_session()
+        try:
+            rows = (
+                db.query(Schedule.run_at)
+                .join(Video, Video.id == Schedule.video_id)
+                .filter(Video.influencer_id == influencer_id)
+                .filter(Schedule.is_active == True)
+                .order_by(Schedule.run_at)
+                .all()
+            )
+        finally:
+            db.close()
+        timeline = array("d", (_seconds(run_at) for (run_at,) in rows))
+        self._timelines[influencer_id] = timeline
+        return timeline
+
+    def invalidate(self, influencer_id: int):
+        with self._lock:
+            self._timelines.pop(influencer_id, None)
+
+    # Queries
+
+    def nearest(self, influencer_id: int, when: datetime) -> Optional[datetime]:
+        """The scheduled post closest to `when`, or None."""
+        with self._lock:
+            timeline = self._timeline(influencer_id)
+            t = _seconds(when)
+            i = bisect.bisect_left(timeline, t)
+            candidates = [timeline[j] for j in (i - 1, i) if 0 <= j < len(timeline)]
+        if not candidates:
+            return None
+        return _moment(min(candidates, key=lambda value: abs(value - t)))
+
+    def between(self, influencer_id: int, start: datetime, end: datetime) -> List[datetime]:
+        """Scheduled posts with start <= time <= end."""
+        with self._lock:
+            timeline = self._timeline(influencer_id)
+            lo = bisect.bisect_left(timeline, _seconds(start))
+            hi = bisect.bisect_right(timeline, _seconds(end))
+            return [_moment(value) for value in timeline[lo:hi]]
+
+    def _day_count(self, timeline: array, when: datetime) -> int:
+        day = when.replace(hour=0, minute=0, second=0, microsecond=0)
+        return (
+            bisect.bisect_left(timeline, _seconds(day + timedelta(days=1)))
+            - bisect.bisect_left(timeline, _seconds(day))
+        )
+
+    def _too_close(self, timeline: array, t: float, gap: float) -> Optional[float]:
+        i = bisect.bisect_left(timeline, t)
+        for j in (i - 1, i):
+            if 0 <= j < len(timeline) and abs(timeline[j] - t) < gap:
+                return timeline[j]
+        return None
+
+    def conflict(self, influencer_id: int, when: datetime, gap: Optional[timedelta] = None) -> Optional[str]:
+        """Why a post at `when` breaks the spacing or daily cap, or None if it fits."""
+        gap_seconds = (gap or self.min_gap).total_seconds()
+        with self._lock:
+            timeline = self._timeline(influencer_id)
+            close = self._too_close(timeline, _seconds(when), gap_seconds)
+            if close is not None:
+                return f"Another post is scheduled at {_moment(close).isoformat()}"
+            if self._day_count(timeline, when) >= self.max_per_day:
+                return f"{self.max_per_day} posts are already scheduled on {when.date().isoformat()}"
+        return None
+
+    def next_free(self, influencer_id: int, when: datetime, gap: Optional[timedelta] = None) -> datetime:
+        """The earliest time at or after `when` that satisfies the spacing and daily cap."""
+        gap_seconds = (gap or self.min_gap).total_seconds()
+        with self._lock:
+            return self._next_free(self._timeline(influencer_id), when, gap_seconds)
+
+    def _next_free(self, timeline: array, when: datetime, gap: float) -> datetime:
+        t = _seconds(when)
+        while True:
+            i = bisect.bisect_left(timeline, t - gap + 1e-6)
+            while i < len(timeline) and timeline[i] < t + gap:
+                t = max(t, timeline[i] + gap)
+                i += 1
+            candidate = _moment(t)
+            if self._day_count(timeline, candidate) < self.max_per_day:
+                return candidate
+            # Day is full: same time of day, on the next day
+            t = _seconds(candidate + timedelta(days=1))
+
+    # Updates
+
+    def try_book(self, influencer_id: int, when: datetime, gap: Optional[timedelta] = None) -> bool:
+        """Adds `when` only if it fits; check and insert are atomic."""
+        with self._lock:
+            if self.conflict(influencer_id, when, gap) is not None:
+                return False
+            bisect.insort(self._timeline(influencer_id), _seconds(when))
+            return True
+
+    def book(self, influencer_id: int, when: datetime, gap: Optional[timedelta] = None) -> datetime:
+        """Adds the first free time at or after `when` and returns it."""
+        gap_seconds = (gap or self.min_gap).total_seconds()
+        with self._lock:
+            timeline = self._timeline(influencer_id)
+            slot = self._next_free(timeline, when, gap_seconds)
+            bisect.insort(timeline, _seconds(slot))
+        if slot != when:
+            logger.info(f"Shifted post for influencer {influencer_id} from {when} to {slot}")
+        return slot
+
+    def remove(self, influencer_id: int, when: datetime):
+        with self._lock:
+            timeline = self._timelines.get(influencer_id)
+            if timeline is None:
+                return
+            i = bisect.bisect_left(timeline, _seconds(when))
+            if i < len(timeline) and timeline[i] == _seconds(when):
+                del timeline[i]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "loaded_influencers": len(self._timelines),
+                "indexed_posts": sum(len(timeline) for timeline in self._timelines.values()),
+            }
+
+
+calendar_index = CalendarIndex()
@@ -0,0 +1,199 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from database.models import get_db_session, Comment, CommentCursor, Video, VideoStatus
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = int(os.getenv("COMMENT_PAGE_SIZE", "50"))
+# Upper bound on pages read per media per poll; a media with more new comments than
+# this catches up on its newest comments and drops the older overflow.
+MAX_PAGES = int(os.getenv("COMMENT_MAX_PAGES", "4"))
+LOOKBACK_DAYS = int(os.getenv("COMMENT_LOOKBACK_DAYS", "7"))
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class CommentIngestor:
+    """
+    Pulls comments for recently posted media into the comments table.
+
+    Every media has a CommentCursor holding the newest comment already stored.
+    A poll pages through comments newest first and stops at that checkpoint,
+    so its cost follows the number of new comments rather than the thread size.
+    Comments are de-duplicated by their Instagram id, and take_new() hands each
+    stored comment to sentiment analysis exactly once.
+    """
+
+    def __init__(self, client_provider: Optional[Callable[[int], Any]] = None):
+        # client_provider(influencer_id) -> instagrapi-compatible client or None
+        self.client_provider = client_provider
+        self._lock = threading.Lock()
+        self._metrics = {"polls": 0, "media_polled": 0, "pages": 0, "new_comments": 0, "duplicates": 0}
+
+    def _recent_media(self, db: Session, influencer_id: Optional[int]) -> List[Video]:
+        query = (
+            db.query(Video)
+            .filter(Video.media_id.isnot(None))
+            .filter(Video.status == VideoStatus.POSTED)
+            .filter(Video.scheduled_time >= datetime.utcnow() - timedelta(days=LOOKBACK_DAYS))
+        )
+        if influencer_id is not None:
+            query = query.filter(Video.influencer_id == influencer_id)
+        return query.order_by(Video.influencer_id, Video.scheduled_time.desc()).all()
+
+    def poll(self, influencer_id: Optional[int] = None) -> Dict[str, Any]:
+        """Ingests new comments for recent media of one influencer, or of all influencers."""
+        summary = {"media": 0, "new_comments": 0, "skipped_media": 0}
+        if self.client_provider is None:
+            return summary
+
+        db = get_db_session()
+        try:
+            clients: Dict[int, Any] = {}
+            for video in self._recent_media(db, influencer_id):
+                if video.influencer_id not in clients:
+                    clients[video.influencer_id] = self.client_provider(video.influencer_id)
+                client = clients[video.influencer_id]
+                if client is None:
+                    summary["skipped_media"] += 1
+                    continue
+                try:
+                    summary["new_comments"] += self._poll_media(db, client, video)
+                    summary["media"] += 1
+                except Exception as e:
+                    db.rollback()
+                    summary["skipped_media"] += 1
+                    logger.error(f"Comment poll failed for media {video.media_id}: {e}")
+        finally:
+            db.close()
+
+        with self._lock:
+            self._metrics["polls"] += 1
+            self._metrics["media_polled"] += summary["media"]
+        if summary["new_comments"]:
+            logger.info(f"Ingested {summary['new_comments']} new comments across {summary['media']} media")
+        return summary
+
+    def _poll_media(self, db: Session, client, video: Video) -> int:
+        cursor = db.query(CommentCursor).filter(CommentCursor.media_id == video.media_id).first()
+        if cursor is None:
+            cursor = CommentCursor(media_id=video.media_id, influencer_id=video.influencer_id, comment_count=0)
+            db.add(cursor)
+
+        fetched = []
+        page_cursor = None
+        pages = 0
+        reached_checkpoint = False
+        while pages < MAX_PAGES and not reached_checkpoint:
+            page, page_cursor = client.media_comments_chunk(video.media_id, PAGE_SIZE, min_id=page_cursor)
+            pages += 1
+            for comment in page:
+                created = _naive_utc(comment.created_at_utc)
+                if str(comment.pk) == cursor.newest_comment_pk or (
+                    cursor.newest_commented_at and created and created < cursor.newest_commented_at
+                ):
+                    reached_checkpoint = True
+                    break
+                fetched.append((comment, created))
+            if not page_cursor:
+                break
+        if not reached_checkpoint and page_cursor and cursor.newest_comment_pk:
+            logger.warning(f"Media {video.media_id}: more than {MAX_PAGES * PAGE_SIZE} new comments, older ones skipped")
+
+        stored = self._store(db, video, fetched)
+        if fetched:
+            newest, newest_at = fetched[0]
+            cursor.newest_comment_pk = str(newest.pk)
+            cursor.newest_commented_at = newest_at
+        cursor.comment_count = (cursor.comment_count or 0) + stored
+        cursor.last_polled_at = datetime.utcnow()
+        db.commit()
+
+        with self._lock:
+            self._metrics["pages"] += pages
+            self._metrics["new_comments"] += stored
+            self._metrics["duplicates"] += len(fetched) - stored
+        return stored
+
+    def _store(self, db: Session, video: Video, fetched) -> int:
+        if not fetched:
+            return 0
+        pks = {str(comment.pk) for comment, _ in fetched}
+        existing = {
+            pk for (pk,) in db.query(Comment.comment_pk).filter(Comment.comment_pk.in_(pks)).all()
+        }
+        rows = []
+        for comment, created in fetched:
+            pk = str(comment.pk)
+            if pk in existing:
+                continue
+            existing.add(pk)
+            rows.append(Comment(
+                comment_pk=pk,
+                media_id=video.media_id,
+                video_id=video.id,
+                influencer_id=video.influencer_id,
+                username=getattr(getattr(comment, "user", None), "username", None),
+                text=comment.text or "",
+                commented_at=created,
+            ))
+        db.add_all(rows)
+        return len(rows)
+
+    def take_new(self, influencer_id: int, limit: int = 200) -> List[str]:
+        """
+        Texts of up to `limit` of the newest comments not yet analyzed, oldest first.
+        Everything up to them is marked analyzed, so a backlog is never re-read.
+        """
+        db = get_db_session()
+        try:
+            rows = (
+                db.query(Comment.id, Comment.text)
+                .filter(Comment.influencer_id == influencer_id)
+                .filter(Comment.analyzed == False)
+                .order_by(Comment.id.desc())
+                .limit(limit)
+                .all()
+            )
+            if not rows:
+                return []
+            (
+                db.query(Comment)
+                .filter(Comment.influencer_id == influencer_id)
+                .filter(Comment.analyzed == False)
+                .filter(Comment.id <= rows[0].id)
+                .update({Comment.analyzed: True}, synchronize_session=False)
+            )
+            db.commit()
+            return [row.text for row in reversed(rows)]
+        finally:
+            db.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._metrics)
+
+    def start(self, scheduler, interval_seconds: int):
+        """Registers the poll as an interval job on an APScheduler instance."""
+        scheduler.add_job(
+            self.poll,
+            trigger="interval",
+            seconds=interval_seconds,
+            id="comment_ingestor_poll",
+            replace_existing=True,
+            max_instances=1,
+        )
+        logger.info(f"Comment ingestion polling every {interval_seconds}s")
+
+
+comment_ingestor = CommentIngestor()
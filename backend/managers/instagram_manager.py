@@ -1,81 +1,236 @@
+import os
 import json
+import time
 import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from typing import Dict, Optional, List
 from instagrapi import Client
 from instagrapi.exceptions import LoginRequired, ChallengeRequired, PleaseWaitFewMinutes, RateLimitError
-from database.models import InstagramAccount, get_db_session
+from database.models import InstagramAccount, LinkStatus, get_db_session
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SESSION_POOL_SIZE = int(os.getenv("INSTAGRAM_SESSION_POOL_SIZE", "256"))
+# Sessions saved or used successfully within this window are trusted without an account_info() check
+SESSION_TRUST_SECONDS = float(os.getenv("INSTAGRAM_SESSION_TRUST_HOURS", "12")) * 3600
+
+UPLOAD_LABELS = {"photo": "Photo", "video": "Video", "story": "Story"}
+
+
+class SessionUnavailable(Exception):
+    """No usable logged-in session for the account."""
+
+
+class _PooledSession:
+    def __init__(self, username: str, client: Client, validated_at: float):
+        self.username = username
+        self.client = client
+        self.lock = threading.RLock()  # one request at a time per account
+        self.validated_at = validated_at  # monotonic time of the last successful use or check
+        self.dirty = False  # settings changed since the last write-back
+
+
+class _LockedClient:
+    """
+    Proxy handed out by the pool: every client method call holds the account lock,
+    refreshes the session's trust on success and drops it on LoginRequired.
+    """
+
+    def __init__(self, pool: "SessionPool", session: _PooledSession):
+        self._pool = pool
+        self._session = session
+
+    def __getattr__(self, name):
+        attr = getattr(self._session.client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._session.lock:
+                try:
+                    result = attr(*args, **kwargs)
+                except LoginRequired:
+                    self._pool.discard(self._session.username, failed=True)
+                    raise
+            self._session.validated_at = time.monotonic()
+            self._session.dirty = True
+            return result
+
+        return call
+
+
+class SessionPool:
+    """
+    Bounded LRU pool of logged-in instagrapi clients.
+
+    Sessions are restored from InstagramAccount.session_data on first use and
+    only validated with a network call when the saved session is older than
+    SESSION_TRUST_SECONDS. Refreshed settings are written back in one batched
+    transaction by flush(), and before an entry is evicted.
+    """
+
+    def __init__(self, max_size: int = SESSION_POOL_SIZE, trust_seconds: float = SESSION_TRUST_SECONDS):
+        self.max_size = max_size
+        self.trust_seconds = trust_seconds
+        self._sessions: "OrderedDict[str, _PooledSession]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._suspect: set = set()  # accounts whose last session failed; validated on next restore
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "restores": 0, "validations": 0, "evictions": 0, "write_backs": 0}
+
+    def __contains__(self, username: str) -> bool:
+        with self._lock:
+            return username in self._sessions
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def get(self, username: str) -> Optional[_LockedClient]:
+        """Pooled client, or None on a miss or when the session has been idle past the trust window."""
+        with self._lock:
+            session = self._sessions.get(username)
+            if session is None:
+                return None
+            if time.monotonic() - session.validated_at <= self.trust_seconds:
+                self._sessions.move_to_end(username)
+                self._metrics["hits"] += 1
+                return _LockedClient(self, session)
+            del self._sessions[username]
+            self._suspect.add(username)
+        if session.dirty:
+            self._write_back([session])
+        return None
+
+    def loading_lock(self, username: str) -> threading.Lock:
+        """Serializes restores of the same account so concurrent misses restore it once."""
+        with self._lock:
+            return self._loading.setdefault(username, threading.Lock())
+
+    def put(self, username: str, client: Client, validated_at: float, dirty: bool = False) -> _LockedClient:
+        session = _PooledSession(username, client, validated_at)
+        session.dirty = dirty
+        evicted = []
+        with self._lock:
+            self._suspect.discard(username)
+            self._sessions[username] = session
+            self._sessions.move_to_end(username)
+            self._metrics["restores"] += 1
+            while len(self._sessions) > self.max_size:
+                _, old = self._sessions.popitem(last=False)
+                self._loading.pop(old.username, None)
+                self._metrics["evictions"] += 1
+                evicted.append(old)
+        dirty_evicted = [old for old in evicted if old.dirty]
+        if dirty_evicted:
+            self._write_back(dirty_evicted)
+        return _LockedClient(self, session)
+
+    def discard(self, username: str, failed: bool = False):
+        with self._lock:
+            self._sessions.pop(username, None)
+            if failed:
+                self._suspect.add(username)
+
+    def needs_validation(self, username: str, saved_at: Optional[datetime]) -> bool:
+        with self._lock:
+            if username in self._suspect:
+                return True
+        if saved_at is None:
+            return True
+        return datetime.utcnow() - saved_at > timedelta(seconds=self.trust_seconds)
+
+    def record_validation(self):
+        with self._lock:
+            self._metrics["validations"] += 1
+
+    def flush(self) -> int:
+        """Writes refreshed client settings of every changed session in one transaction."""
+        with self._lock:
+            dirty = [session for session in self._sessions.values() if session.dirty]
+        return self._write_back(dirty) if dirty else 0
+
+    def _write_back(self, sessions: List[_PooledSession]) -> int:
+        settings = {}
+        for session in sessions:
+            with session.lock:
+                settings[session.username] = json.dumps(session.client.get_settings())
+                session.dirty = False
+
+        db = get_db_session()
+        try:
+            accounts = db.query(InstagramAccount).filter(InstagramAccount.username.in_(list(settings))).all()
+            saved_at = datetime.utcnow()
+            for account in accounts:
+                account.session_data = settings[account.username]
+                account.session_saved_at = saved_at
+            db.commit()
+            with self._lock:
+                self._metrics["write_backs"] += len(accounts)
+            return len(accounts)
+        except Exception as e:
+            db.rollback()
+            for session in sessions:
+                session.dirty = True
+            logger.error(f"Session write-back failed: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._metrics, "size": len(self._sessions), "max_size": self.max_size}
+
+    def start(self, scheduler, interval_seconds: int):
+        """Registers flush() as an interval job on an APScheduler instance."""
+        scheduler.add_job(
+            self.flush,
+            trigger="interval",
+            seconds=interval_seconds,
+            id="instagram_session_flush",
+            replace_existing=True,
+            max_instances=1,
+        )
+
+
 class InstagramManager:
     def __init__(self):
-        self.clients: Dict[str, Client] = {}
+        self.sessions = SessionPool()
     
     def add_account(self, username: str, password: str, influencer_id: int) -> tuple[bool, str]:
-        """Add a new Instagram account and link it to an influencer."""
+        """Add a new Instagram account and link it to an influencer, logging in right away."""
+        success, message = self.register_account(username, password, influencer_id)
+        if not success:
+            return False, message
+        status, message = self.link_account(username, allow_retry=False)
+        return status == LinkStatus.LINKED, message
+    
+    def register_account(self, username: str, password: str, influencer_id: int) -> tuple[bool, str]:
+        """
+        Store an account as pending without contacting Instagram; link_account() logs it in.
+        An account whose linking failed can be registered again with new credentials.
+        """
         db = get_db_session()
         
         try:
             existing = db.query(InstagramAccount).filter(InstagramAccount.username == username).first()
-            if existing:
+            if existing and existing.link_status != LinkStatus.FAILED:
                 return False, "Account already exists"
             
-            client = Client()
-            
-            try:
-                client.login(username, password)
-                logger.info(f"Successfully logged in user: {username}")
-            except ChallengeRequired as e:
-                logger.error(f"Challenge required for {username}: {e}")
-                return False, "Instagram challenge required - please complete verification"
-            except LoginRequired as e:
-                logger.error(f"Login failed for {username}: {e}")
-                return False, "Invalid credentials or login blocked"
-            except PleaseWaitFewMinutes as e:
-                logger.error(f"Rate limited for {username}: {e}")
-                return False, "Rate limited - please wait a few minutes"
-            except RateLimitError as e:
-                logger.error(f"Rate limit error for {username}: {e}")
-                return False, "Too many requests - please try again later"
-            except Exception as e:
-                logger.error(f"Login error for {username}: {e}")
-                return False, f"Login failed: {str(e)}"
-            
-            try:
-                user_info = client.user_info(client.user_id)
-                full_name = getattr(user_info, 'full_name', username)
-                bio = getattr(user_info, 'biography', '')
-                follower_count = getattr(user_info, 'follower_count', 0)
-                following_count = getattr(user_info, 'following_count', 0)
-                media_count = getattr(user_info, 'media_count', 0)
-            except Exception as e:
-                logger.warning(f"Could not fetch user info for {username}: {e}")
-                full_name = username
-                bio = ''
-                follower_count = 0
-                following_count = 0
-                media_count = 0
-            
-            account = InstagramAccount(
-                influencer_id=influencer_id,
-                username=username,
-                password=password,
-                instagram_user_id=str(client.user_id),
-                full_name=full_name,
-                bio=bio,
-                follower_count=follower_count,
-                following_count=following_count,
-                media_count=media_count,
-                session_data=json.dumps(client.get_settings())
-            )
-            
-            db.add(account)
+            if existing is None:
+                existing = InstagramAccount(username=username)
+                db.add(existing)
+            existing.influencer_id = influencer_id
+            existing.password = password
+            existing.is_active = False
+            existing.link_status = LinkStatus.PENDING
+            existing.link_error = None
+            existing.link_attempts = 0
             db.commit()
-            
-            self.clients[username] = client
-            logger.info(f"Account {username} added successfully")
-            return True, "Account added successfully"
+            return True, "Account queued for linking"
             
         except Exception as e:
             logger.error(f"Database error adding account {username}: {e}")
@@ -84,31 +239,147 @@ class InstagramManager:
         finally:
             db.close()
     
-    def load_account(self, username: str) -> tuple[bool, str]:
-        """Load existing account session"""
+    def _set_link_status(self, username: str, status: LinkStatus, error: Optional[str] = None, **fields):
+        db = get_db_session()
+        try:
+            db.query(InstagramAccount).filter(InstagramAccount.username == username).update(
+                {"link_status": status, "link_error": error, **fields}
+            )
+            db.commit()
+        finally:
+            db.close()
+    
+    def link_account(self, username: str, allow_retry: bool = True) -> tuple[LinkStatus, str]:
+        """
+        Log in a registered account and fetch its profile.
+        Returns the new link status and a message. Rate limits and other transient
+        errors give RETRYING when allow_retry is set, FAILED otherwise.
+        """
         db = get_db_session()
-        
         try:
             account = db.query(InstagramAccount).filter(InstagramAccount.username == username).first()
-            if not account:
-                return False, "Account not found"
+            if account is None:
+                return LinkStatus.FAILED, "Account not found"
+            if account.link_status == LinkStatus.LINKED:
+                return LinkStatus.LINKED, "Account already linked"
+            password = account.password
+            account.link_status = LinkStatus.LINKING
+            account.link_attempts = (account.link_attempts or 0) + 1
+            db.commit()
+        finally:
+            db.close()
+        
+        transient = LinkStatus.RETRYING if allow_retry else LinkStatus.FAILED
+        client = Client()
+        
+        try:
+            client.login(username, password)
+            logger.info(f"Successfully logged in user: {username}")
+        except ChallengeRequired as e:
+            logger.error(f"Challenge required for {username}: {e}")
+            status, message = LinkStatus.FAILED, "Instagram challenge required - please complete verification"
+        except LoginRequired as e:
+            logger.error(f"Login failed for {username}: {e}")
+            status, message = LinkStatus.FAILED, "Invalid credentials or login blocked"
+        except PleaseWaitFewMinutes as e:
+            logger.error(f"Rate limited for {username}: {e}")
+            status, message = transient, "Rate limited - please wait a few minutes"
+        except RateLimitError as e:
+            logger.error(f"Rate limit error for {username}: {e}")
+            status, message = transient, "Too many requests - please try again later"
+        except Exception as e:
+            logger.error(f"Login error for {username}: {e}")
+            status, message = transient, f"Login failed: {str(e)}"
+        else:
+            status, message = LinkStatus.LINKED, "Account added successfully"
+        
+        if status != LinkStatus.LINKED:
+            self._set_link_status(username, status, message)
+            return status, message
+        
+        try:
+            user_info = client.user_info(client.user_id)
+            full_name = getattr(user_info, 'full_name', username)
+            bio = getattr(user_info, 'biography', '')
+            follower_count = getattr(user_info, 'follower_count', 0)
+            following_count = getattr(user_info, 'following_count', 0)
+            media_count = getattr(user_info, 'media_count', 0)
+        except Exception as e:
+            logger.warning(f"Could not fetch user info for {username}: {e}")
+            full_name = username
+            bio = ''
+            follower_count = 0
+            following_count = 0
+            media_count = 0
+        
+        try:
+            self._set_link_status(
+                username,
+                LinkStatus.LINKED,
+                is_active=True,
+                instagram_user_id=str(client.user_id),
+                full_name=full_name,
+                bio=bio,
+                follower_count=follower_count,
+                following_count=following_count,
+                media_count=media_count,
+                session_data=json.dumps(client.get_settings()),
+                session_saved_at=datetime.utcnow(),
+            )
+        except Exception as e:
+            logger.error(f"Database error linking account {username}: {e}")
+            self._set_link_status(username, transient, f"Database error: {str(e)}")
+            return transient, f"Database error: {str(e)}"
+        
+        self.sessions.put(username, client, validated_at=time.monotonic())
+        logger.info(f"Account {username} added successfully")
+        return status, message
+    
+    def load_account(self, username: str, validate: bool = False) -> tuple[bool, str]:
+        """
+        Load existing account session into the pool.
+        The saved session is only checked with Instagram when it is stale,
+        previously failed, or `validate` is set.
+        """
+        if not validate and username in self.sessions:
+            return True, "Session loaded successfully"
+        
+        with self.sessions.loading_lock(username):
+            if not validate and username in self.sessions:
+                return True, "Session loaded successfully"
+            
+            db = get_db_session()
+            try:
+                account = db.query(InstagramAccount).filter(InstagramAccount.username == username).first()
+                if not account:
+                    return False, "Account not found"
+                session_data, saved_at = account.session_data, account.session_saved_at
+            except Exception as e:
+                logger.error(f"Database error loading account {username}: {e}")
+                return False, f"Database error: {str(e)}"
+            finally:
+                db.close()
             
-            if not account.session_data:
+            if not session_data:
                 return False, "No saved session found"
             
             try:
                 client = Client()
-                settings = json.loads(account.session_data)
+                settings = json.loads(session_data)
                 client.set_settings(settings)
                 
-                try:
-                    client.account_info()
-                    self.clients[username] = client
-                    logger.info(f"Successfully loaded session for {username}")
-                    return True, "Session loaded successfully"
-                except LoginRequired:
-                    logger.warning(f"Session expired for {username}")
-                    return False, "Session expired - please re-login"
+                checked = validate or self.sessions.needs_validation(username, saved_at)
+                if checked:
+                    self.sessions.record_validation()
+                    try:
+                        client.account_info()
+                    except LoginRequired:
+                        logger.warning(f"Session expired for {username}")
+                        return False, "Session expired - please re-login"
+                
+                self.sessions.put(username, client, validated_at=time.monotonic(), dirty=checked)
+                logger.info(f"Successfully loaded session for {username}" + ("" if checked else " (trusted, not re-validated)"))
+                return True, "Session loaded successfully"
                     
             except json.JSONDecodeError as e:
                 logger.error(f"Invalid session data for {username}: {e}")
@@ -116,102 +387,124 @@ class InstagramManager:
             except Exception as e:
                 logger.error(f"Failed to restore session for {username}: {e}")
                 return False, f"Session restore failed: {str(e)}"
-                
-        except Exception as e:
-            logger.error(f"Database error loading account {username}: {e}")
-            return False, f"Database error: {str(e)}"
+    
+    def _client(self, username: str):
+        """(client, message) from the session pool, restoring the session on a miss"""
+        client = self.sessions.get(username)
+        if client is not None:
+            return client, "Session loaded successfully"
+        success, message = self.load_account(username)
+        if not success:
+            return None, message
+        client = self.sessions.get(username)
+        return client, message if client is not None else "Session evicted - please retry"
+    
+    def client_for_influencer(self, influencer_id: int) -> Optional[_LockedClient]:
+        """Client for the influencer's active account, restoring its saved session if needed"""
+        db = get_db_session()
+        
+        try:
+            account = (
+                db.query(InstagramAccount)
+                .filter(InstagramAccount.influencer_id == influencer_id)
+                .filter(InstagramAccount.is_active == True)
+                .first()
+            )
+            username = account.username if account else None
         finally:
             db.close()
+        
+        if not username:
+            return None
+        client, message = self._client(username)
+        if client is None:
+            logger.warning(f"No usable session for influencer {influencer_id} ({username}): {message}")
+        return client
     
-    def upload_photo(self, username: str, photo_path: str, caption: str = "") -> tuple[Optional[str], str]:
-        """Upload photo for specific account"""
-        if username not in self.clients:
-            success, message = self.load_account(username)
-            if not success:
-                return None, message
+    def upload_media(self, username: str, kind: str, path: str, caption: str = "") -> str:
+        """
+        Upload one photo, video/reel or story and return its media id.
+        Raises instagrapi errors (RateLimitError, PleaseWaitFewMinutes, LoginRequired, ...)
+        so callers such as the upload queue can react to throttling.
+        """
+        client, message = self._client(username)
+        if client is None:
+            raise SessionUnavailable(message)
+        
+        if kind == "photo":
+            media = client.photo_upload(path, caption)
+        elif kind == "video":
+            media = client.clip_upload(path, caption)
+        elif kind == "story":
+            if path.lower().endswith(('.jpg', '.jpeg', '.png')):
+                media = client.photo_upload_to_story(path)
+            else:
+                media = client.video_upload_to_story(path)
+        else:
+            raise ValueError(f"Unknown upload kind: {kind}")
         
+        logger.info(f"{UPLOAD_LABELS[kind]} uploaded successfully for {username}: {media.id}")
+        return str(media.id)
+    
+    def _upload_with_message(self, username: str, kind: str, path: str, caption: str = "") -> tuple[Optional[str], str]:
+        label = UPLOAD_LABELS[kind]
         try:
-            client = self.clients[username]
-            media = client.photo_upload(photo_path, caption)
-            logger.info(f"Photo uploaded successfully for {username}: {media.id}")
-            return str(media.id), "Photo uploaded successfully"
+            return self.upload_media(username, kind, path, caption), f"{label} uploaded successfully"
+        except SessionUnavailable as e:
+            return None, str(e)
         except LoginRequired as e:
-            logger.error(f"Login required for photo upload {username}: {e}")
+            logger.error(f"Login required for {label.lower()} upload {username}: {e}")
             return None, "Session expired - please re-login"
-        except RateLimitError as e:
-            logger.error(f"Rate limited photo upload {username}: {e}")
+        except (RateLimitError, PleaseWaitFewMinutes) as e:
+            logger.error(f"Rate limited {label.lower()} upload {username}: {e}")
             return None, "Rate limited - please try again later"
         except Exception as e:
-            logger.error(f"Failed to upload photo for {username}: {e}")
+            logger.error(f"Failed to upload {label.lower()} for {username}: {e}")
             return None, f"Upload failed: {str(e)}"
     
+    def upload_photo(self, username: str, photo_path: str, caption: str = "") -> tuple[Optional[str], str]:
+        """Upload photo for specific account"""
+        return self._upload_with_message(username, "photo", photo_path, caption)
+    
     def upload_video(self, username: str, video_path: str, caption: str = "") -> tuple[Optional[str], str]:
         """Upload video/reel for specific account"""
-        if username not in self.clients:
-            success, message = self.load_account(username)
-            if not success:
-                return None, message
-        
-        try:
-            client = self.clients[username]
-            media = client.clip_upload(video_path, caption)
-            logger.info(f"Video uploaded successfully for {username}: {media.id}")
-            return str(media.id), "Video uploaded successfully"
-        except LoginRequired as e:
-            logger.error(f"Login required for video upload {username}: {e}")
-            return None, "Session expired - please re-login"
-        except RateLimitError as e:
-            logger.error(f"Rate limited video upload {username}: {e}")
-            return None, "Rate limited - please try again later"
-        except Exception as e:
-            logger.error(f"Failed to upload video for {username}: {e}")
-            return None, f"Upload failed: {str(e)}"
+        return self._upload_with_message(username, "video", video_path, caption)
     
     def upload_story(self, username: str, media_path: str) -> tuple[Optional[str], str]:
         """Upload story for specific account"""
-        if username not in self.clients:
-            success, message = self.load_account(username)
-            if not success:
-                return None, message
+        return self._upload_with_message(username, "story", media_path)
+    
+    def fetch_account_stats(self, username: str) -> Optional[Dict[str, int]]:
+        """Current follower, following and media counts from Instagram, or None"""
+        client, _message = self._client(username)
+        if client is None:
+            return None
         
         try:
-            client = self.clients[username]
-            
-            if media_path.lower().endswith(('.jpg', '.jpeg', '.png')):
-                media = client.photo_upload_to_story(media_path)
-            else:
-                media = client.video_upload_to_story(media_path)
-            
-            logger.info(f"Story uploaded successfully for {username}: {media.id}")
-            return str(media.id), "Story uploaded successfully"
-        except LoginRequired as e:
-            logger.error(f"Login required for story upload {username}: {e}")
-            return None, "Session expired - please re-login"
-        except RateLimitError as e:
-            logger.error(f"Rate limited story upload {username}: {e}")
-            return None, "Rate limited - please try again later"
+            user_info = client.user_info(client.user_id)
+            return {
+                'follower_count': user_info.follower_count,
+                'following_count': user_info.following_count,
+                'media_count': user_info.media_count,
+            }
         except Exception as e:
-            logger.error(f"Failed to upload story for {username}: {e}")
-            return None, f"Upload failed: {str(e)}"
+            logger.warning(f"Failed to fetch stats for {username}: {e}")
+            return None
     
     def update_account_stats(self, username: str) -> bool:
         """Update account statistics"""
-        if username not in self.clients:
-            if not self.load_account(username):
-                return False
+        stats = self.fetch_account_stats(username)
+        if stats is None:
+            return False
         
         db = get_db_session()
         
         try:
-            client = self.clients[username]
-            user_info = client.user_info(client.user_id)
-            
             account = db.query(InstagramAccount).filter(InstagramAccount.username == username).first()
             if account:
-                account.follower_count = user_info.follower_count
-                account.following_count = user_info.following_count
-                account.media_count = user_info.media_count
-                account.session_data = json.dumps(client.get_settings())
+                account.follower_count = stats['follower_count']
+                account.following_count = stats['following_count']
+                account.media_count = stats['media_count']
                 db.commit()
                 return True
         except Exception as e:
@@ -268,8 +561,7 @@ class InstagramManager:
                 account.is_active = False
                 db.commit()
                 
-                if username in self.clients:
-                    del self.clients[username]
+                self.sessions.discard(username)
                 
                 return True
         except Exception as e:
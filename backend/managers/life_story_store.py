@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import zlib
+import difflib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database.models import SessionLocal, Influencer, LifeStoryVersion
+
+logger = logging.getLogger(__name__)
+
+# A full snapshot every N versions bounds reconstruction to N - 1 delta applications.
+SNAPSHOT_EVERY = int(os.getenv("LIFE_STORY_SNAPSHOT_EVERY", "10"))
+CACHE_SIZE = int(os.getenv("LIFE_STORY_CACHE_SIZE", "128"))
+
+# Sentences (with trailing whitespace) and line breaks are the unit of a delta,
+# so rewording one sentence only stores that sentence.
+_TOKEN = re.compile(r"[^.!?\n]+(?:[.!?]+[\"')\]]*)?[ \t]*|[.!?]+[ \t]*|\n+")
+
+
+def _tokens(story: str) -> List[str]:
+    return _TOKEN.findall(story)
+
+
+def _encode_delta(base: str, target: str) -> List[Any]:
+    """Ops turning base into target: [i, j] copies base tokens i..j, a string is inserted."""
+    a, b = _tokens(base), _tokens(target)
+    ops: List[Any] = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(b[j1:j2]))
+    return ops
+
+
+def _apply_delta(base: str, ops: List[Any]) -> str:
+    a = _tokens(base)
+    return "".join(op if isinstance(op, str) else "".join(a[op[0]:op[1]]) for op in ops)
+
+
+class LifeStoryStore:
+    """
+    Append-only, delta-compressed history of each influencer's life story.
+
+    Version 1 and every SNAPSHOT_EVERY-th version after it are stored in full;
+    the rest are compressed sentence-level deltas against the previous version.
+    Influencer.life_story_version points at the head. Reconstructed stories are
+    kept in a small LRU cache keyed by (influencer_id, version).
+    """
+
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[int, Optional[int]], Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_locks: Dict[int, threading.Lock] = {}
+        self._listeners: List[Callable[[int, int, str], None]] = []
+
+    def add_listener(self, listener: Callable[[int, int, str], None]):
+        """listener(influencer_id, version, story) is called after each new version is committed."""
+        self._listeners.append(listener)
+
+    def _cache_get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return True, self._cache[key]
+        return False, None
+
+    def _cache_put(self, key, story: Optional[str]):
+        with self._lock:
+            self._cache[key] = story
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def read(self, influencer_id: Optional[int], version: Optional[int] = None) -> Optional[str]:
+        """Story at `version` (None = stories not yet moved into the version table)."""
+        if influencer_id is None:
+            return None
+        key = (influencer_id, version)
+        hit, story = self._cache_get(key)
+        if hit:
+            return story
+
+        db = SessionLocal()
+        try:
+            if version is None:
+                story = (
+                    db.query(Influencer.legacy_life_story)
+                    .filter(Influencer.id == influencer_id)
+                    .scalar()
+                )
+            else:
+                story = self._reconstruct(db, influencer_id, version)
+        finally:
+            db.close()
+
+        self._cache_put(key, story)
+        return story
+
+    def _reconstruct(self, db: Session, influencer_id: int, version: int) -> str:
+        base_version = (
+            db.query(func.max(LifeStoryVersion.version))
+            .filter(LifeStoryVersion.influencer_id == influencer_id)
+            .filter(LifeStoryVersion.kind == "snapshot")
+            .filter(LifeStoryVersion.version <= version)
+            .scalar()
+        )
+        if base_version is None:
+            raise LookupError(f"No snapshot for influencer {influencer_id} at or before version {version}")
+
+        # Start from the newest cached version in the chain if there is one
+        start, story = base_version, None
+        for candidate in range(version - 1, base_version - 1, -1):
+            hit, cached = self._cache_get((influencer_id, candidate))
+            if hit:
+                start, story = candidate + 1, cached
+                break
+
+        rows = (
+            db.query(LifeStoryVersion)
+            .filter(LifeStoryVersion.influencer_id == influencer_id)
+            .filter(LifeStoryVersion.version >= start)
+            .filter(LifeStoryVersion.version <= version)
+            .order_by(LifeStoryVersion.version)
+            .all()
+        )
+        if len(rows) != version - start + 1:
+            raise LookupError(f"Life story history for influencer {influencer_id} has gaps before version {version}")
+
+        for row in rows:
+            data = zlib.decompress(row.payload).decode("utf-8")
+            story = data if row.kind == "snapshot" else _apply_delta(story, json.loads(data))
+        return story
+
+    def _write_lock(self, influencer_id: int) -> threading.Lock:
+        with self._lock:
+            return self._write_locks.setdefault(influencer_id, threading.Lock())
+
+    def write(self, db: Session, influencer: Influencer, story: str, event: Optional[str] = None) -> int:
+        """
+        Appends `story` as the influencer's new head version and commits.
+        Returns the new version number. A story identical to the head is not stored again.
+
+        Writers for one influencer are serialized, and the head is re-read from the
+        version table under the lock, so a caller holding a stale Influencer (e.g. a
+        post update racing a divine intervention) still appends after the latest version.
+        """
+        with self._write_lock(influencer.id):
+            version = self._write(db, influencer, story, event)
+        if version is None:
+            return influencer.life_story_version
+        for listener in self._listeners:
+            try:
+                listener(influencer.id, version, story)
+            except Exception as e:
+                logger.error(f"Life story listener failed: {e}", exc_info=True)
+        return version
+
+    def _write(self, db: Session, influencer: Influencer, story: str, event: Optional[str]) -> Optional[int]:
+        """Appends under the influencer's write lock. Returns None if the story equals the head."""
+        head = (
+            db.query(func.max(LifeStoryVersion.version))
+            .filter(LifeStoryVersion.influencer_id == influencer.id)
+            .scalar()
+        )
+        if head is None:
+            legacy = self.read(influencer.id, None)
+            if legacy == story:
+                legacy = None
+            if legacy:
+                head = self._append(db, influencer.id, 0, None, legacy, "Imported from the influencer record")
+            influencer.legacy_life_story = None
+            previous = legacy
+        else:
+            previous = self.read(influencer.id, head)
+            if previous == story:
+                if influencer.life_story_version != head:
+                    influencer.life_story_version = head
+                    db.commit()
+                return None
+
+        version = self._append(db, influencer.id, head or 0, previous, story, event)
+        influencer.life_story_version = version
+        db.commit()
+        self._cache_put((influencer.id, version), story)
+        return version
+
+    def _append(
+        self, db: Session, influencer_id: int, head: int, previous: Optional[str], story: str, event: Optional[str]
+    ) -> int:
+        version = head + 1
+        snapshot = zlib.compress(story.encode("utf-8"), 9)
+        kind, payload = "snapshot", snapshot
+        if previous is not None and (version - 1) % SNAPSHOT_EVERY != 0:
+            delta = zlib.compress(json.dumps(_encode_delta(previous, story), separators=(",", ":")).encode("utf-8"), 9)
+            if len(delta) < len(snapshot):
+                kind, payload = "delta", delta
+
+        db.add(LifeStoryVersion(
+            influencer_id=influencer_id,
+            version=version,
+            kind=kind,
+            payload=payload,
+            length=len(story),
+            event=event,
+        ))
+        db.flush()
+        logger.info(f"Stored life story v{version} for influencer {influencer_id} as {kind} ({len(payload)} bytes)")
+        return version
+
+    def versions(self, db: Session, influencer_id: int) -> List[LifeStoryVersion]:
+        return (
+            db.query(LifeStoryVersion)
+            .filter(LifeStoryVersion.influencer_id == influencer_id)
+            .order_by(LifeStoryVersion.version)
+            .all()
+        )
+
+    def diff(self, influencer_id: int, from_version: int, to_version: int) -> Dict[str, Any]:
+        """Unified diff between two versions, one sentence per line."""
+        before = self.read(influencer_id, from_version) or ""
+        after = self.read(influencer_id, to_version) or ""
+        lines = difflib.unified_diff(
+            [token.strip() for token in _tokens(before) if token.strip()],
+            [token.strip() for token in _tokens(after) if token.strip()],
+            fromfile=f"v{from_version}",
+            tofile=f"v{to_version}",
+            lineterm="",
+        )
+        return {"from_version": from_version, "to_version": to_version, "diff": "\n".join(lines)}
+
+
+life_story_store = LifeStoryStore()
@@ -0,0 +1,314 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Higher weight = larger share of the quota when classes compete.
+PRIORITY_WEIGHTS: Dict[str, float] = {
+    "interactive": 4.0,
+    "agent": 2.0,
+    "bulk": 1.0,
+}
+
+# Seconds a request may wait for admission before giving up.
+PRIORITY_MAX_WAIT_S: Dict[str, Optional[float]] = {
+    "interactive": 30.0,
+    "agent": 60.0,
+    "bulk": float(os.getenv("LLM_BULK_MAX_WAIT_SECONDS", "600")),
+}
+
+WINDOW_SECONDS = 60.0
+
+
+class LLMQuotaError(Exception):
+    """Raised when a request cannot be admitted (queue full or wait timeout)."""
+
+
+class _Ticket:
+    __slots__ = ("flow", "priority", "tokens", "finish_tag", "enqueued_at", "window_entry", "admitted", "loop", "future")
+
+    def __init__(self, flow: Tuple[str, Any], priority: str, tokens: int, finish_tag: float):
+        self.flow = flow
+        self.priority = priority
+        self.tokens = tokens
+        self.finish_tag = finish_tag
+        self.enqueued_at = time.monotonic()
+        self.window_entry = None
+        self.admitted = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+
+
+def _resolve(future: asyncio.Future, ticket: _Ticket):
+    if not future.done():
+        future.set_result(ticket)
+
+
+class LLMQuotaScheduler:
+    """
+    Central admission control for Gemini requests.
+
+    Enforces requests-per-minute and tokens-per-minute over a sliding window and
+    orders waiting requests with self-clocked weighted fair queueing. Each
+    (priority class, influencer) pair is a separate flow, so one influencer's
+    90-day plan cannot starve another influencer's interactive calls.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_queue_depth: int,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue_depth = max_queue_depth
+
+        self._cond = threading.Condition()
+        self._waiting: list = []  # heap of (finish_tag, seq, ticket)
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[Tuple[str, Any], float] = {}
+
+        self._window: deque = deque()  # [admitted_at, tokens]
+        self._window_tokens = 0
+
+        self._depth: Dict[str, int] = {p: 0 for p in PRIORITY_WEIGHTS}
+        self._admitted: Dict[str, int] = {p: 0 for p in PRIORITY_WEIGHTS}
+        self._rejected: Dict[str, int] = {p: 0 for p in PRIORITY_WEIGHTS}
+        self._wait_ewma: Dict[str, float] = {p: 0.0 for p in PRIORITY_WEIGHTS}
+        self._wait_max: Dict[str, float] = {p: 0.0 for p in PRIORITY_WEIGHTS}
+
+    def _trim_window(self, now: float):
+        while self._window and now - self._window[0][0] >= WINDOW_SECONDS:
+            _, tokens = self._window.popleft()
+            self._window_tokens -= tokens
+
+    def _seconds_until_capacity(self, tokens: int, now: float) -> float:
+        """0 if a request of `tokens` fits now, else the time until the window frees enough."""
+        self._trim_window(now)
+        if len(self._window) < self.requests_per_minute and (
+            self._window_tokens + tokens <= self.tokens_per_minute or not self._window
+        ):
+            return 0.0
+        # Wait for the oldest entry to leave the window and re-check
+        return max(WINDOW_SECONDS - (now - self._window[0][0]), 0.01)
+
+    def _enqueue(self, influencer_id: Optional[int], priority: str, estimated_tokens: int) -> _Ticket:
+        flow = (priority, influencer_id)
+        start_tag = max(self._virtual_time, self._last_finish.get(flow, 0.0))
+        cost = 1.0 + estimated_tokens / 1000.0
+        ticket = _Ticket(flow, priority, estimated_tokens, start_tag + cost / PRIORITY_WEIGHTS[priority])
+        self._last_finish[flow] = ticket.finish_tag
+        heapq.heappush(self._waiting, (ticket.finish_tag, next(self._seq), ticket))
+        self._depth[priority] += 1
+        return ticket
+
+    def _admit_ready(self) -> Optional[float]:
+        """
+        Admits waiting tickets from the head of the queue while capacity allows.
+        Returns the seconds until the head may fit, or None if nothing is waiting.
+        Called with the lock held whenever the queue or the window changes.
+        """
+        while self._waiting:
+            now = time.monotonic()
+            ticket = self._waiting[0][2]
+            wait_s = self._seconds_until_capacity(ticket.tokens, now)
+            if wait_s > 0.0:
+                return wait_s
+            heapq.heappop(self._waiting)
+            self._admit(ticket, now)
+        return None
+
+    def _admit(self, ticket: _Ticket, now: float):
+        priority, flow = ticket.priority, ticket.flow
+        self._depth[priority] -= 1
+        cost = 1.0 + ticket.tokens / 1000.0
+        self._virtual_time = max(self._virtual_time, ticket.finish_tag - cost / PRIORITY_WEIGHTS[priority])
+        if not any(t.flow == flow for _, _, t in self._waiting):
+            self._last_finish.pop(flow, None)
+
+        ticket.window_entry = [now, ticket.tokens]
+        self._window.append(ticket.window_entry)
+        self._window_tokens += ticket.tokens
+
+        waited = now - ticket.enqueued_at
+        self._admitted[priority] += 1
+        self._wait_ewma[priority] = 0.2 * waited + 0.8 * self._wait_ewma[priority]
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+        ticket.admitted = True
+        if ticket.future is not None:
+            ticket.loop.call_soon_threadsafe(_resolve, ticket.future, ticket)
+        self._cond.notify_all()
+
+    def _deadline(self, priority: str, timeout: Optional[float]) -> Tuple[Optional[float], Optional[float]]:
+        if timeout == -1:
+            timeout = PRIORITY_MAX_WAIT_S[priority]
+        return timeout, None if timeout is None else time.monotonic() + timeout
+
+    def _queue_full(self, priority: str) -> bool:
+        """Backpressure: bulk producers wait while the queue is full, latency-sensitive classes fail fast."""
+        if len(self._waiting) < self.max_queue_depth:
+            return False
+        if priority != "bulk":
+            self._rejected[priority] += 1
+            raise LLMQuotaError(f"LLM queue full ({len(self._waiting)} waiting)")
+        return True
+
+    def _timeout_error(self, priority: str, timeout: Optional[float]) -> LLMQuotaError:
+        self._rejected[priority] += 1
+        return LLMQuotaError(f"Timed out waiting {timeout:.0f}s for LLM quota")
+
+    def acquire(
+        self,
+        influencer_id: Optional[int] = None,
+        priority: str = "interactive",
+        estimated_tokens: int = 1000,
+        timeout: Optional[float] = -1,
+    ) -> _Ticket:
+        """
+        Blocks until the request is admitted and returns a ticket for release().
+        timeout=-1 uses the priority class default.
+        """
+        if priority not in PRIORITY_WEIGHTS:
+            priority = "interactive"
+        timeout, deadline = self._deadline(priority, timeout)
+        estimated_tokens = max(1, min(estimated_tokens, self.tokens_per_minute))
+
+        with self._cond:
+            while self._queue_full(priority):
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise self._timeout_error(priority, timeout)
+                self._cond.wait(timeout=1.0)
+
+            ticket = self._enqueue(influencer_id, priority, estimated_tokens)
+            try:
+                while True:
+                    wait_s = self._admit_ready()
+                    if ticket.admitted:
+                        return ticket
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._timeout_error(priority, timeout)
+                        wait_s = remaining if wait_s is None else min(wait_s, remaining)
+                    self._cond.wait(timeout=wait_s)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+
+    async def acquire_async(
+        self,
+        influencer_id: Optional[int] = None,
+        priority: str = "interactive",
+        estimated_tokens: int = 1000,
+        timeout: Optional[float] = -1,
+    ) -> _Ticket:
+        """
+        Async acquire(). Waits on the event loop, not in a worker thread; a cancelled
+        caller gives up its place in the queue, or its admission if it raced one.
+        """
+        if priority not in PRIORITY_WEIGHTS:
+            priority = "interactive"
+        timeout, deadline = self._deadline(priority, timeout)
+        estimated_tokens = max(1, min(estimated_tokens, self.tokens_per_minute))
+
+        while True:
+            with self._cond:
+                if not self._queue_full(priority):
+                    ticket = self._enqueue(influencer_id, priority, estimated_tokens)
+                    ticket.loop = asyncio.get_running_loop()
+                    ticket.future = ticket.loop.create_future()
+                    wait_s = self._admit_ready()
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise self._timeout_error(priority, timeout)
+            await asyncio.sleep(1.0)
+
+        try:
+            while not ticket.admitted:
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        with self._cond:
+                            if not ticket.admitted:
+                                raise self._timeout_error(priority, timeout)
+                        break
+                    wait_s = remaining if wait_s is None else min(wait_s, remaining)
+                try:
+                    # Admission by another caller's release resolves the future early
+                    await asyncio.wait_for(asyncio.shield(ticket.future), timeout=wait_s)
+                except asyncio.TimeoutError:
+                    pass
+                with self._cond:
+                    wait_s = self._admit_ready()
+            return ticket
+        except BaseException:
+            with self._cond:
+                self._abandon(ticket)
+            raise
+
+    def _abandon(self, ticket: _Ticket):
+        """Takes a ticket out of the queue, or refunds its window entry if it was already admitted."""
+        if ticket.admitted:
+            if ticket.window_entry in self._window:
+                self._window.remove(ticket.window_entry)
+                self._window_tokens -= ticket.window_entry[1]
+        else:
+            self._waiting = [entry for entry in self._waiting if entry[2] is not ticket]
+            heapq.heapify(self._waiting)
+            self._depth[ticket.priority] -= 1
+        self._admit_ready()
+        self._cond.notify_all()
+
+    def release(self, ticket: _Ticket, actual_tokens: Optional[int] = None):
+        """Reconciles the estimated token count with the provider's usage metadata."""
+        if actual_tokens is None or ticket.window_entry is None:
+            return
+        with self._cond:
+            delta = actual_tokens - ticket.window_entry[1]
+            ticket.window_entry[1] = actual_tokens
+            self._window_tokens += delta
+            if delta < 0:
+                self._admit_ready()
+                self._cond.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            self._trim_window(time.monotonic())
+            return {
+                "requests_last_minute": len(self._window),
+                "tokens_last_minute": self._window_tokens,
+                "requests_per_minute_limit": self.requests_per_minute,
+                "tokens_per_minute_limit": self.tokens_per_minute,
+                "queue_depth": len(self._waiting),
+                "max_queue_depth": self.max_queue_depth,
+                "classes": {
+                    priority: {
+                        "weight": PRIORITY_WEIGHTS[priority],
+                        "queue_depth": self._depth[priority],
+                        "admitted": self._admitted[priority],
+                        "rejected": self._rejected[priority],
+                        "avg_wait_s": round(self._wait_ewma[priority], 3),
+                        "max_wait_s": round(self._wait_max[priority], 3),
+                    }
+                    for priority in PRIORITY_WEIGHTS
+                },
+            }
+
+
+llm_quota = LLMQuotaScheduler(
+    requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000")),
+    max_queue_depth=int(os.getenv("LLM_MAX_QUEUE_DEPTH", "200")),
+)
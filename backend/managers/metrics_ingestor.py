@@ -0,0 +1,232 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database.models import get_db_session, MediaMetric, MetricsRollup, Video, VideoStatus
+
+logger = logging.getLogger(__name__)
+
+LOOKBACK_DAYS = int(os.getenv("METRICS_LOOKBACK_DAYS", "14"))
+# Recent media listed per account in one request; posts outside it are fetched one by one
+BATCH_SIZE = int(os.getenv("METRICS_BATCH_SIZE", "50"))
+# Reach needs one insights request per media and a business account
+FETCH_REACH = os.getenv("METRICS_FETCH_REACH", "false").lower() in ("1", "true", "yes")
+
+COUNTERS = ("likes", "comments", "views", "reach")
+
+
+def _reading(media) -> Dict[str, Optional[int]]:
+    views = getattr(media, "play_count", None) or getattr(media, "view_count", None)
+    return {
+        "likes": int(getattr(media, "like_count", 0) or 0),
+        "comments": int(getattr(media, "comment_count", 0) or 0),
+        "views": int(views) if views is not None else None,
+        "reach": None,
+    }
+
+
+class MetricsIngestor:
+    """
+    Pulls engagement counters for recently posted videos.
+
+    Each account's recent media are listed in one request and matched to
+    videos by media id. A reading is appended to media_metrics only when a
+    counter changed, and the change is added to the influencer's
+    (content type, posting hour) rollup, so analytics read a few rollup rows
+    instead of raw readings or JSON. Video.performance_metrics keeps the
+    latest reading for existing consumers.
+    """
+
+    def __init__(self, client_provider: Optional[Callable[[int], Any]] = None):
+        # client_provider(influencer_id) -> instagrapi-compatible client or None
+        self.client_provider = client_provider
+        # Called after each commit with the rollup changes it made (see _store)
+        self.listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._lock = threading.Lock()
+        self._metrics = {"polls": 0, "requests": 0, "readings": 0, "unchanged": 0, "missing_media": 0}
+
+    def _recent_videos(self, db: Session, influencer_id: Optional[int]) -> Dict[int, List[Video]]:
+        query = (
+            db.query(Video)
+            .filter(Video.media_id.isnot(None))
+            .filter(Video.status == VideoStatus.POSTED)
+            .filter(Video.scheduled_time >= datetime.utcnow() - timedelta(days=LOOKBACK_DAYS))
+        )
+        if influencer_id is not None:
+            query = query.filter(Video.influencer_id == influencer_id)
+        by_influencer: Dict[int, List[Video]] = {}
+        for video in query.order_by(Video.scheduled_time.desc()).all():
+            by_influencer.setdefault(video.influencer_id, []).append(video)
+        return by_influencer
+
+    def poll(self, influencer_id: Optional[int] = None) -> Dict[str, Any]:
+        """Ingests current counters for recent posts of one influencer, or of all influencers."""
+        summary = {"videos": 0, "readings": 0, "skipped_influencers": 0}
+        if self.client_provider is None:
+            return summary
+
+        db = get_db_session()
+        try:
+            for owner_id, videos in self._recent_videos(db, influencer_id).items():
+                client = self.client_provider(owner_id)
+                if client is None:
+                    summary["skipped_influencers"] += 1
+                    continue
+                try:
+                    readings = self._fetch(client, videos)
+                    changes: List[Dict[str, Any]] = []
+                    summary["readings"] += self._store(db, videos, readings, changes)
+                    summary["videos"] += len(readings)
+                    db.commit()
+                    self._notify(changes)
+                except Exception as e:
+                    db.rollback()
+                    summary["skipped_influencers"] += 1
+                    logger.error(f"Metrics poll failed for influencer {owner_id}: {e}")
+        finally:
+            db.close()
+
+        with self._lock:
+            self._metrics["polls"] += 1
+        if summary["readings"]:
+            logger.info(f"Stored {summary['readings']} metric readings across {summary['videos']} posts")
+        return summary
+
+    def _fetch(self, client, videos: List[Video]) -> Dict[int, Dict[str, Optional[int]]]:
+        by_media = {video.media_id: video for video in videos}
+        requests = 1
+        listed = client.user_medias_v1(client.user_id, min(len(videos), BATCH_SIZE))
+        readings: Dict[int, Dict[str, Optional[int]]] = {}
+        for media in listed:
+            video = by_media.get(str(media.id)) or by_media.get(str(media.pk))
+            if video is not None:
+                readings[video.id] = _reading(media)
+
+        missing = [video for video in videos if video.id not in readings]
+        for video in missing:
+            requests += 1
+            try:
+                readings[video.id] = _reading(client.media_info(video.media_id.split("_")[0]))
+            except Exception as e:
+                logger.warning(f"Could not read metrics for media {video.media_id}: {e}")
+
+        if FETCH_REACH:
+            for video in videos:
+                if video.id in readings:
+                    requests += 1
+                    try:
+                        insights = client.insights_media(video.media_id.split("_")[0])
+                        readings[video.id]["reach"] = int(insights.get("reach_count", 0))
+                    except Exception as e:
+                        logger.warning(f"Could not read reach for media {video.media_id}: {e}")
+
+        with self._lock:
+            self._metrics["requests"] += requests
+            self._metrics["missing_media"] += len(videos) - len(readings)
+        return readings
+
+    def _notify(self, changes: List[Dict[str, Any]]):
+        if not changes:
+            return
+        for listener in self.listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error(f"Metrics listener failed: {e}")
+
+    def _store(
+        self, db: Session, videos: List[Video], readings: Dict[int, Dict[str, Optional[int]]],
+        changes: List[Dict[str, Any]],
+    ) -> int:
+        if not readings:
+            return 0
+        latest_ids = (
+            db.query(func.max(MediaMetric.id))
+            .filter(MediaMetric.video_id.in_(list(readings)))
+            .group_by(MediaMetric.video_id)
+        )
+        previous = {row.video_id: row for row in db.query(MediaMetric).filter(MediaMetric.id.in_(latest_ids)).all()}
+        rollups = {
+            (rollup.content_type, rollup.hour_of_day): rollup
+            for rollup in db.query(MetricsRollup).filter(MetricsRollup.influencer_id == videos[0].influencer_id).all()
+        }
+
+        now = datetime.utcnow()
+        stored = 0
+        for video in videos:
+            reading = readings.get(video.id)
+            if reading is None:
+                continue
+            before = previous.get(video.id)
+            if before is not None and all(getattr(before, name) == reading[name] for name in COUNTERS):
+                continue
+            db.add(MediaMetric(video_id=video.id, influencer_id=video.influencer_id, ts=now, **reading))
+            video.performance_metrics = {**reading, "updated_at": now.isoformat()}
+            stored += 1
+
+            key = (video.content_type or "post", video.scheduled_time.hour)
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = MetricsRollup(
+                    influencer_id=video.influencer_id, content_type=key[0], hour_of_day=key[1],
+                    posts=0, likes=0, comments=0, views=0, reach=0,
+                )
+                db.add(rollup)
+                rollups[key] = rollup
+            if before is None:
+                rollup.posts += 1
+            change = {
+                "influencer_id": video.influencer_id, "content_type": key[0], "hour_of_day": key[1],
+                "new_post": before is None,
+            }
+            for name in COUNTERS:
+                delta = (reading[name] or 0) - ((getattr(before, name) or 0) if before is not None else 0)
+                setattr(rollup, name, getattr(rollup, name) + delta)
+                change[name] = delta
+            changes.append(change)
+
+        with self._lock:
+            self._metrics["readings"] += stored
+            self._metrics["unchanged"] += len(readings) - stored
+        return stored
+
+    def performance(self, db: Session, influencer_id: int, content_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Per (content type, posting hour) totals and per-post averages for an influencer."""
+        query = db.query(MetricsRollup).filter(MetricsRollup.influencer_id == influencer_id)
+        if content_type:
+            query = query.filter(MetricsRollup.content_type == content_type)
+        rows = []
+        for rollup in query.order_by(MetricsRollup.content_type, MetricsRollup.hour_of_day).all():
+            posts = rollup.posts or 0
+            row = {"content_type": rollup.content_type, "hour_of_day": rollup.hour_of_day, "posts": posts}
+            for name in COUNTERS:
+                total = getattr(rollup, name) or 0
+                row[name] = total
+                row[f"avg_{name}"] = round(total / posts, 2) if posts else 0.0
+            rows.append(row)
+        return rows
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._metrics)
+
+    def start(self, scheduler, interval_seconds: int, executor: str = "default"):
+        """Registers the poll as an interval job on an APScheduler instance."""
+        scheduler.add_job(
+            self.poll,
+            trigger="interval",
+            seconds=interval_seconds,
+            id="metrics_ingestor_poll",
+            replace_existing=True,
+            max_instances=1,
+            executor=executor,
+        )
+        logger.info(f"Metrics ingestion polling every {interval_seconds}s")
+
+
+metrics_ingestor = MetricsIngestor()
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+from dotenv import load_dotenv
+from google.genai import types
+
+from managers.llm_quota import llm_quota, PRIORITY_WEIGHTS
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Model tiers, cheapest first. Downgrades walk this list towards index 0.
+TIER_ORDER = ["lite", "flash", "pro"]
+
+MODEL_TIERS: Dict[str, str] = {
+    "lite": os.getenv("GEMINI_LITE_MODEL", "models/gemini-2.5-flash-lite"),
+    "flash": os.getenv("GEMINI_FLASH_MODEL", "models/gemini-3-flash-preview"),
+    "pro": os.getenv("GEMINI_PRO_MODEL", "models/gemini-3-pro-preview"),
+}
+
+# max_output_tokens: total output cap. Gemini counts thinking tokens towards it, so it
+# must be the thinking budget plus room for the answer.
+# thinking_budget: 0 disables thinking; must be smaller than max_output_tokens.
+# priority: default quota class (interactive > agent > bulk), overridable per call.
+# context_tokens: budget for life-story context assembled into the task's prompts.
+DEFAULT_ROUTES: Dict[str, Dict[str, Any]] = {
+    "caption": {"tier": "lite", "priority": "bulk", "max_output_tokens": 512, "thinking_budget": 0, "latency_budget_s": 4.0},
+    "sentiment": {"tier": "lite", "priority": "agent", "max_output_tokens": 256, "thinking_budget": 0, "latency_budget_s": 4.0},
+    "summary": {"tier": "lite", "priority": "bulk", "max_output_tokens": 2048, "thinking_budget": 0, "latency_budget_s": 15.0},
+    "scene": {"tier": "flash", "priority": "bulk", "max_output_tokens": 1536, "thinking_budget": 512, "latency_budget_s": 10.0, "context_tokens": 1500},
+    "roi": {"tier": "flash", "priority": "agent", "max_output_tokens": 1536, "thinking_budget": 1024, "latency_budget_s": 8.0},
+    "roi_matrix": {"tier": "flash", "priority": "agent", "max_output_tokens": 3072, "thinking_budget": 1024, "latency_budget_s": 20.0},
+    "verification": {"tier": "flash", "priority": "agent", "max_output_tokens": 1024, "thinking_budget": 512, "latency_budget_s": 30.0},
+    "story_rewrite": {"tier": "flash", "priority": "interactive", "max_output_tokens": 6144, "thinking_budget": 2048, "latency_budget_s": 60.0, "context_tokens": 4000},
+    "life_story": {"tier": "flash", "priority": "interactive", "max_output_tokens": 10240, "thinking_budget": 2048, "latency_budget_s": 60.0},
+    "replan": {"tier": "flash", "priority": "agent", "max_output_tokens": 5120, "thinking_budget": 1024, "latency_budget_s": 30.0, "context_tokens": 2500},
+    "plan": {"tier": "flash", "priority": "bulk", "max_output_tokens": 18432, "thinking_budget": 2048, "latency_budget_s": 120.0, "context_tokens": 2500},
+}
+
+ROUTE_FIELDS = {"tier", "priority", "max_output_tokens", "thinking_budget", "latency_budget_s", "context_tokens"}
+DEFAULT_CONTEXT_TOKENS = 2000
+# Smallest thinking budget accepted by tiers that can't turn thinking off
+MIN_THINKING_BUDGET = 128
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for budgets and quota estimates."""
+    return len(text) // 4 + 1 if text else 0
+
+
+class ModelRouter:
+    """
+    Maps each generation task to a model tier, token limits and thinking budget.
+    Tracks per-task latency and temporarily downgrades a task one tier when its
+    smoothed latency exceeds the task's budget.
+    """
+
+    def __init__(self, ewma_alpha: float = 0.3, min_samples: int = 3, downgrade_cooldown_s: float = 300.0):
+        self.routes: Dict[str, Dict[str, Any]] = {task: dict(route) for task, route in DEFAULT_ROUTES.items()}
+        self.ewma_alpha = ewma_alpha
+        self.min_samples = min_samples
+        self.downgrade_cooldown_s = downgrade_cooldown_s
+
+        self._latency: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+        self._downgraded_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        overrides = os.getenv("MODEL_ROUTES")
+        if overrides:
+            try:
+                for task, fields in json.loads(overrides).items():
+                    self.set_route(task, **fields)
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                logger.error(f"Ignoring invalid MODEL_ROUTES override: {e}")
+
+    def set_route(self, task: str, **fields) -> Dict[str, Any]:
+        """Updates the route for a known task at runtime. Raises KeyError for other tasks."""
+        if task not in DEFAULT_ROUTES:
+            raise KeyError(f"Unknown task: {task}")
+        unknown = set(fields) - ROUTE_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown route fields: {', '.join(sorted(unknown))}")
+        if "tier" in fields and fields["tier"] not in MODEL_TIERS:
+            raise ValueError(f"Unknown model tier: {fields['tier']}")
+        if "priority" in fields and fields["priority"] not in PRIORITY_WEIGHTS:
+            raise ValueError(f"Unknown priority class: {fields['priority']}")
+
+        with self._lock:
+            route = {**self.routes[task], **fields}
+            thinking_budget, max_output_tokens = route.get("thinking_budget"), route.get("max_output_tokens")
+            if thinking_budget is None or max_output_tokens is None or thinking_budget >= max_output_tokens:
+                raise ValueError(
+                    f"thinking_budget ({thinking_budget}) must be smaller than max_output_tokens ({max_output_tokens})"
+                )
+            self.routes[task] = route
+            # A manual change resets any automatic downgrade for the task
+            self._downgraded_until.pop(task, None)
+            self._latency.pop(task, None)
+            self._samples.pop(task, None)
+            logger.info(f"Model route for '{task}' set to {route}")
+            return dict(route)
+
+    def _route(self, task: str) -> Dict[str, Any]:
+        route = self.routes.get(task)
+        if route is None:
+            logger.warning(f"No model route for task '{task}', using 'scene' defaults.")
+            route = self.routes["scene"]
+        return route
+
+    def tier_for(self, task: str) -> str:
+        route = self._route(task)
+        tier = route["tier"]
+        until = self._downgraded_until.get(task)
+        if until:
+            if time.monotonic() < until:
+                index = TIER_ORDER.index(tier)
+                return TIER_ORDER[max(index - 1, 0)]
+            with self._lock:
+                self._downgraded_until.pop(task, None)
+        return tier
+
+    def context_budget(self, task: str) -> int:
+        return self._route(task).get("context_tokens") or DEFAULT_CONTEXT_TOKENS
+
+    def model_for(self, task: str) -> str:
+        return MODEL_TIERS[self.tier_for(task)]
+
+    def resolve(self, task: str, **config_fields) -> Tuple[str, types.GenerateContentConfig]:
+        """
+        Returns (model, GenerateContentConfig) for a task.
+        Extra keyword arguments are passed through to GenerateContentConfig. A max_output_tokens
+        passed here is the room for the answer; the thinking budget is added on top.
+        """
+        route = self._route(task)
+        tier = self.tier_for(task)
+
+        route_thinking = route.get("thinking_budget") or 0
+        answer_tokens = config_fields.pop("max_output_tokens", None) or route["max_output_tokens"] - route_thinking
+        thinking_budget = route_thinking
+        # Tiers that require thinking get the smallest budget rather than an unbounded one
+        if thinking_budget == 0 and tier != "lite":
+            thinking_budget = MIN_THINKING_BUDGET
+        if "thinking_config" not in config_fields:
+            config_fields["thinking_config"] = types.ThinkingConfig(thinking_budget=thinking_budget)
+        config_fields["max_output_tokens"] = answer_tokens + thinking_budget
+
+        return MODEL_TIERS[tier], types.GenerateContentConfig(**config_fields)
+
+    def record_latency(self, task: str, seconds: float):
+        """Updates the latency EWMA for a task and downgrades it if over budget."""
+        route = self._route(task)
+        with self._lock:
+            previous = self._latency.get(task)
+            ewma = seconds if previous is None else self.ewma_alpha * seconds + (1 - self.ewma_alpha) * previous
+            self._latency[task] = ewma
+            self._samples[task] = self._samples.get(task, 0) + 1
+
+            budget = route.get("latency_budget_s")
+            if (
+                budget
+                and ewma > budget
+                and self._samples[task] >= self.min_samples
+                and task not in self._downgraded_until
+                and TIER_ORDER.index(route["tier"]) > 0
+            ):
+                self._downgraded_until[task] = time.monotonic() + self.downgrade_cooldown_s
+                self._samples[task] = 0
+                logger.warning(
+                    f"Task '{task}' latency {ewma:.1f}s exceeds budget {budget:.1f}s. "
+                    f"Downgrading for {self.downgrade_cooldown_s:.0f}s."
+                )
+
+    def _estimate_tokens(self, contents, config: types.GenerateContentConfig) -> int:
+        # Plus a share of the output allowance
+        return estimate_tokens(str(contents)) + (config.max_output_tokens or 1024) // 4
+
+    @staticmethod
+    def _usage_tokens(response) -> Optional[int]:
+        usage = getattr(response, "usage_metadata", None)
+        return getattr(usage, "total_token_count", None) if usage else None
+
+    def generate(
+        self,
+        client,
+        task: str,
+        contents,
+        influencer_id: Optional[int] = None,
+        priority: Optional[str] = None,
+        **config_fields,
+    ):
+        """Synchronous generate_content call routed by task and admitted by the quota scheduler."""
+        model, config = self.resolve(task, **config_fields)
+        ticket = llm_quota.acquire(
+            influencer_id,
+            priority or self._route(task).get("priority", "interactive"),
+            self._estimate_tokens(contents, config),
+        )
+        start = time.monotonic()
+        response = client.models.generate_content(model=model, contents=contents, config=config)
+        self.record_latency(task, time.monotonic() - start)
+        llm_quota.release(ticket, self._usage_tokens(response))
+        return response
+
+    def generate_stream(
+        self,
+        client,
+        task: str,
+        contents,
+        influencer_id: Optional[int] = None,
+        priority: Optional[str] = None,
+        **config_fields,
+    ) -> Iterator[str]:
+        """Streaming generate_content call routed by task. Yields text chunks as they arrive."""
+        model, config = self.resolve(task, **config_fields)
+        ticket = llm_quota.acquire(
+            influencer_id,
+            priority or self._route(task).get("priority", "interactive"),
+            self._estimate_tokens(contents, config),
+        )
+        start = time.monotonic()
+        usage_tokens = None
+        try:
+            for chunk in client.models.generate_content_stream(model=model, contents=contents, config=config):
+                usage_tokens = self._usage_tokens(chunk) or usage_tokens
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            self.record_latency(task, time.monotonic() - start)
+            llm_quota.release(ticket, usage_tokens)
+
+    async def agenerate(
+        self,
+        client,
+        task: str,
+        contents,
+        influencer_id: Optional[int] = None,
+        priority: Optional[str] = None,
+        **config_fields,
+    ):
+        """Async generate_content call routed by task and admitted by the quota scheduler."""
+        model, config = self.resolve(task, **config_fields)
+        ticket = await llm_quota.acquire_async(
+            influencer_id,
+            priority or self._route(task).get("priority", "interactive"),
+            self._estimate_tokens(contents, config),
+        )
+        start = time.monotonic()
+        response = await client.aio.models.generate_content(model=model, contents=contents, config=config)
+        self.record_latency(task, time.monotonic() - start)
+        llm_quota.release(ticket, self._usage_tokens(response))
+        return response
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current routing table with live latency and downgrade state."""
+        now = time.monotonic()
+        snapshot = {}
+        with self._lock:
+            for task, route in self.routes.items():
+                tier = route["tier"]
+                if self._downgraded_until.get(task, 0) > now:
+                    tier = TIER_ORDER[max(TIER_ORDER.index(tier) - 1, 0)]
+                snapshot[task] = {
+                    **route,
+                    "model": MODEL_TIERS[tier],
+                    "effective_tier": tier,
+                    "latency_ewma_s": round(self._latency[task], 3) if task in self._latency else None,
+                }
+        return snapshot
+
+
+model_router = ModelRouter()
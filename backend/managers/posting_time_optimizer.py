@@ -0,0 +1,212 @@
+import os
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from database.models import get_db_session, MetricsRollup
+from managers.calendar_index import calendar_index, CalendarIndex
+
+logger = logging.getLogger(__name__)
+
+FIRST_HOUR, LAST_HOUR = (int(part) for part in os.getenv("POSTING_HOURS", "9-21").split("-"))
+# Posts of evidence a slot needs before its own average outweighs the prior
+PRIOR_POSTS = float(os.getenv("POSTING_PRIOR_POSTS", "3"))
+# Bonus for rarely used slots, as a share of the influencer's mean engagement
+EXPLORATION = float(os.getenv("POSTING_EXPLORATION", "0.2"))
+# Planned posts are never booked closer to now than this
+MIN_LEAD = timedelta(minutes=1)
+
+CONTENT_TYPES = ("post", "story", "reel")
+COUNTERS = ("likes", "comments", "views", "reach")
+HOURS = 24
+
+# Relative engagement by hour used before an influencer has any metrics:
+# low overnight, a lunchtime bump and an evening peak.
+DEFAULT_CURVE = np.array(
+    [0.3, 0.2, 0.15, 0.1, 0.1, 0.15, 0.3, 0.5, 0.65, 0.7, 0.7, 0.8,
+     0.9, 0.85, 0.7, 0.65, 0.7, 0.8, 0.9, 1.0, 1.0, 0.95, 0.75, 0.5],
+    dtype=np.float64,
+)
+_SMOOTHING = (0.25, 0.5, 0.25)
+
+
+class _Curves:
+    """Per-influencer rollup arrays: sums[type, hour, counter] and posts[type, hour]."""
+
+    def __init__(self):
+        self.sums = np.zeros((len(CONTENT_TYPES), HOURS, len(COUNTERS)), dtype=np.float64)
+        self.posts = np.zeros((len(CONTENT_TYPES), HOURS), dtype=np.float64)
+        self.ranked: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}  # type -> (score by hour, hours best first)
+
+
+def _type_index(content_type: Optional[str]) -> int:
+    return CONTENT_TYPES.index(content_type) if content_type in CONTENT_TYPES else 0
+
+
+class PostingTimeOptimizer:
+    """
+    Engagement-by-hour curves per influencer and content type.
+
+    Curves start from the metrics rollups and are updated in place by
+    observe() as new metrics arrive. A slot's expected engagement is its
+    own average shrunk towards the influencer's all-type average for that
+    hour (itself shrunk towards the default curve), smoothed over neighbouring
+    hours, plus a small bonus for slots with few posts so the planner keeps
+    learning. The hours ranked by that score are cached until the next
+    observation, so picking a time is a scan of at most 24 cached hours.
+    """
+
+    def __init__(self):
+        self._curves: Dict[int, _Curves] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, influencer_id: int) -> _Curves:
+        curves = _Curves()
+        db = get_db_session()
+        try:
+            rows = db.query(MetricsRollup).filter(MetricsRollup.influencer_id == influencer_id).all()
+        finally:
+            db.close()
+        if rows:
+            types = np.array([_type_index(row.content_type) for row in rows])
+            hours = np.array([row.hour_of_day % HOURS for row in rows])
+            values = np.array([[getattr(row, name) or 0 for name in COUNTERS] for row in rows], dtype=np.float64)
+            np.add.at(curves.sums, (types, hours), values)
+            np.add.at(curves.posts, (types, hours), np.array([row.posts or 0 for row in rows], dtype=np.float64))
+        return curves
+
+    def _get(self, influencer_id: int) -> _Curves:
+        with self._lock:
+            curves = self._curves.get(influencer_id)
+        if curves is None:
+            curves = self._load(influencer_id)
+            with self._lock:
+                curves = self._curves.setdefault(influencer_id, curves)
+        return curves
+
+    def observe(self, changes: Iterable[Dict[str, Any]]):
+        """
+        Applies rollup changes from the metrics ingester: dicts with influencer_id,
+        content_type, hour_of_day, new_post and per-counter deltas.
+        Influencers whose curves aren't loaded yet read them from the rollups later.
+        """
+        with self._lock:
+            for change in changes:
+                curves = self._curves.get(change["influencer_id"])
+                if curves is None:
+                    continue
+                t, h = _type_index(change["content_type"]), change["hour_of_day"] % HOURS
+                curves.sums[t, h] += [change.get(name, 0) or 0 for name in COUNTERS]
+                if change.get("new_post"):
+                    curves.posts[t, h] += 1
+                curves.ranked.clear()
+
+    @staticmethod
+    def _engagement(sums: np.ndarray) -> np.ndarray:
+        """Reach when the influencer has any, else views, else likes + comments."""
+        reach, views = sums[..., 3], sums[..., 2]
+        if reach.sum() > 0:
+            return reach
+        if views.sum() > 0:
+            return views
+        return sums[..., 0] + sums[..., 1]
+
+    def _rank(self, curves: _Curves, t: int) -> Tuple[np.ndarray, np.ndarray]:
+        ranked = curves.ranked.get(t)
+        if ranked is not None:
+            return ranked
+
+        values = self._engagement(curves.sums)  # (type, hour)
+        posts = curves.posts
+        all_values, all_posts = values.sum(axis=0), posts.sum(axis=0)
+        total_posts = all_posts.sum()
+        mean = all_values.sum() / total_posts if total_posts else 1.0
+        prior = DEFAULT_CURVE / DEFAULT_CURVE.mean() * mean
+        by_hour = (all_values + PRIOR_POSTS * prior) / (all_posts + PRIOR_POSTS)
+        expected = (values[t] + PRIOR_POSTS * by_hour) / (posts[t] + PRIOR_POSTS)
+        smoothed = sum(weight * np.roll(expected, shift) for weight, shift in zip(_SMOOTHING, (1, 0, -1)))
+        score = smoothed + EXPLORATION * mean / np.sqrt(posts[t] + 1)
+
+        allowed = np.arange(FIRST_HOUR, LAST_HOUR + 1) % HOURS
+        order = allowed[np.argsort(-score[allowed], kind="stable")]
+        ranked = (score, order)
+        with self._lock:
+            curves.ranked[t] = ranked
+        return ranked
+
+    def scores(self, influencer_id: int, content_type: str) -> np.ndarray:
+        return self._rank(self._get(influencer_id), _type_index(content_type))[0]
+
+    def best_hours(self, influencer_id: int, content_type: str) -> List[int]:
+        return [int(hour) for hour in self._rank(self._get(influencer_id), _type_index(content_type))[1]]
+
+    def curve(self, influencer_id: int, content_type: str) -> Dict[str, Any]:
+        curves = self._get(influencer_id)
+        t = _type_index(content_type)
+        score, order = self._rank(curves, t)
+        return {
+            "content_type": CONTENT_TYPES[t],
+            "best_hours": [int(hour) for hour in order[:5]],
+            "hours": [
+                {"hour": hour, "score": round(float(score[hour]), 2), "posts": int(curves.posts[t, hour])}
+                for hour in range(HOURS)
+            ],
+        }
+
+    def planner(self, influencer_id: int) -> "SlotPlanner":
+        return SlotPlanner(self, influencer_id)
+
+
+class SlotPlanner:
+    """
+    Picks posting times for one influencer and books them in the calendar index,
+    so later picks (in this run or another planner) keep their distance.
+    """
+
+    def __init__(self, optimizer: PostingTimeOptimizer, influencer_id: int, calendar: CalendarIndex = calendar_index):
+        self.optimizer = optimizer
+        self.influencer_id = influencer_id
+        self.calendar = calendar
+
+    def reserve(self, when: datetime) -> datetime:
+        """Books `when`, or the next free time after it, but never in the past."""
+        return self.calendar.book(self.influencer_id, max(when, self._earliest()))
+
+    def _earliest(self) -> datetime:
+        return datetime.now() + MIN_LEAD
+
+    def best_time(self, day: datetime, content_type: str) -> datetime:
+        """
+        The best-scoring future hour of `day` that keeps the calendar's spacing, with a random minute.
+        Falls back to the next free time after the best hour.
+        """
+        hours = self.optimizer.best_hours(self.influencer_id, content_type)
+        minute = random.randint(0, 59)
+        candidates = [day.replace(hour=hour, minute=minute, second=0, microsecond=0) for hour in hours]
+        earliest = self._earliest()
+        for candidate in candidates:
+            if candidate >= earliest and self.calendar.try_book(self.influencer_id, candidate):
+                return candidate
+        return self.reserve(candidates[0])
+
+    def nudge(self, when: datetime, content_type: str, window_minutes: int = 30) -> datetime:
+        """Moves `when` by up to window_minutes (in 15-minute steps) towards a better free future hour."""
+        scores = self.optimizer.scores(self.influencer_id, content_type)
+        offsets = range(-window_minutes, window_minutes + 1, 15)
+        earliest = self._earliest()
+        moves = (when + timedelta(minutes=offset) for offset in offsets)
+        candidates = sorted(
+            (candidate for candidate in moves if candidate >= earliest),
+            key=lambda candidate: (-scores[candidate.hour], abs(candidate - when)),
+        )
+        for candidate in candidates:
+            if self.calendar.try_book(self.influencer_id, candidate):
+                return candidate
+        return self.reserve(when)
+
+
+posting_time_optimizer = PostingTimeOptimizer()
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from managers.ai_generator import ai_generator
+from managers.model_router import model_router
+
+logger = logging.getLogger(__name__)
+
+TTL_SECONDS = float(os.getenv("ROI_MATRIX_TTL_MINUTES", "360")) * 60
+MAX_PERSONAS = int(os.getenv("ROI_MATRIX_MAX_PERSONAS", "8"))
+MAX_TRENDS = int(os.getenv("ROI_MATRIX_MAX_TRENDS", "25"))
+CACHE_SIZE = int(os.getenv("ROI_MATRIX_CACHE_SIZE", "20000"))
+
+# Same gate the single-trend ROI prompt used: 8+ is worth a Veo video.
+VIDEO_THRESHOLD = 8.0
+
+
+def persona_digest(influencer) -> Dict[str, Any]:
+    """The few persona fields the ROI decision depends on, kept short for batched prompts."""
+    persona = influencer.persona or {}
+    targeting = influencer.audience_targeting or {}
+    digest = {
+        "name": influencer.name,
+        "tone": persona.get("tone", "Modern"),
+        "goals": list(persona.get("goals", []))[:3],
+        "interests": list(targeting.get("interests", []))[:5],
+    }
+    return {key: value for key, value in digest.items() if value}
+
+
+def decision(score: float) -> Dict[str, Any]:
+    score = max(0.0, min(10.0, float(score)))
+    return {
+        "score": score,
+        "action": "VEO_VIDEO" if score >= VIDEO_THRESHOLD else "TEXT_POST",
+        "reasoning": "Batched ROI matrix",
+    }
+
+
+class RoiMatrix:
+    """
+    Scores trends for many personas in one structured call per chunk.
+
+    Influencers are reduced to persona digests and de-duplicated by persona
+    hash; trends are de-duplicated by key. Each call covers up to
+    MAX_PERSONAS x MAX_TRENDS cells and returns a score matrix. Cells are
+    cached per (persona hash, trend key) for TTL_SECONDS; a persona pivot
+    changes the hash, and invalidate_persona() drops the old rows.
+    """
+
+    def __init__(self, ttl_seconds: float = TTL_SECONDS, cache_size: int = CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"calls": 0, "cells_scored": 0, "cache_hits": 0, "failed_calls": 0}
+
+    def cached(self, persona: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._cache.get((persona, key))
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._cache[(persona, key)]
+                return None
+            self._cache.move_to_end((persona, key))
+            return value
+
+    def _store(self, persona: str, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._cache[(persona, key)] = (time.monotonic() + self.ttl_seconds, value)
+            self._cache.move_to_end((persona, key))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def invalidate_persona(self, persona: str) -> int:
+        with self._lock:
+            stale = [cell for cell in self._cache if cell[0] == persona]
+            for cell in stale:
+                del self._cache[cell]
+        return len(stale)
+
+    async def score(
+        self,
+        personas: Dict[str, Dict[str, Any]],
+        trends: Dict[str, str],
+        cells: Optional[Sequence[Tuple[str, str]]] = None,
+        influencer_id: Optional[int] = None,
+    ) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        Decisions for (persona hash, trend key) cells.
+        `personas` maps hash -> digest, `trends` maps key -> title; `cells`
+        defaults to the full cross product. Cached cells are not re-scored;
+        cells whose call failed are missing from the result, and cells a
+        shared call scored on the side are included.
+        """
+        wanted = list(cells) if cells is not None else [(p, t) for p in personas for t in trends]
+        results: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        missing: Dict[str, List[str]] = {}
+        for persona, key in wanted:
+            hit = self.cached(persona, key)
+            if hit is not None:
+                results[(persona, key)] = hit
+            else:
+                missing.setdefault(persona, [])
+                if key not in missing[persona]:
+                    missing[persona].append(key)
+        with self._lock:
+            self._metrics["cache_hits"] += len(results)
+        if not missing:
+            return results
+
+        if not ai_generator.client:
+            # Same neutral fallback as the single-trend path; not cached
+            for persona, keys in missing.items():
+                for key in keys:
+                    results[(persona, key)] = {"score": 5.0, "action": "TEXT_POST", "reasoning": "AI Unavailable"}
+            return results
+
+        for persona_chunk, trend_chunk in self._chunks(missing):
+            matrix = await self._score_chunk(
+                [personas[p] for p in persona_chunk], [trends[t] for t in trend_chunk], influencer_id
+            )
+            if matrix is None:
+                continue
+            for row, persona in enumerate(persona_chunk):
+                for col, key in enumerate(trend_chunk):
+                    value = decision(matrix[row][col])
+                    self._store(persona, key, value)
+                    results[(persona, key)] = value
+        return results
+
+    @staticmethod
+    def _chunks(missing: Dict[str, List[str]]):
+        """Groups personas that need the same trends, then tiles them into MAX_PERSONAS x MAX_TRENDS blocks."""
+        by_trends: Dict[Tuple[str, ...], List[str]] = {}
+        for persona, keys in missing.items():
+            by_trends.setdefault(tuple(sorted(keys)), []).append(persona)
+        # Personas needing different trend sets share calls over the union of their trends
+        groups: List[Tuple[List[str], List[str]]] = []
+        for keys, persona_group in sorted(by_trends.items(), key=lambda item: -len(item[1])):
+            for start in range(0, len(persona_group), MAX_PERSONAS):
+                groups.append((persona_group[start:start + MAX_PERSONAS], list(keys)))
+        merged: List[Tuple[List[str], List[str]]] = []
+        for persona_group, keys in groups:
+            if merged:
+                last_personas, last_keys = merged[-1]
+                union = last_keys + [key for key in keys if key not in last_keys]
+                if len(last_personas) + len(persona_group) <= MAX_PERSONAS and len(union) <= MAX_TRENDS:
+                    merged[-1] = (last_personas + persona_group, union)
+                    continue
+            merged.append((persona_group, keys))
+        for persona_group, keys in merged:
+            for start in range(0, len(keys), MAX_TRENDS):
+                yield persona_group, keys[start:start + MAX_TRENDS]
+
+    async def _score_chunk(
+        self, digests: List[Dict[str, Any]], titles: List[str], influencer_id: Optional[int]
+    ) -> Optional[List[List[float]]]:
+        personas_block = "\n".join(f"P{i}: {json.dumps(digest)}" for i, digest in enumerate(digests))
+        trends_block = "\n".join(f"T{j}: {json.dumps(title)}" for j, title in enumerate(titles))
+        prompt = f"""
+        Score the ViralPotential (0-10) of each trend for each persona's audience.
+        Consider fit with the persona's tone, goals and interests, engagement potential and novelty.
+
+        Personas:
+        {personas_block}
+
+        Trends:
+        {trends_block}
+
+        Return JSON: {{"scores": [[P0T0, P0T1, ...], [P1T0, P1T1, ...], ...]}}
+        with exactly {len(digests)} rows (one per persona, in order) of {len(titles)} numbers (one per trend, in order).
+        """
+
+        with self._lock:
+            self._metrics["calls"] += 1
+        try:
+            response = await model_router.agenerate(
+                ai_generator.client, "roi_matrix", prompt,
+                influencer_id=influencer_id, response_mime_type="application/json"
+            )
+            matrix = json.loads(response.text).get("scores")
+            if (
+                not isinstance(matrix, list) or len(matrix) != len(digests)
+                or any(not isinstance(row, list) or len(row) != len(titles) for row in matrix)
+            ):
+                raise ValueError(f"expected a {len(digests)}x{len(titles)} matrix")
+            matrix = [[float(value) for value in row] for row in matrix]
+        except Exception as e:
+            with self._lock:
+                self._metrics["failed_calls"] += 1
+            logger.error(f"ROI matrix call failed ({len(digests)}x{len(titles)}): {e}")
+            return None
+
+        with self._lock:
+            self._metrics["cells_scored"] += len(digests) * len(titles)
+        logger.info(f"Scored ROI matrix {len(digests)} personas x {len(titles)} trends in one call")
+        return matrix
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._metrics, "cached_cells": len(self._cache)}
+
+
+roi_matrix = RoiMatrix()
@@ -1,14 +1,32 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.jobstores.base import JobLookupError
 from datetime import datetime
+from typing import List
+import os
 import logging
 from database.models import Schedule, Video, VideoStatus, get_db_session
 
 logger = logging.getLogger(__name__)
 
+# Executor for jobs that can run for minutes (LLM planning, account-wide API sweeps, retrying
+# workflows), so they never hold the threads that post scheduled videos on time.
+LONG_EXECUTOR = "long"
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "10"))
+SCHEDULER_LONG_WORKERS = int(os.getenv("SCHEDULER_LONG_WORKERS", "4"))
+# A dispatch that starts late (busy pool, process paused) still posts within this window
+DISPATCH_MISFIRE_GRACE_SECONDS = int(os.getenv("DISPATCH_MISFIRE_GRACE_SECONDS", "3600"))
+
 class VideoScheduler:
     def __init__(self):
-        self.scheduler = BackgroundScheduler()
+        self.scheduler = BackgroundScheduler(
+            executors={
+                "default": ThreadPoolExecutor(SCHEDULER_WORKERS),
+                LONG_EXECUTOR: ThreadPoolExecutor(SCHEDULER_LONG_WORKERS),
+            },
+            job_defaults={"coalesce": True, "misfire_grace_time": 60},
+        )
         self.scheduler.start()
         logger.info("Video scheduler initialized and started")
 
@@ -23,7 +41,9 @@ class VideoScheduler:
             trigger=trigger,
             args=[schedule_id],
             id=job_id,
-            replace_existing=True
+            replace_existing=True,
+            coalesce=True,
+            misfire_grace_time=DISPATCH_MISFIRE_GRACE_SECONDS,
         )
         
         logger.info(f"Scheduled video job {job_id} at {run_at}")
@@ -77,6 +97,18 @@ class VideoScheduler:
         except Exception as e:
             logger.error(f"Error cancelling job {job_id}: {e}")
 
+    def cancel_schedules(self, job_ids: List[str]) -> int:
+        """Cancel many jobs in one pass. Missing jobs are ignored. Returns the number removed."""
+        removed = 0
+        for job_id in job_ids:
+            try:
+                self.scheduler.remove_job(job_id)
+                removed += 1
+            except JobLookupError:
+                continue
+        logger.info(f"Cancelled {removed} of {len(job_ids)} scheduled jobs")
+        return removed
+
     def shutdown(self):
         """Shutdown the scheduler."""
         self.scheduler.shutdown()
@@ -0,0 +1,209 @@
+import os
+import re
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Valence of common comment vocabulary, -1.0 (hostile) to 1.0 (delighted).
+LEXICON: Dict[str, float] = {
+    # positive
+    "love": 0.8, "loved": 0.8, "loving": 0.7, "amazing": 0.9, "awesome": 0.8, "great": 0.6,
+    "good": 0.4, "nice": 0.4, "beautiful": 0.7, "gorgeous": 0.7, "stunning": 0.8, "wow": 0.6,
+    "incredible": 0.8, "inspiring": 0.7, "inspired": 0.6, "cool": 0.4, "fire": 0.6, "goat": 0.7,
+    "iconic": 0.6, "obsessed": 0.6, "best": 0.7, "perfect": 0.8, "brilliant": 0.8, "fantastic": 0.8,
+    "happy": 0.6, "glad": 0.5, "fun": 0.5, "funny": 0.5, "lol": 0.3, "haha": 0.3, "cute": 0.5,
+    "wholesome": 0.6, "genius": 0.7, "underrated": 0.4, "thanks": 0.4, "thank": 0.4, "proud": 0.6,
+    "excited": 0.6, "interesting": 0.4, "helpful": 0.5, "yes": 0.2, "queen": 0.5, "king": 0.5,
+    "❤️": 0.8, "❤": 0.8, "😍": 0.8, "🔥": 0.6, "😂": 0.4, "👏": 0.6, "🙌": 0.6, "💯": 0.6, "😊": 0.5,
+    # negative
+    "hate": -0.8, "hated": -0.8, "awful": -0.8, "terrible": -0.8, "horrible": -0.8, "bad": -0.5,
+    "worst": -0.9, "ugly": -0.6, "trash": -0.8, "garbage": -0.8, "cringe": -0.6, "fake": -0.6,
+    "annoying": -0.6, "disappointing": -0.6, "disappointed": -0.6, "sad": -0.3, "unfollow": -0.8,
+    "unfollowing": -0.8, "sellout": -0.7, "stop": -0.3, "ridiculous": -0.5, "stupid": -0.7,
+    "scam": -0.9, "lame": -0.5, "gross": -0.6, "wrong": -0.4, "ew": -0.5,
+    "👎": -0.6, "😡": -0.8, "🤮": -0.8, "🙄": -0.4,
+}
+
+# Disengagement rather than hostility; mapped to the 'Bored' mood.
+BORED_TERMS: Dict[str, float] = {
+    "boring": -0.5, "bored": -0.5, "meh": -0.3, "mid": -0.3, "okay": -0.05, "ok": -0.05,
+    "repetitive": -0.4, "again": -0.1, "same": -0.15, "yawn": -0.4, "whatever": -0.3,
+    "anymore": -0.3, "stale": -0.4, "tired": -0.3, "guess": -0.1, "😴": -0.4, "🥱": -0.4,
+}
+
+NEGATORS = {"not", "no", "never", "isn't", "wasn't", "don't", "doesn't", "didn't", "can't", "won't", "aint", "ain't"}
+INTENSIFIERS = {"so": 1.3, "very": 1.3, "really": 1.2, "super": 1.3, "absolutely": 1.4, "totally": 1.3, "too": 1.1}
+NEGATION_WINDOW = 3
+
+_TOKEN = re.compile(r"[a-z][a-z']*|[\U0001F300-\U0001FAFF☀-➿]️?")
+
+MOODS = ("Positive", "Neutral", "Bored", "Negative")
+
+
+@dataclass
+class BatchSentiment:
+    """Local scoring result for one batch of comments."""
+    mood: str
+    score: float        # mean comment valence, -1.0 to 1.0
+    spread: float       # standard deviation of comment valence
+    coverage: float     # share of comments with at least one lexicon hit
+    bored_share: float  # share of comments dominated by boredom terms
+    ambiguous: bool
+    comments: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "mood": self.mood,
+            "score": round(self.score, 3),
+            "spread": round(self.spread, 3),
+            "coverage": round(self.coverage, 3),
+            "bored_share": round(self.bored_share, 3),
+            "ambiguous": self.ambiguous,
+            "comments": self.comments,
+        }
+
+
+class SentimentScorer:
+    """
+    Lexicon sentiment for audience comments, scored on CPU with numpy.
+
+    Each token is looked up once in a vocabulary table; per-comment valence,
+    boredom and hit counts are then summed for all comments of all batches in
+    a single np.bincount pass. A batch whose comments mostly miss the lexicon,
+    disagree strongly, or land next to a mood boundary is flagged `ambiguous`
+    so the caller can fall back to the LLM for it.
+    """
+
+    def __init__(
+        self,
+        mood_threshold: float = 0.2,
+        boundary_margin: float = 0.05,
+        min_coverage: float = 0.5,
+        max_spread: float = 0.5,
+        bored_share: float = 0.34,
+    ):
+        self.mood_threshold = mood_threshold
+        self.boundary_margin = boundary_margin
+        self.min_coverage = min_coverage
+        self.max_spread = max_spread
+        self.bored_share = bored_share
+
+        vocabulary = list(LEXICON) + [term for term in BORED_TERMS if term not in LEXICON]
+        self._ids = {term: i for i, term in enumerate(vocabulary)}
+        self._valence = np.array([LEXICON.get(t, BORED_TERMS.get(t, 0.0)) for t in vocabulary], dtype=np.float64)
+        self._bored = np.array([1.0 if t in BORED_TERMS else 0.0 for t in vocabulary], dtype=np.float64)
+
+        self._lock = threading.Lock()
+        self._metrics = {"batches": 0, "comments": 0, "ambiguous": 0}
+
+    def _encode(self, comments: Sequence[str], offset: int, rows: List[int], ids: List[int], weights: List[float]):
+        """Appends (comment row, vocabulary id, negation/intensity weight) for every lexicon hit."""
+        for row, comment in enumerate(comments, start=offset):
+            negate_until = -1
+            boost = 1.0
+            for position, token in enumerate(_TOKEN.findall((comment or "").lower())):
+                if token in NEGATORS:
+                    negate_until = position + NEGATION_WINDOW
+                    continue
+                if token in INTENSIFIERS:
+                    boost = INTENSIFIERS[token]
+                    continue
+                term_id = self._ids.get(token)
+                if term_id is None:
+                    continue
+                rows.append(row)
+                ids.append(term_id)
+                weights.append((-0.75 if position <= negate_until else 1.0) * boost)
+                boost = 1.0
+
+    def score_comments(self, comments: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Per-comment valence (-1..1), boredom weight and lexicon hit count."""
+        rows: List[int] = []
+        ids: List[int] = []
+        weights: List[float] = []
+        self._encode(comments, 0, rows, ids, weights)
+        return self._aggregate(len(comments), rows, ids, weights)
+
+    def _aggregate(self, n: int, rows: List[int], ids: List[int], weights: List[float]) -> Dict[str, np.ndarray]:
+        row_arr = np.asarray(rows, dtype=np.int64)
+        id_arr = np.asarray(ids, dtype=np.int64)
+        weight_arr = np.asarray(weights, dtype=np.float64)
+
+        raw = np.bincount(row_arr, weights=self._valence[id_arr] * weight_arr, minlength=n)
+        bored = np.bincount(row_arr, weights=self._bored[id_arr], minlength=n)
+        hits = np.bincount(row_arr, minlength=n).astype(np.float64)
+        # Squash summed valence into -1..1 so long comments don't dominate
+        valence = raw / np.sqrt(raw * raw + 1.0)
+        return {"valence": valence, "bored": bored, "hits": hits}
+
+    def score_batches(self, batches: Sequence[Sequence[str]]) -> List[BatchSentiment]:
+        """Scores many comment batches (e.g. one per influencer) in one vectorized pass."""
+        rows: List[int] = []
+        ids: List[int] = []
+        weights: List[float] = []
+        sizes = []
+        offset = 0
+        for comments in batches:
+            self._encode(comments, offset, rows, ids, weights)
+            sizes.append(len(comments))
+            offset += len(comments)
+
+        scored = self._aggregate(offset, rows, ids, weights)
+        valence, bored, hits = scored["valence"], scored["bored"], scored["hits"]
+        batch_of = np.repeat(np.arange(len(sizes)), sizes)
+        counts = np.maximum(np.asarray(sizes, dtype=np.float64), 1.0)
+
+        means = np.bincount(batch_of, weights=valence, minlength=len(sizes)) / counts
+        squares = np.bincount(batch_of, weights=valence * valence, minlength=len(sizes)) / counts
+        spreads = np.sqrt(np.maximum(squares - means * means, 0.0))
+        coverage = np.bincount(batch_of, weights=(hits > 0).astype(np.float64), minlength=len(sizes)) / counts
+        bored_share = np.bincount(
+            batch_of, weights=((bored > 0) & (bored * 2 >= hits)).astype(np.float64), minlength=len(sizes)
+        ) / counts
+
+        results = []
+        for i, size in enumerate(sizes):
+            results.append(self._classify(float(means[i]), float(spreads[i]), float(coverage[i]), float(bored_share[i]), size))
+
+        with self._lock:
+            self._metrics["batches"] += len(results)
+            self._metrics["comments"] += offset
+            self._metrics["ambiguous"] += sum(1 for r in results if r.ambiguous)
+        return results
+
+    def score_batch(self, comments: Sequence[str]) -> BatchSentiment:
+        return self.score_batches([comments])[0]
+
+    def _classify(self, mean: float, spread: float, coverage: float, bored_share: float, size: int) -> BatchSentiment:
+        if size == 0:
+            return BatchSentiment("Neutral", 0.0, 0.0, 0.0, 0.0, False, 0)
+
+        if bored_share >= self.bored_share and mean < self.mood_threshold:
+            mood = "Bored"
+        elif mean >= self.mood_threshold:
+            mood = "Positive"
+        elif mean <= -self.mood_threshold:
+            mood = "Negative"
+        else:
+            mood = "Neutral"
+
+        near_boundary = abs(abs(mean) - self.mood_threshold) < self.boundary_margin
+        ambiguous = coverage < self.min_coverage or spread > self.max_spread or near_boundary
+        return BatchSentiment(mood, mean, spread, coverage, bored_share, ambiguous, size)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["ambiguous_rate"] = round(metrics["ambiguous"] / metrics["batches"], 3) if metrics["batches"] else None
+        return metrics
+
+
+sentiment_scorer = SentimentScorer(
+    min_coverage=float(os.getenv("SENTIMENT_MIN_COVERAGE", "0.5")),
+    max_spread=float(os.getenv("SENTIMENT_MAX_SPREAD", "0.5")),
+)
@@ -0,0 +1,198 @@
+import os
+import re
+import math
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Phrases that usually mark a change in a character's life, with their weight.
+LIFE_EVENT_PATTERNS: Dict[str, float] = {
+    r"\b(moved|moving|relocat\w*) (to|out|away|back)\b": 1.5,
+    r"\b(new|dream|first) (job|apartment|home|house|city|chapter|business|company|role)\b": 1.2,
+    r"\b(got|getting|am|i'm) (engaged|married|divorced|pregnant|fired|hired|promoted|dumped)\b": 2.0,
+    r"\b(engage\w*|married|wedding|divorce\w*|pregnan\w*|proposal|proposed)\b": 1.5,
+    r"\b(broke up|breakup|break-up|split up|separated)\b": 1.8,
+    r"\b(passed away|died|funeral|death|lost my|losing my|grief|mourning)\b": 2.0,
+    r"\b(born|baby|adopt\w*)\b": 1.2,
+    r"\b(hospital|diagnos\w*|surgery|accident|injur\w*|recovery|rehab)\b": 1.5,
+    r"\b(quit|resign\w*|laid off|fired|retir\w*|graduat\w*|enrolled|accepted (to|into))\b": 1.5,
+    r"\b(launch\w*|founded|signed|record deal|book deal|won|award|championship)\b": 1.0,
+    r"\b(grant|funding|funded|investors?|raised|hiring|hired|acquired|bankrupt\w*)\b": 1.2,
+    r"\b(closing|closed|shut(ting)? down|shutting|sold|selling)\b": 1.2,
+    r"\b(reunit\w*|showed up|came back|after \d+ years|after (ten|twenty|thirty) years|first time in)\b": 1.2,
+    r"\b(announce\w*|big news|life update|never thought|changed everything|turning point)\b": 0.8,
+    r"\b(leaving|left|goodbye|farewell|last day|starting over|fresh start)\b": 1.0,
+}
+
+# Everyday content that rarely changes the narrative.
+TRIVIAL_TERMS: Set[str] = {
+    "coffee", "latte", "brunch", "breakfast", "lunch", "dinner", "snack", "sandwich", "pizza",
+    "sunset", "sunrise", "weather", "sunny", "rainy", "vibes", "mood", "outfit", "ootd", "selfie",
+    "gym", "workout", "leg", "cardio", "yoga", "walk", "stroll", "chill", "chilling", "relaxing",
+    "weekend", "monday", "friday", "throwback", "tbt", "nap", "skincare", "makeup", "haul",
+    "recipe", "smoothie", "playlist", "podcast", "episode", "cozy", "errands", "laundry",
+}
+
+_WORD = re.compile(r"[a-z][a-z']+")
+_ENTITY = re.compile(r"#?\b[A-Z][\w'’-]+(?:\s+[A-Z][\w'’-]+)*")
+_NOT_ENTITIES = {
+    "i", "i'm", "i've", "i'll", "my", "me", "we", "our", "the", "a", "an", "this", "that",
+    "today", "tonight", "yesterday", "tomorrow", "so", "just", "when", "what", "new", "and",
+    "but", "it", "its", "it's", "here", "there", "finally", "big", "monday", "tuesday",
+    "wednesday", "thursday", "friday", "saturday", "sunday", "ootd", "tbt", "ai", "pov",
+}
+_STOPWORDS = {
+    "the", "and", "for", "that", "this", "with", "was", "were", "are", "but", "not", "you",
+    "have", "has", "had", "from", "into", "just", "been", "will", "about", "all", "can",
+    "out", "today", "my", "me", "so", "of", "to", "in", "on", "at", "it", "is", "a", "an",
+}
+
+# Logistic model over the features below; fitted on the "events" split of
+# scripts/fixtures/significance_events.json and evaluated on its "held_out" split
+# (see scripts/eval_significance.py).
+WEIGHTS: Dict[str, float] = {
+    "life_event": 3.75,
+    "trivial": -1.30,
+    "novel_entities": 0.27,
+    "known_entities": 0.98,
+    "novel_terms": -0.26,
+    "length": 0.25,
+    "hashtag_ratio": -0.26,
+}
+BIAS = -2.17
+
+
+def _sigmoid(x: float) -> float:
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+def _entities(text: str) -> Set[str]:
+    found = set()
+    for match in _ENTITY.findall(text or ""):
+        entity = match.lstrip("#").lower()
+        words = [w for w in entity.split() if w not in _NOT_ENTITIES]
+        if words:
+            found.add(" ".join(words))
+    return found
+
+
+def _content_terms(text: str) -> Set[str]:
+    return {word for word in _WORD.findall((text or "").lower()) if word not in _STOPWORDS}
+
+
+class StoryIndex:
+    """Entities and vocabulary of one life-story version."""
+
+    def __init__(self, story: str):
+        self.entities = _entities(story)
+        self.entity_words = {word for entity in self.entities for word in entity.split()}
+        self.terms = _content_terms(story)
+
+
+class SignificanceFilter:
+    """
+    Local pre-classifier for lifestyle post updates.
+
+    Scores an event with a small logistic model over keyword, entity-novelty and
+    vocabulary-novelty features against an index of the current life story.
+    Only events the model is confident about are skipped: they must contain
+    everyday-content terms, no life-event phrase, and score below `threshold`.
+    Everything else, including events the model knows nothing about, goes to
+    update_life_story_if_significant as before.
+    """
+
+    def __init__(self, threshold: float, index_cache_size: int = 256):
+        self.threshold = threshold
+        self.index_cache_size = index_cache_size
+        self._indexes: "OrderedDict[Tuple[int, Optional[int]], StoryIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._patterns = [(re.compile(p, re.IGNORECASE), w) for p, w in LIFE_EVENT_PATTERNS.items()]
+        self._metrics = {"checked": 0, "skipped": 0, "forwarded": 0, "confirmed": 0, "overturned": 0}
+
+    def set_threshold(self, threshold: float):
+        if not 0.0 <= threshold <= 1.0:
+            raise ValueError("Threshold must be between 0 and 1")
+        self.threshold = threshold
+        logger.info(f"Significance threshold set to {threshold}")
+
+    def _index(self, story: str, key: Optional[Tuple[int, Optional[int]]]) -> StoryIndex:
+        if key is None:
+            return StoryIndex(story)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        index = StoryIndex(story)
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.index_cache_size:
+                self._indexes.popitem(last=False)
+        return index
+
+    def features(self, event: str, index: StoryIndex) -> Dict[str, float]:
+        terms = _content_terms(event)
+        entities = _entities(event)
+        novel_entities = [e for e in entities if not set(e.split()) & index.entity_words]
+        tokens = event.split()
+        return {
+            "life_event": min(sum(w for pattern, w in self._patterns if pattern.search(event)), 3.0),
+            "trivial": float(min(len(terms & TRIVIAL_TERMS), 3)),
+            "novel_entities": float(min(len(novel_entities), 3)),
+            "known_entities": float(min(len(entities) - len(novel_entities), 3)),
+            "novel_terms": len(terms - index.terms) / len(terms) if terms else 0.0,
+            "length": min(len(terms) / 20.0, 1.0),
+            "hashtag_ratio": sum(1 for t in tokens if t.startswith("#")) / len(tokens) if tokens else 0.0,
+        }
+
+    def score(self, event: str, story: str, index_key: Optional[Tuple[int, Optional[int]]] = None) -> float:
+        """Probability-like score that the event is significant for the story."""
+        features = self.features(event, self._index(story or "", index_key))
+        return self._score(features)
+
+    def _score(self, features: Dict[str, float]) -> float:
+        return _sigmoid(BIAS + sum(WEIGHTS[name] * value for name, value in features.items()))
+
+    def assess(
+        self, event: str, story: str, index_key: Optional[Tuple[int, Optional[int]]] = None
+    ) -> Tuple[bool, float]:
+        """(forward to the LLM?, score) without recording metrics."""
+        if not (event or "").strip():
+            return False, 0.0
+        features = self.features(event, self._index(story or "", index_key))
+        score = self._score(features)
+        trivial = features["trivial"] > 0 and features["life_event"] == 0 and score < self.threshold
+        return not trivial, score
+
+    def should_forward(
+        self, event: str, story: str, index_key: Optional[Tuple[int, Optional[int]]] = None
+    ) -> Tuple[bool, float]:
+        """(forward to the LLM?, score). Records hit/skip metrics."""
+        forward, score = self.assess(event, story, index_key)
+        with self._lock:
+            self._metrics["checked"] += 1
+            self._metrics["forwarded" if forward else "skipped"] += 1
+        return forward, score
+
+    def record_outcome(self, was_significant: bool):
+        """Tracks how often forwarded events were confirmed by the LLM."""
+        with self._lock:
+            self._metrics["confirmed" if was_significant else "overturned"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        checked = metrics["checked"] or 1
+        forwarded = metrics["confirmed"] + metrics["overturned"]
+        return {
+            **metrics,
+            "threshold": self.threshold,
+            "skip_rate": round(metrics["skipped"] / checked, 3),
+            "llm_confirm_rate": round(metrics["confirmed"] / forwarded, 3) if forwarded else None,
+        }
+
+
+significance_filter = SignificanceFilter(threshold=float(os.getenv("SIGNIFICANCE_THRESHOLD", "0.1")))
@@ -0,0 +1,208 @@
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database.models import (
+    get_db_session,
+    AccountStatsRollup,
+    AccountStatsSample,
+    InstagramAccount,
+    LinkStatus,
+)
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("STATS_WORKERS", "4"))
+# Each fetch waits a random 0..STATS_STAGGER_SECONDS first, so a refresh doesn't burst
+STAGGER_SECONDS = float(os.getenv("STATS_STAGGER_SECONDS", "5"))
+RAW_RETENTION_DAYS = int(os.getenv("STATS_RAW_RETENTION_DAYS", "7"))
+
+RESOLUTIONS = ("hour", "day")
+
+
+def bucket_start(moment: datetime, resolution: str) -> datetime:
+    if resolution == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if resolution == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown resolution: {resolution}")
+
+
+class StatsCollector:
+    """
+    Periodic follower/following/media refresh for every linked account.
+
+    Accounts are fetched on a small thread pool with a random stagger before
+    each request. Readings are appended to account_stats_samples and folded
+    into hourly and daily rollups in the same transaction, so growth charts
+    read one row per bucket instead of scanning raw samples. Raw samples
+    older than RAW_RETENTION_DAYS are pruned; rollups are kept.
+    """
+
+    def __init__(self, manager=None, workers: int = WORKERS, stagger_seconds: float = STAGGER_SECONDS):
+        self.manager = manager  # InstagramManager (or anything with fetch_account_stats)
+        self.workers = workers
+        self.stagger_seconds = stagger_seconds
+        self._lock = threading.Lock()
+        self._metrics = {"refreshes": 0, "accounts_sampled": 0, "failed_fetches": 0, "last_refresh_seconds": 0.0}
+
+    def _accounts(self) -> List[Tuple[int, int, str]]:
+        db = get_db_session()
+        try:
+            return [
+                (account.id, account.influencer_id, account.username)
+                for account in db.query(InstagramAccount)
+                .filter(InstagramAccount.is_active == True)
+                .filter(InstagramAccount.link_status == LinkStatus.LINKED)
+                .all()
+            ]
+        finally:
+            db.close()
+
+    def _fetch(self, username: str) -> Optional[Dict[str, int]]:
+        if self.stagger_seconds > 0:
+            time.sleep(random.uniform(0, self.stagger_seconds))
+        try:
+            return self.manager.fetch_account_stats(username)
+        except Exception as e:
+            logger.error(f"Stats fetch failed for {username}: {e}")
+            return None
+
+    def collect(self) -> Dict[str, Any]:
+        """Refreshes every linked account once. Returns how many were sampled and how many failed."""
+        if self.manager is None:
+            return {"sampled": 0, "failed": 0}
+        started = time.monotonic()
+        accounts = self._accounts()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stats") as executor:
+            fetched = list(executor.map(lambda account: self._fetch(account[2]), accounts))
+        now = datetime.utcnow()
+        readings = [(account, stats) for account, stats in zip(accounts, fetched) if stats is not None]
+
+        db = get_db_session()
+        try:
+            self._store(db, readings, now)
+            db.query(AccountStatsSample).filter(
+                AccountStatsSample.sampled_at < now - timedelta(days=RAW_RETENTION_DAYS)
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Storing account stats failed: {e}")
+            readings = []
+        finally:
+            db.close()
+
+        failed = len(accounts) - len(readings)
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._metrics["refreshes"] += 1
+            self._metrics["accounts_sampled"] += len(readings)
+            self._metrics["failed_fetches"] += failed
+            self._metrics["last_refresh_seconds"] = round(elapsed, 2)
+        logger.info(f"Sampled stats for {len(readings)}/{len(accounts)} accounts in {elapsed:.1f}s")
+        return {"sampled": len(readings), "failed": failed}
+
+    def _store(self, db: Session, readings, now: datetime):
+        if not readings:
+            return
+        accounts = {
+            account.id: account
+            for account in db.query(InstagramAccount)
+            .filter(InstagramAccount.id.in_([account_id for (account_id, _, _), _ in readings]))
+            .all()
+        }
+        buckets = {resolution: bucket_start(now, resolution) for resolution in RESOLUTIONS}
+        rollups = {
+            (rollup.account_id, rollup.resolution): rollup
+            for rollup in db.query(AccountStatsRollup)
+            .filter(AccountStatsRollup.account_id.in_(list(accounts)))
+            .filter(AccountStatsRollup.bucket_start.in_(list(buckets.values())))
+            .all()
+            if rollup.bucket_start == buckets[rollup.resolution]
+        }
+        for (account_id, influencer_id, _), stats in readings:
+            followers = stats["follower_count"]
+            account = accounts.get(account_id)
+            if account is not None:
+                account.follower_count = followers
+                account.following_count = stats["following_count"]
+                account.media_count = stats["media_count"]
+            db.add(AccountStatsSample(account_id=account_id, influencer_id=influencer_id, sampled_at=now, **stats))
+            for resolution, start in buckets.items():
+                rollup = rollups.get((account_id, resolution))
+                if rollup is None:
+                    db.add(AccountStatsRollup(
+                        account_id=account_id, influencer_id=influencer_id, resolution=resolution,
+                        bucket_start=start, samples=1, followers_min=followers, followers_max=followers,
+                        followers_last=followers, following_last=stats["following_count"],
+                        media_last=stats["media_count"],
+                    ))
+                    continue
+                rollup.samples = (rollup.samples or 0) + 1
+                rollup.followers_min = min(rollup.followers_min, followers)
+                rollup.followers_max = max(rollup.followers_max, followers)
+                rollup.followers_last = followers
+                rollup.following_last = stats["following_count"]
+                rollup.media_last = stats["media_count"]
+
+    def series(self, db: Session, influencer_id: int, resolution: str = "day", days: int = 30) -> List[Dict[str, Any]]:
+        """Rolled-up counts for an influencer's accounts, oldest bucket first, summed across accounts."""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        since = bucket_start(datetime.utcnow() - timedelta(days=days), resolution)
+        rows = (
+            db.query(
+                AccountStatsRollup.bucket_start,
+                func.sum(AccountStatsRollup.followers_last),
+                func.sum(AccountStatsRollup.followers_min),
+                func.sum(AccountStatsRollup.followers_max),
+                func.sum(AccountStatsRollup.following_last),
+                func.sum(AccountStatsRollup.media_last),
+            )
+            .filter(AccountStatsRollup.influencer_id == influencer_id)
+            .filter(AccountStatsRollup.resolution == resolution)
+            .filter(AccountStatsRollup.bucket_start >= since)
+            .group_by(AccountStatsRollup.bucket_start)
+            .order_by(AccountStatsRollup.bucket_start)
+            .all()
+        )
+        return [
+            {
+                "bucket_start": start,
+                "followers": followers,
+                "followers_min": followers_min,
+                "followers_max": followers_max,
+                "following": following,
+                "media": media,
+            }
+            for start, followers, followers_min, followers_max, following, media in rows
+        ]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._metrics)
+
+    def start(self, scheduler, interval_seconds: int, executor: str = "default"):
+        """Registers collect() as an interval job on an APScheduler instance."""
+        scheduler.add_job(
+            self.collect,
+            trigger="interval",
+            seconds=interval_seconds,
+            id="account_stats_collect",
+            replace_existing=True,
+            max_instances=1,
+            executor=executor,
+        )
+        logger.info(f"Account stats refreshing every {interval_seconds}s")
+
+
+stats_collector = StatsCollector()
@@ -0,0 +1,456 @@
+import os
+import re
+import json
+import math
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from database.models import SessionLocal, LifeStorySummary
+from managers.model_router import model_router, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CHAPTER_PARAGRAPHS = int(os.getenv("STORY_CHAPTER_PARAGRAPHS", "4"))
+ARCHIVE_CONTEXT_TOKENS = int(os.getenv("DIARY_CONTEXT_TOKENS", "600"))
+DIARY_ARCHIVE_PATH = Path(__file__).resolve().parent.parent / "data" / "diary_archive.json"
+
+# Paragraphs longer than this are split at sentence boundaries into sections.
+MAX_SECTION_TOKENS = 300
+SUMMARY_CHARS = 240
+# Later sections describe the character's present, so they get a relevance bonus.
+RECENCY_WEIGHT = 0.5
+# Labels and separators added around each rendered part
+PART_OVERHEAD_TOKENS = 8
+
+_WORD = re.compile(r"[a-z0-9']{3,}")
+_SENTENCE = re.compile(r"[^.!?]+(?:[.!?]+[\"')\]]*)?\s*")
+_STOPWORDS = {
+    "the", "and", "for", "that", "this", "with", "was", "were", "are", "but", "not", "you",
+    "they", "their", "have", "has", "had", "from", "into", "she", "her", "his", "him", "its",
+    "our", "out", "who", "what", "when", "then", "than", "just", "been", "will", "would",
+    "about", "there", "which", "all", "can", "one", "now", "day", "days",
+}
+
+
+def _terms(text: str) -> set:
+    return {word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS}
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _extractive_summary(text: str, limit: int = SUMMARY_CHARS) -> str:
+    """Leading sentences up to `limit` characters."""
+    summary = ""
+    for sentence in _SENTENCE.findall(text):
+        if summary and len(summary) + len(sentence) > limit:
+            break
+        summary += sentence
+    return summary.strip()[:limit]
+
+
+def _paragraph_spans(story: str) -> List[Tuple[int, int, List[Tuple[int, int]]]]:
+    """
+    (start, end, section spans) of every paragraph, as offsets into `story`.
+    Overlong paragraphs get one section span per sentence group, else one for the whole paragraph.
+    """
+    paragraphs = []
+    for match in re.finditer(r"\S(?:.*?\S)??(?=\n\s*\n|\s*$)", story or "", re.S):
+        start, end = match.span()
+        paragraph = match.group()
+        if estimate_tokens(paragraph) <= MAX_SECTION_TOKENS:
+            paragraphs.append((start, end, [(start, end)]))
+            continue
+        spans = []
+        group_start, current = start, ""
+        for sentence in _SENTENCE.finditer(paragraph):
+            if current and estimate_tokens(current + sentence.group()) > MAX_SECTION_TOKENS:
+                spans.append((group_start, start + sentence.start()))
+                group_start, current = start + sentence.start(), ""
+            current += sentence.group()
+        spans.append((group_start, end))
+        # Trim the whitespace between sentence groups off each span
+        trimmed = []
+        for span_start, span_end in spans:
+            text = story[span_start:span_end]
+            lead = len(text) - len(text.lstrip())
+            if text.strip():
+                trimmed.append((span_start + lead, span_start + len(text.rstrip())))
+        paragraphs.append((start, end, trimmed))
+    return paragraphs
+
+
+def split_sections(story: str) -> List[str]:
+    """
+    Paragraphs of the story (blank-line separated). Overlong paragraphs are split
+    into sentence groups so every section can be summarized and budgeted on its own.
+    """
+    return [story[start:end] for _, _, spans in _paragraph_spans(story) for start, end in spans]
+
+
+class StoryOutline:
+    """Sections of one story version with their paragraph, chapter and synopsis summaries."""
+
+    def __init__(self, sections: List[str], section_summaries: List[str], chapter_summaries: List[str], synopsis: str):
+        self.sections = sections
+        self.section_summaries = section_summaries
+        self.chapter_summaries = chapter_summaries
+        self.synopsis = synopsis
+
+    def chapter_range(self, chapter: int) -> range:
+        return range(chapter * CHAPTER_PARAGRAPHS, min((chapter + 1) * CHAPTER_PARAGRAPHS, len(self.sections)))
+
+
+class StoryContextBuilder:
+    """
+    Assembles life-story context for prompts within a per-task token budget.
+
+    Stories that fit the budget are used verbatim. Longer stories are reduced to a
+    synopsis plus chapter summaries, and the sections most relevant to the prompt
+    (by term overlap, with a bonus for recent sections) are then added in full
+    until the budget is spent. Summaries are content-addressed by section hash, so
+    after a rewrite only the changed sections and their chapters are re-summarized.
+    """
+
+    def __init__(self, client_getter: Callable[[], Any]):
+        self._client = client_getter
+        self._memory: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+        self._archive: Optional[List[Dict[str, Any]]] = None
+
+    # --- Summary storage ---
+
+    def _lookup(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        with self._lock:
+            found = {key: self._memory[key] for key in keys if key in self._memory}
+        missing = [key for key in keys if key not in found]
+        if missing:
+            db = SessionLocal()
+            try:
+                rows = (
+                    db.query(LifeStorySummary)
+                    .filter(LifeStorySummary.content_hash.in_({h for h, _ in missing}))
+                    .all()
+                )
+            finally:
+                db.close()
+            with self._lock:
+                for row in rows:
+                    self._memory[(row.content_hash, row.level)] = row.summary
+                    if (row.content_hash, row.level) in missing:
+                        found[(row.content_hash, row.level)] = row.summary
+        return found
+
+    def _store(self, entries: Dict[Tuple[str, str], str]):
+        with self._lock:
+            self._memory.update(entries)
+        db = SessionLocal()
+        try:
+            for (content_hash, level), summary in entries.items():
+                db.add(LifeStorySummary(content_hash=content_hash, level=level, summary=summary))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Another worker summarized the same section first
+                    db.rollback()
+        finally:
+            db.close()
+
+    # --- Summarization ---
+
+    def _summarize_chapter(self, sections: List[str], influencer_id: Optional[int]) -> Tuple[List[str], str]:
+        fallback = [_extractive_summary(section) for section in sections]
+        client = self._client()
+        if not client:
+            return fallback, _extractive_summary(" ".join(fallback), SUMMARY_CHARS * 2)
+
+        numbered = "\n\n".join(f"[{i + 1}] {section}" for i, section in enumerate(sections))
+        prompt = f"""
+        Summarize this part of a character's life story.
+
+        {numbered}
+
+        Output JSON:
+        {{
+            "paragraphs": ["One sentence per numbered paragraph, in order"],
+            "chapter": "Two or three sentences covering the whole part"
+        }}
+        """
+        try:
+            response = model_router.generate(
+                client, "summary", prompt,
+                influencer_id=influencer_id, response_mime_type="application/json"
+            )
+            data = json.loads(response.text)
+            paragraphs = data.get("paragraphs") or []
+            if len(paragraphs) != len(sections):
+                paragraphs = fallback
+            return [str(p) for p in paragraphs], str(data.get("chapter") or " ".join(paragraphs))
+        except Exception as e:
+            logger.error(f"Chapter summary failed: {e}")
+            return fallback, _extractive_summary(" ".join(fallback), SUMMARY_CHARS * 2)
+
+    def _summarize_synopsis(self, chapter_summaries: List[str], influencer_id: Optional[int]) -> str:
+        client = self._client()
+        if not client or len(chapter_summaries) == 1:
+            return chapter_summaries[0] if len(chapter_summaries) == 1 else _extractive_summary(
+                " ".join(chapter_summaries), SUMMARY_CHARS * 2
+            )
+
+        chapters = "\n".join(f"- {summary}" for summary in chapter_summaries)
+        prompt = f"""
+        Write a synopsis of this character's whole life story in at most four sentences,
+        ending with where they are now.
+
+        Chapters:
+        {chapters}
+        """
+        try:
+            response = model_router.generate(client, "summary", prompt, influencer_id=influencer_id)
+            return response.text.strip()
+        except Exception as e:
+            logger.error(f"Synopsis failed: {e}")
+            return _extractive_summary(" ".join(chapter_summaries), SUMMARY_CHARS * 2)
+
+    def outline(self, story: str, influencer_id: Optional[int] = None) -> StoryOutline:
+        """Hierarchical summaries for a story, generating only those not stored yet."""
+        sections = split_sections(story)
+        section_hashes = [_hash(section) for section in sections]
+        chapters = [
+            section_hashes[start:start + CHAPTER_PARAGRAPHS]
+            for start in range(0, len(sections), CHAPTER_PARAGRAPHS)
+        ]
+        chapter_hashes = [_hash("".join(hashes)) for hashes in chapters]
+        synopsis_hash = _hash("".join(chapter_hashes))
+
+        keys = (
+            [(h, "paragraph") for h in section_hashes]
+            + [(h, "chapter") for h in chapter_hashes]
+            + [(synopsis_hash, "synopsis")]
+        )
+        known = self._lookup(keys)
+        new: Dict[Tuple[str, str], str] = {}
+
+        for c, hashes in enumerate(chapters):
+            if (chapter_hashes[c], "chapter") in known and all((h, "paragraph") in known for h in hashes):
+                continue
+            start = c * CHAPTER_PARAGRAPHS
+            paragraph_summaries, chapter_summary = self._summarize_chapter(
+                sections[start:start + len(hashes)], influencer_id
+            )
+            for h, summary in zip(hashes, paragraph_summaries):
+                new[(h, "paragraph")] = summary
+            new[(chapter_hashes[c], "chapter")] = chapter_summary
+        known.update(new)
+
+        chapter_summaries = [known[(h, "chapter")] for h in chapter_hashes]
+        if (synopsis_hash, "synopsis") not in known and chapter_summaries:
+            new[(synopsis_hash, "synopsis")] = self._summarize_synopsis(chapter_summaries, influencer_id)
+            known.update(new)
+
+        if new:
+            self._store(new)
+            logger.info(f"Summarized {len(new)} life-story sections for influencer {influencer_id}")
+
+        return StoryOutline(
+            sections,
+            [known[(h, "paragraph")] for h in section_hashes],
+            chapter_summaries,
+            known.get((synopsis_hash, "synopsis"), ""),
+        )
+
+    def refresh_async(self, story: str, influencer_id: Optional[int] = None):
+        """Precomputes summaries for a new story version off the request path."""
+        if estimate_tokens(story or "") <= min(
+            model_router.context_budget(task) for task in ("plan", "replan", "story_rewrite", "scene")
+        ):
+            return
+        threading.Thread(
+            target=self._refresh, args=(story, influencer_id), daemon=True, name="story-context-refresh"
+        ).start()
+
+    def _refresh(self, story: str, influencer_id: Optional[int]):
+        try:
+            self.outline(story, influencer_id)
+        except Exception as e:
+            logger.error(f"Life-story summary refresh failed for influencer {influencer_id}: {e}", exc_info=True)
+
+    # --- Assembly ---
+
+    def _select(self, outline: StoryOutline, query: str, budget: int) -> Tuple[set, set, set]:
+        """(chapters shown as summaries, sections shown in full, sections shown as summaries)."""
+        n = len(outline.sections)
+        query_terms = _terms(query)
+        scores = []
+        for i, section in enumerate(outline.sections):
+            terms = _terms(section)
+            overlap = len(query_terms & terms) / (math.sqrt(len(terms)) + 1) if query_terms else 0.0
+            scores.append(overlap + RECENCY_WEIGHT * (i + 1) / n)
+        ranked = sorted(range(n), key=lambda i: -scores[i])
+
+        # Synopsis always; chapter summaries while they fit, least relevant dropped first
+        def cost(text: str) -> int:
+            return estimate_tokens(text) + PART_OVERHEAD_TOKENS
+
+        used = cost(outline.synopsis)
+        chapters = set(range(len(outline.chapter_summaries)))
+        used += sum(cost(outline.chapter_summaries[c]) for c in chapters)
+        chapter_scores = {c: max(scores[i] for i in outline.chapter_range(c)) for c in chapters}
+        for c in sorted(chapters, key=chapter_scores.get):
+            if used <= budget:
+                break
+            chapters.discard(c)
+            used -= cost(outline.chapter_summaries[c])
+
+        # Then the most relevant sections in full
+        full = set()
+        for i in ranked:
+            section_cost = cost(outline.sections[i])
+            if used + section_cost <= budget:
+                full.add(i)
+                used += section_cost
+
+        # Paragraph summaries cover relevant sections whose chapter summary was dropped
+        summarized = set()
+        for i in ranked:
+            if i in full or i // CHAPTER_PARAGRAPHS in chapters:
+                continue
+            summary_cost = cost(outline.section_summaries[i])
+            if used + summary_cost <= budget:
+                summarized.add(i)
+                used += summary_cost
+        return chapters, full, summarized
+
+    def build(
+        self,
+        story: Optional[str],
+        task: str,
+        query: str = "",
+        influencer_id: Optional[int] = None,
+        budget: Optional[int] = None,
+    ) -> str:
+        """Life-story context for `task`'s prompts, relevant to `query`, within its token budget."""
+        if not story:
+            return ""
+        budget = budget or model_router.context_budget(task)
+        if estimate_tokens(story) <= budget:
+            return story
+        return self.render(story, task, query, influencer_id, budget)[0]
+
+    def render(
+        self,
+        story: str,
+        task: str,
+        query: str = "",
+        influencer_id: Optional[int] = None,
+        budget: Optional[int] = None,
+        numbered: bool = False,
+    ) -> Tuple[str, List[int]]:
+        """
+        Budgeted context plus the indices of sections shown in full. With numbered,
+        every full section is tagged [P<index>] so the model can reference it in edits.
+        """
+        budget = budget or model_router.context_budget(task)
+        if estimate_tokens(story) <= budget:
+            # Everything fits: no summaries needed
+            sections = split_sections(story)
+            outline = StoryOutline(sections, [], [""] * math.ceil(len(sections) / CHAPTER_PARAGRAPHS), "")
+            chapters, full, summarized = set(), set(range(len(sections))), set()
+        else:
+            outline = self.outline(story, influencer_id)
+            chapters, full, summarized = self._select(outline, query, budget)
+
+        parts = [f"Synopsis: {outline.synopsis}"] if outline.synopsis else []
+        for c in range(len(outline.chapter_summaries)):
+            if c in chapters:
+                parts.append(f"Chapter {c + 1} (summary): {outline.chapter_summaries[c]}")
+            for i in outline.chapter_range(c):
+                if i in full:
+                    parts.append(f"[P{i}] {outline.sections[i]}" if numbered else outline.sections[i])
+                elif i in summarized:
+                    parts.append(f"(summary) {outline.section_summaries[i]}")
+        return "\n\n".join(parts), sorted(full)
+
+    def archive_context(self, query: str, budget: int = ARCHIVE_CONTEXT_TOKENS) -> str:
+        """Diary archive entries most relevant to `query` that fit within `budget`."""
+        if self._archive is None:
+            try:
+                self._archive = json.loads(DIARY_ARCHIVE_PATH.read_text())["entries"]
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Diary archive unavailable: {e}")
+                self._archive = []
+
+        query_terms = _terms(query)
+        ranked = sorted(
+            self._archive,
+            key=lambda entry: -len(query_terms & _terms(entry["title"] + " " + entry["text"])),
+        )
+        chosen, used = [], 0
+        for entry in ranked:
+            cost = estimate_tokens(entry["text"])
+            if used + cost <= budget:
+                chosen.append(entry)
+                used += cost
+        chosen.sort(key=lambda entry: entry["id"])
+        return "\n\n".join(f"[ENTRY {entry['id']:03d}: {entry['title']}]\n{entry['text']}" for entry in chosen)
+
+
+def apply_story_patch(story: str, edits: List[Dict[str, Any]], new_paragraphs: List[str], editable: List[int]) -> str:
+    """
+    Applies a patch produced against a numbered rendering of `story`.
+    edits: [{"paragraph": index, "text": replacement}] ("" removes it), restricted to
+    `editable` sections; new_paragraphs are appended in order. Edits are made in place,
+    so text outside the edited sections, separators included, is left byte-identical.
+    """
+    story = story or ""
+    paragraphs = _paragraph_spans(story)
+    section_count = sum(len(spans) for _, _, spans in paragraphs)
+    allowed = set(editable)
+    replacements: Dict[int, str] = {}
+    for edit in edits or []:
+        if not isinstance(edit, dict):
+            continue
+        index = edit.get("paragraph")
+        if isinstance(index, int) and index in allowed and 0 <= index < section_count:
+            replacements[index] = str(edit.get("text") or "").strip()
+
+    kept: List[Tuple[str, str]] = []  # (separator before it in the original, paragraph text)
+    index = 0
+    previous_end = None
+    for start, end, spans in paragraphs:
+        separator = story[previous_end:start] if previous_end is not None else ""
+        previous_end = end
+        text = story[start:end]
+        # Right to left, so earlier offsets stay valid
+        for offset in reversed(range(len(spans))):
+            replacement = replacements.get(index + offset)
+            if replacement is None:
+                continue
+            span_start, span_end = spans[offset][0] - start, spans[offset][1] - start
+            if not replacement:
+                # Take the whitespace joining it to the next sentence group (or the previous one) with it
+                if offset + 1 < len(spans):
+                    span_end = spans[offset + 1][0] - start
+                elif offset > 0:
+                    span_start = spans[offset - 1][1] - start
+            text = text[:span_start] + replacement + text[span_end:]
+        index += len(spans)
+        if text.strip():
+            kept.append((separator, text))
+
+    body = ""
+    for i, (separator, text) in enumerate(kept):
+        body += (separator if i else "") + text
+    additions = [str(p).strip() for p in new_paragraphs or [] if str(p).strip()]
+    if additions:
+        body = "\n\n".join(([body] if body else []) + additions)
+    if not paragraphs:
+        return body or story
+    # Keep whatever surrounded the paragraphs (leading/trailing whitespace) as it was
+    return story[:paragraphs[0][0]] + body + story[paragraphs[-1][1]:]
@@ -0,0 +1,342 @@
+import os
+import re
+import json
+import heapq
+import hashlib
+import logging
+import itertools
+import threading
+import urllib.request
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TREND_TTL_HOURS = float(os.getenv("TREND_TTL_HOURS", "24"))
+ROI_CACHE_SIZE = int(os.getenv("TREND_ROI_CACHE_SIZE", "4096"))
+DEFAULT_TRENDS_FILE = Path(__file__).resolve().parent.parent / "data" / "trends.json"
+
+# Unscored trends rank by 5 + weight (so around the middle of the 0-10 ROI scale);
+# manual injections rank above any ROI score.
+UNSCORED_BASE = 5.0
+MANUAL_PRIORITY = 100.0
+
+_SPACES = re.compile(r"\s+")
+
+
+def trend_key(title: str) -> str:
+    return _SPACES.sub(" ", title.strip().lower())
+
+
+def persona_hash(influencer) -> str:
+    """Stable hash of what the ROI prompt depends on; changes after a persona pivot."""
+    targeting = influencer.audience_targeting or {}
+    payload = json.dumps(
+        {"name": influencer.name, "persona": influencer.persona or {}, "interests": targeting.get("interests", [])},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class Trend:
+    key: str
+    title: str
+    weight: float = 0.0
+    manual: bool = False
+    influencer_id: Optional[int] = None  # manual trends can target one influencer
+    sources: Set[str] = field(default_factory=set)
+    mentions: int = 1
+    first_seen: datetime = field(default_factory=datetime.utcnow)
+    expires_at: datetime = field(default_factory=datetime.utcnow)
+
+    def expired(self, now: datetime) -> bool:
+        return now >= self.expires_at
+
+
+class FileTrendSource:
+    """Trends from a JSON file: a list of titles or of {"title", "weight"} objects."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.name = f"file:{self.path.name}"
+
+    def fetch(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        return _normalize(json.loads(self.path.read_text()))
+
+
+class HttpTrendSource:
+    """Trends from an HTTP endpoint returning the same JSON shape as FileTrendSource."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+        self.name = f"http:{url}"
+
+    def fetch(self) -> List[Dict[str, Any]]:
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            return _normalize(json.loads(response.read().decode("utf-8")))
+
+
+def _normalize(items: Iterable[Any]) -> List[Dict[str, Any]]:
+    trends = []
+    for item in items or []:
+        if isinstance(item, str):
+            item = {"title": item}
+        title = (item.get("title") or "").strip() if isinstance(item, dict) else ""
+        if title:
+            trends.append({"title": title, "weight": float(item.get("weight", 0.0))})
+    return trends
+
+
+class _InfluencerQueue:
+    """Max-heap of (priority, trend) for one influencer, with lazy invalidation."""
+
+    def __init__(self, persona: str):
+        self.persona = persona
+        self.heap: List[Tuple[float, int, str]] = []
+        self.processed: Set[str] = set()
+
+
+class TrendFeed:
+    """
+    De-duplicated trend queue shared by all influencers.
+
+    Sources are polled into one registry keyed by normalized title; a trend
+    seen again only extends its expiry. Each influencer gets its own heap,
+    built on first use, ranked by the memoized ROI score for
+    (trend, persona hash) when one exists and by the source weight otherwise.
+    Every priority change pushes a fresh entry; expiry is handled lazily. A popped
+    entry whose priority no longer matches is pushed again at the current one
+    rather than dropped, so next_trend() is O(log n) amortized and never loses a trend.
+    """
+
+    def __init__(self, sources: Optional[List[Any]] = None, ttl_hours: float = TREND_TTL_HOURS):
+        self.sources = list(sources or [])
+        self.ttl = timedelta(hours=ttl_hours)
+        self._trends: Dict[str, Trend] = {}
+        self._queues: Dict[int, _InfluencerQueue] = {}
+        self._roi: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    # Ingestion
+
+    def add(self, title: str, source: str, weight: float = 0.0, manual: bool = False,
+            influencer_id: Optional[int] = None) -> Trend:
+        """Adds or refreshes a trend and queues it for every influencer that hasn't seen it."""
+        key = trend_key(title)
+        now = datetime.utcnow()
+        with self._lock:
+            trend = self._trends.get(key)
+            if trend is not None and not trend.expired(now):
+                trend.mentions += 1
+                trend.sources.add(source)
+                previous_weight = trend.weight
+                trend.weight = max(trend.weight, weight)
+                trend.expires_at = now + self.ttl
+                if not manual:
+                    if trend.weight != previous_weight:
+                        self._requeue(trend)
+                    return trend
+                # A manual injection promotes an already-known trend, even one already evaluated
+                trend.manual = True
+                trend.influencer_id = influencer_id
+                for queue_owner, queue in self._queues.items():
+                    if influencer_id in (None, queue_owner):
+                        queue.processed.discard(key)
+            else:
+                trend = Trend(key=key, title=title.strip(), weight=weight, manual=manual,
+                              influencer_id=influencer_id, sources={source}, expires_at=now + self.ttl)
+                self._trends[key] = trend
+            for queue_owner, queue in self._queues.items():
+                if key not in queue.processed:
+                    self._push(queue_owner, queue, trend)
+        return trend
+
+    def poll(self) -> int:
+        """Pulls every source once and prunes expired trends. Returns the number of new trends."""
+        with self._lock:
+            before = set(self._trends)
+        for source in self.sources:
+            try:
+                items = source.fetch()
+            except Exception as e:
+                logger.error(f"Trend source {source.name} failed: {e}")
+                continue
+            for item in items:
+                self.add(item["title"], source.name, item.get("weight", 0.0))
+        self.prune()
+        with self._lock:
+            added = len(set(self._trends) - before)
+            live = len(self._trends)
+        if added:
+            logger.info(f"Trend feed: {added} new trends, {live} live")
+        return added
+
+    def prune(self):
+        now = datetime.utcnow()
+        with self._lock:
+            for key in [key for key, trend in self._trends.items() if trend.expired(now)]:
+                del self._trends[key]
+                for queue in self._queues.values():
+                    queue.processed.discard(key)
+            # Drop stale heap entries once they outnumber live trends
+            for influencer_id, queue in self._queues.items():
+                if len(queue.heap) > 2 * len(self._trends) + 16:
+                    queue.heap = []
+                    for trend in self._trends.values():
+                        if trend.key not in queue.processed:
+                            self._push(influencer_id, queue, trend)
+
+    # Ranking
+
+    def _priority(self, trend: Trend, persona: str, influencer_id: int) -> float:
+        if trend.manual and trend.influencer_id in (None, influencer_id):
+            return MANUAL_PRIORITY
+        roi = self._roi.get((trend.key, persona))
+        if roi is not None:
+            return float(roi.get("score", 0.0))
+        return UNSCORED_BASE + trend.weight
+
+    def _push(self, influencer_id: int, queue: _InfluencerQueue, trend: Trend):
+        priority = self._priority(trend, queue.persona, influencer_id)
+        heapq.heappush(queue.heap, (-priority, next(self._seq), trend.key))
+
+    def _requeue(self, trend: Trend, persona: Optional[str] = None):
+        """Pushes the trend at its current priority wherever it is still pending."""
+        for influencer_id, queue in self._queues.items():
+            if (persona is None or queue.persona == persona) and trend.key not in queue.processed:
+                self._push(influencer_id, queue, trend)
+
+    def _queue(self, influencer_id: int, persona: str) -> _InfluencerQueue:
+        queue = self._queues.get(influencer_id)
+        if queue is None or queue.persona != persona:
+            processed = queue.processed if queue else set()
+            queue = _InfluencerQueue(persona)
+            queue.processed = processed
+            for trend in self._trends.values():
+                if trend.key not in processed:
+                    self._push(influencer_id, queue, trend)
+            self._queues[influencer_id] = queue
+        return queue
+
+    def next_trend(self, influencer_id: int, persona: str) -> Optional[Trend]:
+        """Pops the best live trend this influencer hasn't processed yet, and marks it processed."""
+        now = datetime.utcnow()
+        with self._lock:
+            queue = self._queue(influencer_id, persona)
+            while queue.heap:
+                neg_priority, _, key = heapq.heappop(queue.heap)
+                trend = self._trends.get(key)
+                if trend is None or trend.expired(now) or key in queue.processed:
+                    continue
+                if -neg_priority != self._priority(trend, persona, influencer_id):
+                    # Ranked at an old priority; queue it again at the current one
+                    self._push(influencer_id, queue, trend)
+                    continue
+                queue.processed.add(key)
+                if trend.manual and trend.influencer_id in (None, influencer_id):
+                    # A manual boost is consumed once; other influencers see the trend at its normal rank
+                    trend.manual = False
+                    trend.influencer_id = None
+                    for queue_owner, other in self._queues.items():
+                        if key not in other.processed:
+                            self._push(queue_owner, other, trend)
+                return trend
+        return None
+
+    def peek(self, influencer_id: int, persona: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """The next trends for an influencer, best first, without consuming them."""
+        now = datetime.utcnow()
+        with self._lock:
+            queue = self._queue(influencer_id, persona)
+            live = [
+                trend for trend in self._trends.values()
+                if not trend.expired(now) and trend.key not in queue.processed
+            ]
+            ranked = heapq.nlargest(limit, live, key=lambda trend: self._priority(trend, persona, influencer_id))
+            return [
+                {
+                    "title": trend.title,
+                    "priority": self._priority(trend, persona, influencer_id),
+                    "scored": (trend.key, persona) in self._roi,
+                    "manual": trend.manual,
+                    "mentions": trend.mentions,
+                    "sources": sorted(trend.sources),
+                    "expires_at": trend.expires_at.isoformat(),
+                }
+                for trend in ranked
+            ]
+
+    def unscored(self, influencer_id: int, persona: str, limit: int) -> List[Trend]:
+        """The highest-ranked live trends this influencer hasn't processed and that have no ROI score yet."""
+        now = datetime.utcnow()
+        with self._lock:
+            queue = self._queue(influencer_id, persona)
+            candidates = [
+                trend for trend in self._trends.values()
+                if not trend.expired(now) and trend.key not in queue.processed
+                and (trend.key, persona) not in self._roi
+            ]
+            return heapq.nlargest(limit, candidates, key=lambda trend: self._priority(trend, persona, influencer_id))
+
+    # ROI ranking
+
+    def record_roi(self, key: str, persona: str, roi: Dict[str, Any]):
+        """Caches an ROI decision and re-ranks the trend for influencers sharing the persona."""
+        with self._lock:
+            self._roi[(key, persona)] = roi
+            self._roi.move_to_end((key, persona))
+            while len(self._roi) > ROI_CACHE_SIZE:
+                # An evicted score falls back to the unscored rank
+                (evicted_key, evicted_persona), _ = self._roi.popitem(last=False)
+                evicted = self._trends.get(evicted_key)
+                if evicted is not None:
+                    self._requeue(evicted, evicted_persona)
+            trend = self._trends.get(key)
+            if trend is None:
+                return
+            self._requeue(trend, persona)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "live_trends": len(self._trends),
+                "sources": [source.name for source in self.sources],
+                "cached_roi": len(self._roi),
+                "influencer_queues": len(self._queues),
+            }
+
+    def start(self, scheduler, interval_seconds: int):
+        """Polls sources now and then as an interval job on an APScheduler instance."""
+        self.poll()
+        scheduler.add_job(
+            self.poll,
+            trigger="interval",
+            seconds=interval_seconds,
+            id="trend_feed_poll",
+            replace_existing=True,
+            max_instances=1,
+        )
+        logger.info(f"Trend feed polling {len(self.sources)} sources every {interval_seconds}s")
+
+
+def _default_sources() -> List[Any]:
+    """TREND_SOURCES is a comma-separated list of file paths and http(s) URLs."""
+    configured = [entry.strip() for entry in os.getenv("TREND_SOURCES", "").split(",") if entry.strip()]
+    if not configured:
+        return [FileTrendSource(DEFAULT_TRENDS_FILE)]
+    return [
+        HttpTrendSource(entry) if entry.startswith(("http://", "https://")) else FileTrendSource(Path(entry))
+        for entry in configured
+    ]
+
+
+trend_feed = TrendFeed(_default_sources())
@@ -0,0 +1,428 @@
+import os
+import heapq
+import time
+import random
+import logging
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from instagrapi.exceptions import (
+    ChallengeError,
+    ChallengeRequired,
+    FeedbackRequired,
+    LoginRequired,
+    PleaseWaitFewMinutes,
+    RateLimitError,
+    SentryBlock,
+)
+
+from database.models import get_db_session, UploadAccountState, UploadJob, Video, VideoStatus, WorkflowStatus
+from managers.instagram_manager import SessionUnavailable
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+RATE_PER_HOUR = float(os.getenv("UPLOAD_RATE_PER_HOUR", "6"))
+BURST = int(os.getenv("UPLOAD_BURST", "2"))
+MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "5"))
+BACKOFF_SECONDS = float(os.getenv("UPLOAD_BACKOFF_SECONDS", "120"))
+CHALLENGE_PAUSE_SECONDS = float(os.getenv("UPLOAD_CHALLENGE_PAUSE_MINUTES", "180")) * 60
+# Tries at recording a finished upload before giving up (the media is never re-uploaded)
+SUCCESS_WRITE_ATTEMPTS = 3
+
+MIN_RATE_PER_HOUR = 1.0
+MAX_RATE_PER_HOUR = RATE_PER_HOUR * 3
+PLEASE_WAIT_SECONDS = 300.0
+
+THROTTLE_ERRORS = (RateLimitError, PleaseWaitFewMinutes)
+BLOCK_ERRORS = (ChallengeRequired, ChallengeError, FeedbackRequired, SentryBlock)
+
+
+class TokenBucket:
+    """
+    Per-account upload allowance, tuned by additive increase / multiplicative decrease.
+
+    Each success nudges the hourly rate up; a throttling response halves it
+    and pauses the account, and a challenge or block drops it to the floor
+    and pauses much longer.
+    """
+
+    def __init__(self, rate_per_hour: float = RATE_PER_HOUR, burst: int = BURST):
+        self.rate_per_hour = rate_per_hour
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = datetime.utcnow()
+        self.paused_until: Optional[datetime] = None
+        self.throttles = 0
+        self.blocks = 0
+
+    def _refill(self, now: datetime):
+        elapsed = (now - self.updated).total_seconds()
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate_per_hour / 3600.0)
+        self.updated = now
+
+    def wait_seconds(self, now: datetime) -> float:
+        """Seconds until an upload may start (0 when one may start now)."""
+        if self.paused_until and now < self.paused_until:
+            return (self.paused_until - now).total_seconds()
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) * 3600.0 / self.rate_per_hour
+
+    def take(self, now: datetime):
+        self._refill(now)
+        self.tokens -= 1.0
+
+    def on_success(self):
+        self.rate_per_hour = min(MAX_RATE_PER_HOUR, self.rate_per_hour + 0.25)
+
+    def on_throttle(self, now: datetime, pause_seconds: float):
+        self.throttles += 1
+        self.rate_per_hour = max(MIN_RATE_PER_HOUR, self.rate_per_hour / 2)
+        self.tokens = 0.0
+        self.paused_until = now + timedelta(seconds=pause_seconds)
+
+    def on_block(self, now: datetime):
+        self.blocks += 1
+        self.rate_per_hour = MIN_RATE_PER_HOUR
+        self.tokens = 0.0
+        self.paused_until = now + timedelta(seconds=CHALLENGE_PAUSE_SECONDS)
+
+    @classmethod
+    def from_state(cls, state: UploadAccountState, now: datetime) -> "TokenBucket":
+        """A bucket restored after a restart. A still-paused account comes back with no tokens."""
+        bucket = cls(rate_per_hour=state.rate_per_hour)
+        bucket.paused_until = state.paused_until
+        bucket.throttles = state.throttles or 0
+        bucket.blocks = state.blocks or 0
+        if bucket.paused_until and now < bucket.paused_until:
+            bucket.tokens = 0.0
+        return bucket
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "rate_per_hour": round(self.rate_per_hour, 2),
+            "tokens": round(self.tokens, 2),
+            "paused_until": self.paused_until.isoformat() if self.paused_until else None,
+            "throttles": self.throttles,
+            "blocks": self.blocks,
+        }
+
+
+@dataclass
+class _Pending:
+    job_id: int
+    kind: str
+    path: str
+    caption: str
+    video_id: Optional[int]
+    attempts: int
+    not_before: datetime
+
+
+class UploadQueue:
+    """
+    Paced Instagram uploads across many accounts.
+
+    Accounts run in parallel on a thread pool, but each account has at most
+    one upload in flight and starts one only when its TokenBucket allows.
+    Throttled uploads are rescheduled with jittered exponential backoff and
+    the account's rate is lowered; challenges and blocks pause the account.
+    Jobs are recorded in the upload_jobs table and re-queued on restart; each
+    account's rate and pause are kept in upload_account_states and restored with them.
+    A dispatcher thread keeps a heap of (ready time, account) so each
+    scheduling decision is O(log accounts).
+    """
+
+    def __init__(self, manager=None, workers: int = WORKERS):
+        self.manager = manager  # InstagramManager (or anything with upload_media)
+        self.workers = workers
+        self._pending: Dict[str, List[Tuple[datetime, int, _Pending]]] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._in_flight: set = set()
+        self._ready: List[Tuple[datetime, int, str]] = []
+        self._ready_at: Dict[str, datetime] = {}  # live ready-heap entry per account
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._metrics = {"succeeded": 0, "failed": 0, "throttled": 0, "blocked": 0, "retried": 0}
+
+    # Submission
+
+    def enqueue(self, username: str, kind: str, path: str, caption: str = "", video_id: Optional[int] = None) -> int:
+        """Records an upload job and queues it for the account. Returns the job id."""
+        if kind not in ("photo", "video", "story"):
+            raise ValueError(f"Unknown upload kind: {kind}")
+        db = get_db_session()
+        try:
+            job = UploadJob(username=username, kind=kind, path=path, caption=caption, video_id=video_id)
+            db.add(job)
+            db.commit()
+            job_id = job.id
+        finally:
+            db.close()
+        self._queue(username, _Pending(job_id, kind, path, caption or "", video_id, 0, datetime.utcnow()))
+        return job_id
+
+    def _queue(self, username: str, pending: _Pending):
+        with self._cond:
+            heapq.heappush(self._pending.setdefault(username, []), (pending.not_before, pending.job_id, pending))
+            self._buckets.setdefault(username, TokenBucket())
+            self._wake(username, pending.not_before)
+            self._cond.notify()
+
+    def _wake(self, username: str, at: datetime):
+        """Schedules a dispatch check for the account, keeping only its earliest one live."""
+        current = self._ready_at.get(username)
+        if current is not None and current <= at:
+            return
+        self._ready_at[username] = at
+        heapq.heappush(self._ready, (at, next(self._seq), username))
+
+    def _restore(self):
+        """Restores account pacing and re-queues jobs left queued or running by a previous process."""
+        db = get_db_session()
+        try:
+            now = datetime.utcnow()
+            states = db.query(UploadAccountState).all()
+            with self._cond:
+                for state in states:
+                    self._buckets[state.username] = TokenBucket.from_state(state, now)
+            jobs = db.query(UploadJob).filter(UploadJob.status.in_((WorkflowStatus.QUEUED, WorkflowStatus.RUNNING))).all()
+            restored = [
+                (job.username, _Pending(job.id, job.kind, job.path, job.caption or "", job.video_id,
+                                        job.attempts or 0, job.not_before or datetime.utcnow()))
+                for job in jobs
+            ]
+            for job in jobs:
+                job.status = WorkflowStatus.QUEUED
+            db.commit()
+        finally:
+            db.close()
+        for username, pending in restored:
+            self._queue(username, pending)
+        if restored:
+            logger.info(f"Re-queued {len(restored)} uploads from a previous run")
+
+    # Dispatch
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload")
+        self._restore()
+        self._thread = threading.Thread(target=self._dispatch_loop, name="upload-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Upload queue started with {self.workers} workers")
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                timeout = self._dispatch_ready()
+                self._cond.wait(timeout=timeout)
+
+    def _dispatch_ready(self) -> float:
+        """Starts every upload that may start now; returns seconds until the next one might."""
+        now = datetime.utcnow()
+        while self._ready:
+            ready_at, _, username = self._ready[0]
+            if ready_at > now:
+                return min((ready_at - now).total_seconds(), 60.0)
+            heapq.heappop(self._ready)
+            if self._ready_at.get(username) != ready_at:
+                continue  # superseded by an earlier check
+            del self._ready_at[username]
+            queue = self._pending.get(username)
+            if not queue or username in self._in_flight:
+                continue  # rescheduled when the in-flight upload finishes
+            not_before = queue[0][0]
+            wait = max((not_before - now).total_seconds(), self._buckets[username].wait_seconds(now))
+            if wait > 0:
+                self._wake(username, now + timedelta(seconds=wait))
+                continue
+            _, _, pending = heapq.heappop(queue)
+            if not queue:
+                del self._pending[username]
+            self._buckets[username].take(now)
+            self._in_flight.add(username)
+            self._executor.submit(self._run, username, pending)
+        return 60.0
+
+    # Execution
+
+    def _update_job(self, job_id: int, **fields):
+        db = get_db_session()
+        try:
+            db.query(UploadJob).filter(UploadJob.id == job_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self, username: str, pending: _Pending):
+        try:
+            self._attempt(username, pending)
+        except Exception as e:
+            logger.error(f"Upload {pending.job_id} for {username} could not be recorded: {e}", exc_info=True)
+        finally:
+            with self._cond:
+                self._in_flight.discard(username)
+                if username in self._pending:
+                    self._wake(username, datetime.utcnow())
+                self._cond.notify()
+
+    def _attempt(self, username: str, pending: _Pending):
+        try:
+            self._update_job(pending.job_id, status=WorkflowStatus.RUNNING, attempts=pending.attempts + 1)
+        except Exception as e:
+            # Nothing was uploaded; try again shortly instead of dropping the job until a restart
+            logger.warning(f"Could not start upload {pending.job_id} for {username}: {e}")
+            pending.not_before = datetime.utcnow() + timedelta(seconds=self._backoff(1))
+            with self._cond:
+                heapq.heappush(self._pending.setdefault(username, []), (pending.not_before, pending.job_id, pending))
+            return
+        pending.attempts += 1
+        retry_in: Optional[float] = None
+        media_id: Optional[str] = None
+        try:
+            media_id = self.manager.upload_media(username, pending.kind, pending.path, pending.caption)
+        except THROTTLE_ERRORS as e:
+            pause = PLEASE_WAIT_SECONDS if isinstance(e, PleaseWaitFewMinutes) else self._backoff(pending.attempts)
+            with self._cond:
+                self._buckets[username].on_throttle(datetime.utcnow(), pause)
+                self._metrics["throttled"] += 1
+            self._save_bucket(username)
+            logger.warning(f"Upload {pending.job_id} for {username} throttled ({type(e).__name__}); backing off {pause:.0f}s")
+            retry_in = max(pause, self._backoff(pending.attempts))
+            error = f"Throttled: {e}"
+        except BLOCK_ERRORS as e:
+            with self._cond:
+                self._buckets[username].on_block(datetime.utcnow())
+                self._metrics["blocked"] += 1
+            self._save_bucket(username)
+            logger.error(f"Upload {pending.job_id} for {username} hit {type(e).__name__}; pausing account")
+            retry_in = CHALLENGE_PAUSE_SECONDS
+            error = f"{type(e).__name__}: {e}"
+        except LoginRequired:
+            self._fail(username, pending, "Session expired - please re-login")
+        except SessionUnavailable as e:
+            self._fail(username, pending, str(e))
+        except Exception as e:
+            logger.error(f"Upload {pending.job_id} for {username} failed: {e}")
+            retry_in = self._backoff(pending.attempts)
+            error = f"Upload failed: {e}"
+
+        if media_id is not None:
+            # Instagram has the media; recording it must never lead to a second upload
+            self._succeed(username, pending, media_id)
+        elif retry_in is not None:
+            if pending.attempts >= MAX_ATTEMPTS:
+                self._fail(username, pending, error)
+            else:
+                pending.not_before = datetime.utcnow() + timedelta(seconds=retry_in)
+                self._update_job(pending.job_id, status=WorkflowStatus.QUEUED, not_before=pending.not_before, error=error)
+                with self._cond:
+                    self._metrics["retried"] += 1
+                    heapq.heappush(self._pending.setdefault(username, []), (pending.not_before, pending.job_id, pending))
+
+    def _save_bucket(self, username: str):
+        """Persists the account's rate and pause so a restart doesn't reset them."""
+        with self._cond:
+            bucket = self._buckets[username]
+            state = UploadAccountState(
+                username=username,
+                rate_per_hour=bucket.rate_per_hour,
+                paused_until=bucket.paused_until,
+                throttles=bucket.throttles,
+                blocks=bucket.blocks,
+            )
+        db = get_db_session()
+        try:
+            db.merge(state)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Could not save upload pacing for {username}: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        return BACKOFF_SECONDS * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+    def _succeed(self, username: str, pending: _Pending, media_id: str):
+        with self._cond:
+            self._buckets[username].on_success()
+            self._metrics["succeeded"] += 1
+        self._save_bucket(username)
+        for attempt in range(1, SUCCESS_WRITE_ATTEMPTS + 1):
+            try:
+                self._record_success(pending, media_id)
+                return
+            except Exception as e:
+                if attempt == SUCCESS_WRITE_ATTEMPTS:
+                    raise
+                logger.warning(f"Recording upload {pending.job_id} as media {media_id} failed ({e}); retrying")
+                time.sleep(attempt)
+
+    def _record_success(self, pending: _Pending, media_id: str):
+        db = get_db_session()
+        try:
+            db.query(UploadJob).filter(UploadJob.id == pending.job_id).update({
+                UploadJob.status: WorkflowStatus.SUCCEEDED,
+                UploadJob.media_id: media_id,
+                UploadJob.error: None,
+                UploadJob.finished_at: datetime.utcnow(),
+            })
+            if pending.video_id:
+                db.query(Video).filter(Video.id == pending.video_id).update({
+                    Video.media_id: media_id,
+                    Video.status: VideoStatus.POSTED,
+                })
+            db.commit()
+        finally:
+            db.close()
+
+    def _fail(self, username: str, pending: _Pending, error: str):
+        with self._cond:
+            self._metrics["failed"] += 1
+        db = get_db_session()
+        try:
+            db.query(UploadJob).filter(UploadJob.id == pending.job_id).update({
+                UploadJob.status: WorkflowStatus.FAILED,
+                UploadJob.error: error,
+                UploadJob.finished_at: datetime.utcnow(),
+            })
+            if pending.video_id:
+                db.query(Video).filter(Video.id == pending.video_id).update({Video.status: VideoStatus.FAILED})
+            db.commit()
+        finally:
+            db.close()
+        logger.error(f"Upload {pending.job_id} for {username} failed permanently: {error}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._metrics,
+                "queued": sum(len(queue) for queue in self._pending.values()),
+                "in_flight": len(self._in_flight),
+                "accounts": {username: bucket.snapshot() for username, bucket in self._buckets.items()},
+            }
+
+
+upload_queue = UploadQueue()
@@ -1,14 +1,112 @@
 import os
+import time
+import hashlib
 import logging
 import asyncio
 import json
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple
 from pathlib import Path
 from google import genai
-from google.genai import types
+
+from managers.model_router import model_router
+from managers.video_operations import video_operations
 
 logger = logging.getLogger(__name__)
 
+FILE_CACHE_SIZE = int(os.getenv("VERIFY_FILE_CACHE_SIZE", "256"))
+# Processing polls start at POLL_MIN_SECONDS and double up to POLL_MAX_SECONDS
+POLL_MIN_SECONDS = float(os.getenv("VERIFY_POLL_MIN_SECONDS", "1"))
+POLL_MAX_SECONDS = float(os.getenv("VERIFY_POLL_MAX_SECONDS", "16"))
+PROCESSING_TIMEOUT_SECONDS = float(os.getenv("VERIFY_PROCESSING_TIMEOUT_SECONDS", "600"))
+# Uploaded files are deleted by the API after 48 hours; stop reusing them before that
+FILE_TTL = timedelta(hours=47)
+EXPIRY_MARGIN = timedelta(minutes=10)
+_HASH_CHUNK = 1 << 20
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadedFileCache:
+    """
+    Files already uploaded to the GenAI API, keyed by content hash.
+
+    An entry is reused until shortly before the API expires the file, so
+    verifying the same bytes again (or against another persona) skips the
+    upload. Hashes are memoised by (path, size, mtime), so an unchanged file
+    is read once. Concurrent requests for the same content share one upload.
+    """
+
+    def __init__(self, max_entries: int = FILE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._files: "OrderedDict[str, Tuple[Any, datetime]]" = OrderedDict()  # sha256 -> (file, reuse until)
+        self._digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._metrics = {"hits": 0, "uploads": 0, "evictions": 0}
+
+    async def _digest(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = await asyncio.to_thread(file_sha256, path)
+            self._digests[key] = digest
+            if len(self._digests) > self.max_entries:
+                self._digests.popitem(last=False)
+        return digest
+
+    async def get_or_upload(self, path: str, upload: Callable[[str], Awaitable[Any]]) -> Any:
+        """The uploaded file for `path`'s content, calling `upload(path)` only on a miss."""
+        digest = await self._digest(path)
+        entry = self._files.get(digest)
+        if entry is not None:
+            if entry[1] > datetime.now(timezone.utc):
+                self._files.move_to_end(digest)
+                self._metrics["hits"] += 1
+                return entry[0]
+            del self._files[digest]
+
+        pending = self._pending.get(digest)
+        if pending is None:
+            pending = asyncio.ensure_future(self._upload(digest, path, upload))
+            self._pending[digest] = pending
+        return await asyncio.shield(pending)
+
+    async def _upload(self, digest: str, path: str, upload: Callable[[str], Awaitable[Any]]) -> Any:
+        try:
+            uploaded = await upload(path)
+        finally:
+            self._pending.pop(digest, None)
+        now = datetime.now(timezone.utc)
+        reuse_until = now + FILE_TTL
+        expires = getattr(uploaded, "expiration_time", None)
+        if expires is not None:
+            reuse_until = min(reuse_until, expires - EXPIRY_MARGIN)
+        self._files[digest] = (uploaded, reuse_until)
+        if len(self._files) > self.max_entries:
+            self._files.popitem(last=False)
+        self._metrics["uploads"] += 1
+        return uploaded
+
+    def evict(self, name: str):
+        """Forgets the cached upload with this remote file name, e.g. after the API rejected it."""
+        for digest, (uploaded, _) in list(self._files.items()):
+            if uploaded.name == name:
+                del self._files[digest]
+                self._metrics["evictions"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._metrics, "cached_files": len(self._files)}
+
+
 class VeoVideoGenerator:
     """
     Handles video generation using Veo 3.1 Fast and 
@@ -24,20 +122,19 @@ class VeoVideoGenerator:
             
         self.output_dir = Path("storage/generated_videos")
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.files = UploadedFileCache()
 
-    async def generate_video(self, prompt: str, duration_seconds: int = 5) -> Optional[str]:
+    async def generate_video(
+        self, prompt: str, duration_seconds: int = 5, influencer_id: Optional[int] = None
+    ) -> Optional[str]:
         """
-        Mock implementation for safe testing.
-        Prints intent and returns a dummy URL.
+        Generates a video through the operation tracker and waits for it.
+        Returns the video URL or path, or None if generation failed.
+        Callers that shouldn't block use video_operations.submit() and a listener instead.
         """
-        print(f"MOCK: Generating Video for {prompt}")
-        
-        # Simulate API latency
-        await asyncio.sleep(1)
-        
-        dummy_url = "https://example.com/dummy_video.mp4"
-        logger.info(f"Mock video generated: {dummy_url}")
-        return dummy_url
+        operation_id = await video_operations.submit(influencer_id, prompt, duration_seconds=duration_seconds)
+        result = await video_operations.wait(operation_id)
+        return result["video_url"] if result["status"] == "succeeded" else None
 
     async def verify_content(self, video_path: str, script: str, persona_vibe: str) -> bool:
         """
@@ -72,26 +169,13 @@ class VeoVideoGenerator:
         **Output:** JSON boolean "is_safe_to_post": true/false and "reason": "string".
         """
         
+        video_file = None
         try:
-            # Upload video file to GenAI API (Synchronous upload)
-            # Fix: use file= argument for local path upload
-            video_file = self.client.files.upload(file=video_path)
-            
-            # Wait for processing state (basic polling)
-            while video_file.state.name == "PROCESSING":
-                await asyncio.sleep(1)
-                video_file = self.client.files.get(name=video_file.name)
-
-            if video_file.state.name == "FAILED":
-                logger.error(f"Video file processing failed: {video_file.uri}")
-                return False
+            # Reuses the upload of identical bytes; only a miss uploads and waits for processing
+            video_file = await self.files.get_or_upload(video_path, self._upload_video)
             
-            response = await self.client.aio.models.generate_content(
-                model="models/gemini-3-flash-preview",
-                contents=[video_file, prompt],
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json"
-                )
+            response = await model_router.agenerate(
+                self.client, "verification", [video_file, prompt], response_mime_type="application/json"
             )
             
             data = json.loads(response.text)
@@ -107,6 +191,25 @@ class VeoVideoGenerator:
             
         except Exception as e:
             logger.error(f"Multimodal verification failed: {e}")
+            if video_file is not None:
+                # The remote file may be gone; upload afresh next time
+                self.files.evict(video_file.name)
             return False
 
+    async def _upload_video(self, video_path: str):
+        """Uploads without blocking the event loop and waits until the file is ACTIVE."""
+        video_file = await self.client.aio.files.upload(file=video_path)
+        delay = POLL_MIN_SECONDS
+        deadline = time.monotonic() + PROCESSING_TIMEOUT_SECONDS
+        while video_file.state.name == "PROCESSING":
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Video file {video_file.name} still processing after {PROCESSING_TIMEOUT_SECONDS:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, POLL_MAX_SECONDS)
+            video_file = await self.client.aio.files.get(name=video_file.name)
+
+        if video_file.state.name == "FAILED":
+            raise RuntimeError(f"Video file processing failed: {video_file.uri}")
+        return video_file
+
 video_generator = VeoVideoGenerator()
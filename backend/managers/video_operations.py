@@ -0,0 +1,364 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from google.genai import types
+
+from database.models import get_db_session, VideoOperation, WorkflowStatus
+from managers.ai_generator import ai_generator
+
+logger = logging.getLogger(__name__)
+
+VEO_MODEL = os.getenv("VEO_MODEL", "models/veo-3.1-fast-generate-preview")
+MAX_CONCURRENT = int(os.getenv("VEO_MAX_CONCURRENT", "2"))
+# First poll after POLL_MIN_SECONDS, then 1.5x longer each time up to POLL_MAX_SECONDS
+POLL_MIN_SECONDS = float(os.getenv("VEO_POLL_MIN_SECONDS", "10"))
+POLL_MAX_SECONDS = float(os.getenv("VEO_POLL_MAX_SECONDS", "60"))
+LOCAL_LATENCY_SECONDS = float(os.getenv("VEO_LOCAL_LATENCY_SECONDS", "1"))
+# A running operation is failed, and its slot freed, after this many polls in a row raise
+# (e.g. a handle that expired while the server was down) or once it has run this long
+MAX_POLL_ERRORS = int(os.getenv("VEO_MAX_POLL_ERRORS", "5"))
+MAX_RUNNING = timedelta(minutes=int(os.getenv("VEO_MAX_RUNNING_MINUTES", "30")))
+
+OUTPUT_DIR = Path("storage/generated_videos")
+DUMMY_VIDEO_URL = "https://example.com/dummy_video.mp4"
+
+# (state, video URL or path, error) with state one of running, succeeded, failed
+OperationState = Tuple[str, Optional[str], Optional[str]]
+
+
+class VeoProvider:
+    """Starts Veo generations as long-running operations and downloads finished videos."""
+
+    name = "veo"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, prompt: str, duration_seconds: int) -> str:
+        operation = self.client.models.generate_videos(
+            model=VEO_MODEL,
+            prompt=prompt,
+            config=types.GenerateVideosConfig(number_of_videos=1, duration_seconds=duration_seconds),
+        )
+        return operation.name
+
+    def status(self, operation_name: str) -> OperationState:
+        operation = self.client.operations.get(types.GenerateVideosOperation(name=operation_name))
+        if not operation.done:
+            return "running", None, None
+        if operation.error:
+            return "failed", None, str(operation.error)
+        videos = operation.response.generated_videos if operation.response else None
+        if not videos:
+            return "failed", None, "Operation finished without a video"
+        video = videos[0].video
+        self.client.files.download(file=video)
+        path = OUTPUT_DIR / f"{operation_name.rsplit('/', 1)[-1]}.mp4"
+        video.save(str(path))
+        return "succeeded", str(path), None
+
+
+class LocalVideoProvider:
+    """
+    File-based stand-in for the Veo operations API.
+    An operation finishes `latency_seconds` after submission with `responder(prompt)`
+    as its video URL, or fails if that returns None. Handles are files under
+    OUTPUT_DIR, so they survive restarts like real operation names.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        latency_seconds: float = LOCAL_LATENCY_SECONDS,
+        responder: Optional[Callable[[str], Optional[str]]] = None,
+    ):
+        self.latency_seconds = latency_seconds
+        self.responder = responder or (lambda prompt: DUMMY_VIDEO_URL)
+
+    def submit(self, prompt: str, duration_seconds: int) -> str:
+        operation_name = f"local-{uuid.uuid4().hex[:12]}"
+        (OUTPUT_DIR / f"{operation_name}.op.json").write_text(
+            json.dumps({"prompt": prompt, "ready_at": time.time() + self.latency_seconds})
+        )
+        return operation_name
+
+    def status(self, operation_name: str) -> OperationState:
+        meta_path = OUTPUT_DIR / f"{operation_name}.op.json"
+        if not meta_path.exists():
+            return "failed", None, "Unknown operation"
+        meta = json.loads(meta_path.read_text())
+        if time.time() < meta["ready_at"]:
+            return "running", None, None
+        url = self.responder(meta["prompt"])
+        if url is None:
+            return "failed", None, "Generation failed"
+        return "succeeded", url, None
+
+
+def _describe(operation: VideoOperation) -> Dict[str, Any]:
+    return {
+        "id": operation.id,
+        "influencer_id": operation.influencer_id,
+        "prompt": operation.prompt,
+        "topic": operation.topic,
+        "status": operation.status.value,
+        "video_url": operation.video_url,
+        "error": operation.error,
+    }
+
+
+class VideoOperationTracker:
+    """
+    Video generations as tracked long-running operations.
+
+    submit() records a queued row and returns at once. One loop starts queued
+    generations while a slot of the concurrency semaphore is free, and polls
+    every running operation that is due, all due polls concurrently. Each
+    operation is first polled after POLL_MIN_SECONDS, then at intervals growing
+    by half up to POLL_MAX_SECONDS. Rows keep the provider's operation name, so
+    operations still running at a restart are resumed. An operation whose polls
+    keep failing, or that runs longer than MAX_RUNNING, is failed so it gives up
+    its slot. A finished operation resolves wait() callers and is passed to every
+    listener in its own task.
+    """
+
+    def __init__(self, provider, max_concurrent: int = MAX_CONCURRENT):
+        self.provider = provider
+        self.max_concurrent = max_concurrent
+        # Run as tasks with the finished operation's _describe() dict
+        self.listeners: List[Callable[[Dict[str, Any]], Awaitable[None]]] = []
+        self._listener_tasks: Set[asyncio.Task] = set()
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._slotted: Set[int] = set()
+        self._wake = asyncio.Event()
+        self._running: Dict[int, str] = {}  # operation id -> provider operation name
+        self._due: Dict[int, Tuple[float, float]] = {}  # operation id -> (next poll, interval)
+        self._poll_errors: Dict[int, int] = {}  # operation id -> consecutive failed polls
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self._is_running = False
+        self._metrics = {"submitted": 0, "succeeded": 0, "failed": 0, "polls": 0}
+        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    async def submit(
+        self, influencer_id: Optional[int], prompt: str, topic: Optional[str] = None, duration_seconds: int = 5
+    ) -> int:
+        """Queues a generation and returns its operation id."""
+        db = get_db_session()
+        try:
+            operation = VideoOperation(
+                influencer_id=influencer_id,
+                provider=self.provider.name,
+                prompt=prompt,
+                topic=topic,
+                duration_seconds=duration_seconds,
+            )
+            db.add(operation)
+            db.commit()
+            operation_id = operation.id
+        finally:
+            db.close()
+        self._wake.set()
+        return operation_id
+
+    async def wait(self, operation_id: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """The finished operation as a dict; raises asyncio.TimeoutError after `timeout` seconds."""
+        db = get_db_session()
+        try:
+            operation = db.query(VideoOperation).filter(VideoOperation.id == operation_id).first()
+            if operation is None:
+                raise ValueError(f"Video operation {operation_id} not found")
+            if operation.status in (WorkflowStatus.SUCCEEDED, WorkflowStatus.FAILED):
+                return _describe(operation)
+        finally:
+            db.close()
+        # Registered before the next await, so the loop can't finish the operation unseen
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(operation_id, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self._waiters.get(operation_id)
+            if waiters and future in waiters:
+                waiters.remove(future)
+
+    async def _run(self):
+        await self._restore()
+        while self._is_running:
+            self._wake.clear()
+            try:
+                await self._start_queued()
+                await self._poll_due()
+            except Exception as e:
+                logger.error(f"Video operation loop failed: {e}", exc_info=True)
+            next_poll = min((due for due, _ in self._due.values()), default=time.monotonic() + POLL_MAX_SECONDS)
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, next_poll - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _restore(self):
+        db = get_db_session()
+        try:
+            for operation in db.query(VideoOperation).filter(VideoOperation.status == WorkflowStatus.RUNNING).all():
+                if not operation.operation_name:
+                    # Interrupted before the provider accepted it
+                    operation.status = WorkflowStatus.QUEUED
+                    continue
+                if not self._slots.locked():
+                    await self._slots.acquire()
+                    self._slotted.add(operation.id)
+                self._track(operation.id, operation.operation_name)
+            db.commit()
+        finally:
+            db.close()
+        if self._running:
+            logger.info(f"Resumed {len(self._running)} video operations")
+
+    def _track(self, operation_id: int, operation_name: str):
+        self._running[operation_id] = operation_name
+        self._due[operation_id] = (time.monotonic() + POLL_MIN_SECONDS, POLL_MIN_SECONDS)
+
+    async def _start_queued(self):
+        if self._slots.locked():
+            return
+        db = get_db_session()
+        try:
+            queued = (
+                db.query(VideoOperation)
+                .filter(VideoOperation.status == WorkflowStatus.QUEUED)
+                .order_by(VideoOperation.id)
+                .all()
+            )
+            for operation in queued:
+                if self._slots.locked():
+                    break
+                await self._slots.acquire()
+                self._slotted.add(operation.id)
+                operation.status = WorkflowStatus.RUNNING
+                operation.started_at = datetime.utcnow()
+                db.commit()
+                try:
+                    name = await asyncio.to_thread(self.provider.submit, operation.prompt, operation.duration_seconds)
+                except Exception as e:
+                    logger.error(f"Submitting video operation {operation.id} failed: {e}")
+                    self._finish(db, operation, "failed", None, str(e))
+                    continue
+                operation.operation_name = name
+                db.commit()
+                self._track(operation.id, name)
+                self._metrics["submitted"] += 1
+                logger.info(f"Started video operation {operation.id} as {name}")
+        finally:
+            db.close()
+
+    async def _poll_due(self):
+        now = time.monotonic()
+        due = [operation_id for operation_id, (at, _) in self._due.items() if at <= now]
+        if not due:
+            return
+        states = await asyncio.gather(
+            *(asyncio.to_thread(self.provider.status, self._running[operation_id]) for operation_id in due),
+            return_exceptions=True,
+        )
+        self._metrics["polls"] += len(due)
+
+        db = get_db_session()
+        try:
+            for operation_id, state in zip(due, states):
+                operation = db.query(VideoOperation).filter(VideoOperation.id == operation_id).first()
+                if operation is None:
+                    self._release(operation_id)
+                    continue
+                operation.polls = (operation.polls or 0) + 1
+                if isinstance(state, Exception):
+                    errors = self._poll_errors[operation_id] = self._poll_errors.get(operation_id, 0) + 1
+                    logger.warning(f"Polling video operation {operation_id} failed ({errors} in a row): {state}")
+                    if errors >= MAX_POLL_ERRORS:
+                        self._finish(db, operation, "failed", None, f"Polling failed {errors} times in a row: {state}")
+                        continue
+                else:
+                    self._poll_errors.pop(operation_id, None)
+                if isinstance(state, Exception) or state[0] == "running":
+                    started_at = operation.started_at or operation.created_at
+                    if started_at and datetime.utcnow() - started_at > MAX_RUNNING:
+                        self._finish(db, operation, "failed", None, f"Still not finished after {MAX_RUNNING}")
+                        continue
+                    interval = min(self._due[operation_id][1] * 1.5, POLL_MAX_SECONDS)
+                    self._due[operation_id] = (time.monotonic() + interval, interval)
+                    db.commit()
+                    continue
+                self._finish(db, operation, *state)
+        finally:
+            db.close()
+
+    def _release(self, operation_id: int):
+        self._running.pop(operation_id, None)
+        self._due.pop(operation_id, None)
+        self._poll_errors.pop(operation_id, None)
+        if operation_id in self._slotted:
+            self._slotted.discard(operation_id)
+            self._slots.release()
+
+    def _finish(self, db, operation: VideoOperation, state: str, video_url: Optional[str], error: Optional[str]):
+        operation.status = WorkflowStatus.SUCCEEDED if state == "succeeded" else WorkflowStatus.FAILED
+        operation.video_url = video_url
+        operation.error = error
+        operation.finished_at = datetime.utcnow()
+        db.commit()
+        self._release(operation.id)
+        self._metrics[state] += 1
+        if error:
+            logger.error(f"Video operation {operation.id} failed: {error}")
+
+        result = _describe(operation)
+        for future in self._waiters.pop(operation.id, []):
+            if not future.done():
+                future.set_result(result)
+        # Listeners may take minutes (verification); run them beside the loop, not in it
+        for listener in self.listeners:
+            task = asyncio.create_task(listener(result))
+            self._listener_tasks.add(task)
+            task.add_done_callback(self._listener_done)
+
+    def _listener_done(self, task: asyncio.Task):
+        self._listener_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Video operation listener failed: {task.exception()}", exc_info=task.exception())
+
+    def start(self):
+        """Starts the operation loop on the running event loop."""
+        if self._is_running:
+            return
+        self._is_running = True
+        asyncio.create_task(self._run())
+        logger.info(f"Video operations via {self.provider.name} provider, at most {self.max_concurrent} at once")
+
+    def stop(self):
+        self._is_running = False
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._metrics,
+            "running": len(self._running),
+            "free_slots": self.max_concurrent - len(self._slotted),
+            "waiters": sum(len(waiters) for waiters in self._waiters.values()),
+            "listeners_running": len(self._listener_tasks),
+        }
+
+
+def _default_provider():
+    if os.getenv("VEO_PROVIDER", "local") == "veo" and ai_generator.client:
+        return VeoProvider(ai_generator.client)
+    return LocalVideoProvider()
+
+
+video_operations = VideoOperationTracker(_default_provider())
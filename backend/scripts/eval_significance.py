@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Evaluates the local significance pre-filter on a labelled fixture set.
+
+The fixture has a training split ("events"), which the weights are fitted on, and a
+held-out split ("held_out") that is only used for evaluation.
+
+Usage (from backend/):
+    python scripts/eval_significance.py                 # held-out metrics per threshold
+    python scripts/eval_significance.py --split events  # same, on the training split
+    python scripts/eval_significance.py --fit           # refit WEIGHTS/BIAS on the training split
+"""
+
+import argparse
+import json
+import math
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from managers.significance_filter import SignificanceFilter, StoryIndex, WEIGHTS, BIAS  # noqa: E402
+
+FIXTURE = Path(__file__).resolve().parent / "fixtures" / "significance_events.json"
+
+
+def evaluate(classifier: SignificanceFilter, story: str, events, threshold: float):
+    classifier.threshold = threshold
+    tp = fp = tn = fn = 0
+    misses = []
+    for event in events:
+        forward, score = classifier.assess(event["text"], story, index_key=(0, 0))
+        if event["significant"] and forward:
+            tp += 1
+        elif event["significant"]:
+            fn += 1
+            misses.append(("missed", score, event["text"]))
+        elif forward:
+            fp += 1
+            misses.append(("forwarded", score, event["text"]))
+        else:
+            tn += 1
+    return {
+        "threshold": threshold,
+        "skip_rate": (tn + fn) / len(events),
+        "recall": tp / (tp + fn) if tp + fn else 1.0,
+        "precision": tp / (tp + fp) if tp + fp else 1.0,
+        "missed": fn,
+        "errors": misses,
+    }
+
+
+def fit(classifier: SignificanceFilter, story: str, events, epochs: int = 4000, lr: float = 0.05, l2: float = 0.01):
+    """Plain batch gradient descent on the logistic loss, with significant events weighted 3x."""
+    index = StoryIndex(story)
+    rows = [(classifier.features(e["text"], index), 1.0 if e["significant"] else 0.0) for e in events]
+    weights, bias = dict(WEIGHTS), BIAS
+    for _ in range(epochs):
+        grad = {name: 0.0 for name in weights}
+        grad_bias = 0.0
+        for features, label in rows:
+            z = bias + sum(weights[n] * v for n, v in features.items())
+            error = (1.0 / (1.0 + math.exp(-z)) - label) * (3.0 if label else 1.0)
+            for name, value in features.items():
+                grad[name] += error * value
+            grad_bias += error
+        for name in weights:
+            weights[name] -= lr * (grad[name] / len(rows) + l2 * weights[name])
+        bias -= lr * grad_bias / len(rows)
+    return weights, bias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fit", action="store_true", help="Refit the model weights on the training split and print them")
+    parser.add_argument("--split", choices=("held_out", "events"), default="held_out", help="Fixture split to evaluate")
+    parser.add_argument("--threshold", type=float, default=None, help="Show errors at this threshold")
+    args = parser.parse_args()
+
+    fixture = json.loads(FIXTURE.read_text())
+    story = fixture["story"]
+    classifier = SignificanceFilter(threshold=0.1)
+    default_threshold = classifier.threshold
+
+    if args.fit:
+        weights, bias = fit(classifier, story, fixture["events"])
+        print("WEIGHTS = {")
+        for name, value in weights.items():
+            print(f'    "{name}": {value:.2f},')
+        print("}")
+        print(f"BIAS = {bias:.2f}")
+        return
+
+    events = fixture[args.split]
+    print(f"{args.split}: {len(events)} events, {sum(e['significant'] for e in events)} significant\n")
+    print(f"{'threshold':>9} {'skip_rate':>9} {'recall':>7} {'precision':>9}")
+    for threshold in (0.02, 0.05, 0.1, 0.2, 0.3, 0.5):
+        result = evaluate(classifier, story, events, threshold)
+        print(f"{threshold:>9.2f} {result['skip_rate']:>9.2f} {result['recall']:>7.2f} {result['precision']:>9.2f}")
+
+    threshold = args.threshold if args.threshold is not None else default_threshold
+    errors = evaluate(classifier, story, events, threshold)["errors"]
+    print(f"\nErrors at threshold {threshold}:")
+    for kind, score, text in errors or [("none", 0.0, "")]:
+        print(f"  {kind:<9} {score:.2f}  {text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""In-memory stand-in for the parts of instagrapi.Client used by comment and metrics ingestion"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import itertools
+import threading
+
+
+@dataclass
+class FakeUser:
+    username: str
+
+
+@dataclass
+class FakeComment:
+    """Mirrors the instagrapi Comment fields the ingestor reads."""
+    pk: str
+    text: str
+    user: FakeUser
+    created_at_utc: datetime
+
+
+@dataclass
+class FakeMedia:
+    """Mirrors the instagrapi Media counters the metrics ingester reads."""
+    id: str
+    pk: str
+    like_count: int = 0
+    comment_count: int = 0
+    play_count: Optional[int] = None
+    view_count: Optional[int] = None
+    reach: Optional[int] = None
+
+
+@dataclass
+class FakeInstagramClient:
+    """
+    Keeps comments per media id and pages through them newest first, like
+    Client.media_comments_chunk. `calls` counts page requests so tests can
+    check that a poll only touches pages with new comments. Media counters
+    set with set_media_metrics are served by user_medias_v1, media_info and
+    insights_media; `media_calls` counts those requests.
+    """
+    comments: Dict[str, List[FakeComment]] = field(default_factory=dict)
+    media: Dict[str, FakeMedia] = field(default_factory=dict)
+    calls: int = 0
+    media_calls: int = 0
+    user_id: str = "1"
+
+    def __post_init__(self):
+        self._ids = itertools.count(17900000000000000)
+        self._lock = threading.Lock()
+
+    def add_comment(self, media_id: str, text: str, username: str = "fan", at: Optional[datetime] = None) -> FakeComment:
+        with self._lock:
+            thread = self.comments.setdefault(media_id, [])
+            if at is None:
+                at = datetime.utcnow()
+                if thread and at <= thread[-1].created_at_utc:
+                    at = thread[-1].created_at_utc + timedelta(microseconds=1)
+            comment = FakeComment(pk=str(next(self._ids)), text=text, user=FakeUser(username), created_at_utc=at)
+            thread.append(comment)
+            thread.sort(key=lambda c: c.created_at_utc)
+            return comment
+
+    def media_comments_chunk(
+        self, media_id: str, max_amount: int, min_id: Optional[str] = None
+    ) -> Tuple[List[FakeComment], Optional[str]]:
+        """One page of comments, newest first. `min_id` is the cursor returned by the previous page."""
+        with self._lock:
+            self.calls += 1
+            newest_first = list(reversed(self.comments.get(media_id, [])))
+        start = int(min_id) if min_id else 0
+        page = newest_first[start:start + max_amount]
+        end = start + len(page)
+        return page, (str(end) if end < len(newest_first) else None)
+
+    def set_media_metrics(
+        self, media_id: str, likes: int = 0, comments: int = 0, views: Optional[int] = None, reach: Optional[int] = None
+    ) -> FakeMedia:
+        with self._lock:
+            media = self.media.get(media_id) or FakeMedia(id=media_id, pk=media_id.split("_")[0])
+            media.like_count, media.comment_count = likes, comments
+            media.play_count = media.view_count = views
+            media.reach = reach
+            self.media[media_id] = media
+            return media
+
+    def user_medias_v1(self, user_id: str, amount: int = 20) -> List[FakeMedia]:
+        """The account's most recent media, newest first."""
+        with self._lock:
+            self.media_calls += 1
+            return list(reversed(list(self.media.values())))[:amount]
+
+    def media_info(self, media_pk: str) -> FakeMedia:
+        with self._lock:
+            self.media_calls += 1
+            for media in self.media.values():
+                if media.pk == str(media_pk):
+                    return media
+        raise KeyError(f"Media {media_pk} not found")
+
+    def insights_media(self, media_pk: str) -> Dict[str, int]:
+        media = self.media_info(media_pk)
+        return {"reach_count": media.reach or 0}
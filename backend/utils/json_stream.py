@@ -0,0 +1,73 @@
+"""Incremental parsing of streamed JSON responses"""
+
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+class JSONArrayStreamParser:
+    """
+    Incrementally parses a top-level JSON array of objects fed in arbitrary chunks.
+    feed() returns every object that became complete with that chunk, so callers
+    can act on the first element long before the closing bracket arrives.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0  # next character of _buffer to scan
+        self._depth = 0  # 1 = inside the top-level array
+        self._in_string = False
+        self._escaped = False
+        self._object_start = -1
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._buffer += chunk
+        completed: List[Dict[str, Any]] = []
+        buffer = self._buffer
+
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                if char == "{" and self._depth == 1:
+                    self._object_start = i
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if char == "}" and self._depth == 1 and self._object_start >= 0:
+                    raw = buffer[self._object_start:i + 1]
+                    self._object_start = -1
+                    try:
+                        value = json.loads(raw)
+                        if isinstance(value, dict):
+                            completed.append(value)
+                    except ValueError as e:
+                        logger.warning(f"Skipping malformed streamed element: {e}")
+            i += 1
+
+        # Drop everything before the object in progress so the buffer stays small
+        keep_from = self._object_start if self._object_start >= 0 else i
+        self._buffer = buffer[keep_from:]
+        if self._object_start >= 0:
+            self._object_start = 0
+        self._pos = i - keep_from
+        return completed
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yields each object of a streamed JSON array as soon as it is complete."""
+    parser = JSONArrayStreamParser()
+    for chunk in chunks:
+        if chunk:
+            yield from parser.feed(chunk)
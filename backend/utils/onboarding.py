@@ -0,0 +1,76 @@
+"""Onboarding steps that run after POST /sorcerer/init has returned"""
+
+from typing import Any, Dict, List
+import os
+import time
+import logging
+
+from database.models import get_db_session, Influencer, InstagramAccount, LinkStatus
+from managers.ai_generator import ai_generator
+from managers.life_story_store import life_story_store
+from utils.background_tasks import plan_and_schedule_from_life_story, clear_future_posts
+
+logger = logging.getLogger(__name__)
+
+LINK_MAX_ATTEMPTS = int(os.getenv("INSTAGRAM_LINK_MAX_ATTEMPTS", "4"))
+LINK_RETRY_SECONDS = float(os.getenv("INSTAGRAM_LINK_RETRY_SECONDS", "60"))
+
+UNFINISHED_LINKS = (LinkStatus.PENDING, LinkStatus.LINKING, LinkStatus.RETRYING)
+
+
+def link_account_workflow(tracker, manager, username: str) -> Dict[str, Any]:
+    """
+    Logs a registered account in and fetches its profile.
+    Transient failures (rate limits, network errors) are retried with doubling
+    delays; challenges and bad credentials fail the job at once.
+    """
+    for attempt in range(1, LINK_MAX_ATTEMPTS + 1):
+        tracker.step(f"login_attempt_{attempt}")
+        status, message = manager.link_account(username, allow_retry=attempt < LINK_MAX_ATTEMPTS)
+        if status == LinkStatus.LINKED:
+            return {"username": username, "link_status": status.value, "attempts": attempt}
+        if status == LinkStatus.FAILED:
+            raise RuntimeError(message)
+        delay = LINK_RETRY_SECONDS * 2 ** (attempt - 1)
+        tracker.step(f"retrying_in_{int(delay)}s")
+        time.sleep(delay)
+    raise RuntimeError(f"Could not link {username}")
+
+
+def onboarding_workflow(
+    tracker, influencer_id: int, days_to_plan: int, use_batch: bool = False, resume: bool = False
+) -> Dict[str, Any]:
+    """
+    Writes a new lifestyle influencer's life story, then plans their posts from it.
+    With resume (a re-run after a restart), a story already written is kept and
+    posts from the interrupted planning are replaced.
+    """
+    db = get_db_session()
+    try:
+        influencer = db.query(Influencer).filter(Influencer.id == influencer_id).first()
+        if not influencer:
+            raise ValueError(f"Influencer {influencer_id} not found")
+
+        tracker.step("life_story")
+        version = influencer.life_story_version if resume else None
+        if version is None:
+            life_story = ai_generator.generate_life_story(influencer.name, influencer.persona or {})
+            version = life_story_store.write(db, influencer, life_story, event="Generated at onboarding")
+        if resume:
+            clear_future_posts(db, influencer_id)
+    finally:
+        db.close()
+
+    tracker.step("planning")
+    plan_and_schedule_from_life_story(influencer_id, days_to_plan=days_to_plan, use_batch=use_batch)
+    return {"life_story_version": version, "days_planned": days_to_plan, "use_batch": use_batch}
+
+
+def unfinished_links() -> List[InstagramAccount]:
+    """Accounts whose linking was interrupted, e.g. by a restart."""
+    db = get_db_session()
+    try:
+        return db.query(InstagramAccount).filter(InstagramAccount.link_status.in_(UNFINISHED_LINKS)).all()
+    finally:
+        db.close()
+
@@ -0,0 +1,179 @@
+"""Incremental replanning of an influencer's upcoming posts after a life-story change"""
+
+from typing import Any, Dict, List, Optional, Sequence
+from datetime import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from database.models import get_db_session, Influencer, Video, Schedule
+from managers.ai_generator import ai_generator
+from managers.life_story_store import life_story_store
+from managers.scheduler import video_scheduler
+from managers.calendar_index import calendar_index
+from utils.background_tasks import (
+    CONTENT_MAX_WORKERS,
+    clear_future_posts,
+    delete_future_posts,
+    plan_and_schedule_from_life_story,
+    _generate_post_content,
+)
+
+logger = logging.getLogger(__name__)
+
+REPLAN_DAYS = 30
+SUMMARY_CHARS = 160
+
+
+def _post_summary(video: Video) -> str:
+    prompt = video.generation_prompt or {}
+    summary = prompt.get("description") if isinstance(prompt, dict) else None
+    return (summary or video.caption or "No description").replace("\n", " ")[:SUMMARY_CHARS]
+
+
+def _upcoming_posts(db, influencer_id: int, exclude_video_ids: Sequence[int]) -> List[Dict[str, Any]]:
+    query = (
+        db.query(Video, Schedule.run_at)
+        .join(Schedule, Schedule.video_id == Video.id)
+        .filter(Video.influencer_id == influencer_id)
+        .filter(Schedule.run_at > datetime.now())
+    )
+    if exclude_video_ids:
+        query = query.filter(Video.id.notin_(exclude_video_ids))
+
+    return [
+        {
+            "video_id": video.id,
+            "run_at": run_at,
+            "date": run_at.strftime("%Y-%m-%d %H:%M"),
+            "content_type": video.content_type,
+            "summary": _post_summary(video),
+        }
+        for video, run_at in query.order_by(Schedule.run_at).all()
+    ]
+
+
+def _replan_from_scratch(db, influencer_id: int, exclude_video_ids: Sequence[int]) -> Dict[str, Any]:
+    removed = clear_future_posts(db, influencer_id, exclude_video_ids=list(exclude_video_ids))
+    logger.info(f"Full replan for influencer {influencer_id}: removed {removed} upcoming posts.")
+    plan_and_schedule_from_life_story(influencer_id, REPLAN_DAYS)
+    return {"mode": "full", "removed": removed}
+
+
+def _replan_upcoming(db, influencer: Influencer, change_description: str, exclude_video_ids: List[int]) -> Dict[str, Any]:
+    """Core of the incremental replan. Raises on failure; returns a summary of what changed."""
+    posts = _upcoming_posts(db, influencer.id, exclude_video_ids)
+    if not posts:
+        plan_and_schedule_from_life_story(influencer.id, REPLAN_DAYS)
+        return {"mode": "full", "removed": 0}
+
+    affected = ai_generator.find_affected_posts(influencer, change_description, posts)
+    if affected is None:
+        return _replan_from_scratch(db, influencer.id, exclude_video_ids)
+    if not affected:
+        logger.info(f"Life-story change for influencer {influencer.id} affects no upcoming posts.")
+        return {"mode": "incremental", "upcoming": len(posts), "replaced": 0}
+
+    affected = list({a["video_id"]: a for a in affected}.values())
+    slots = {p["video_id"]: p for p in posts}
+    items = [
+        {"post_context": a.get("post_context") or "A moment from their life.", "slot": slots[a["video_id"]]}
+        for a in affected
+    ]
+    with ThreadPoolExecutor(max_workers=CONTENT_MAX_WORKERS) as pool:
+        results = list(pool.map(lambda item: _generate_post_content(influencer, item), items))
+
+    # Old posts are deleted and their replacements inserted in one transaction, and
+    # dispatch jobs change only after it commits, so a failure leaves the old posts in place
+    _, old_job_ids = delete_future_posts(db, influencer.id, video_ids=[a["video_id"] for a in affected])
+
+    videos = [
+        Video(
+            influencer_id=influencer.id,
+            scheduled_time=item["slot"]["run_at"],
+            content_type=item["slot"]["content_type"],
+            generation_prompt=prompt_data,
+            caption=caption,
+            hashtags=["aiinfluencer", "lifestory"],
+            platform="instagram",
+        )
+        for item, prompt_data, caption in results
+    ]
+    db.add_all(videos)
+    db.flush()
+
+    schedules = [Schedule(video_id=v.id, run_at=v.scheduled_time, is_active=True) for v in videos]
+    db.add_all(schedules)
+    db.commit()
+
+    video_scheduler.cancel_schedules(old_job_ids)
+    for schedule in schedules:
+        schedule.job_id = video_scheduler.schedule_video(schedule.id, schedule.run_at)
+    db.commit()
+    calendar_index.invalidate(influencer.id)
+
+    logger.info(f"Replanned {len(videos)} of {len(posts)} upcoming posts for influencer {influencer.id}.")
+    return {"mode": "incremental", "upcoming": len(posts), "replaced": len(videos)}
+
+
+def _load_detached(db, influencer_id: int) -> Optional[Influencer]:
+    influencer = db.query(Influencer).filter(Influencer.id == influencer_id).first()
+    if influencer:
+        # Worker threads read the influencer; detach it so commits here don't expire it under them
+        db.expunge(influencer)
+    return influencer
+
+
+def replan_after_story_change(
+    influencer_id: int,
+    change_description: str,
+    exclude_video_ids: Optional[Sequence[int]] = None,
+):
+    """
+    Regenerates only the upcoming posts that the life-story change makes inconsistent.
+
+    Affected posts keep their time slot and content type; everything else stays
+    scheduled. Falls back to a full replan if the model cannot decide.
+    """
+    db = get_db_session()
+    try:
+        influencer = _load_detached(db, influencer_id)
+        if not influencer or not influencer.life_story:
+            logger.warning(f"Cannot replan influencer {influencer_id}: No influencer or life story found.")
+            return
+        _replan_upcoming(db, influencer, change_description, list(exclude_video_ids or []))
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error replanning influencer {influencer_id}: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+def divine_intervention_workflow(tracker, influencer_id: int, event_description: str, intensity: str) -> Dict[str, Any]:
+    """Background workflow behind POST /influencer/{id}/divine-intervention: rewrite, then replan."""
+    db = get_db_session()
+    try:
+        influencer = db.query(Influencer).filter(Influencer.id == influencer_id).first()
+        if not influencer:
+            raise ValueError(f"Influencer {influencer_id} not found")
+
+        tracker.step("rewriting_story")
+        head = influencer.life_story_version
+        updated_story = ai_generator.rewrite_life_story(
+            influencer.life_story, event_description, intensity, influencer_id=influencer_id
+        )
+        version = life_story_store.write(
+            db, influencer, updated_story, event=f"Divine intervention ({intensity}): {event_description}"
+        )
+        # Stories still in the legacy column are imported as the version before the rewrite
+        previous_version = head if head is not None else (version - 1 or None)
+        influencer = _load_detached(db, influencer_id)
+
+        tracker.step("replanning")
+        try:
+            summary = _replan_upcoming(db, influencer, event_description, [])
+            return {"previous_life_story_version": previous_version, "life_story_version": version, **summary}
+        except Exception:
+            db.rollback()
+            raise
+    finally:
+        db.close()
@@ -0,0 +1,88 @@
+"""Tracking of multi-step background workflows"""
+
+from typing import Any, Callable, Dict, List, Optional
+from datetime import datetime, timedelta
+import os
+import logging
+
+from database.models import get_db_session, WorkflowJob, WorkflowStatus
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = (WorkflowStatus.QUEUED, WorkflowStatus.RUNNING)
+# A job with no step reported for this long is treated as dead, e.g. its worker crashed
+STALE_AFTER = timedelta(minutes=int(os.getenv("WORKFLOW_STALE_MINUTES", "30")))
+
+
+def create_workflow(
+    db, kind: str, influencer_id: Optional[int] = None, params: Optional[Dict[str, Any]] = None
+) -> WorkflowJob:
+    """Records a queued workflow and returns it; its id is the handle given to clients."""
+    job = WorkflowJob(kind=kind, influencer_id=influencer_id, params=params)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def active_workflow(db, kind: str, influencer_id: int) -> Optional[WorkflowJob]:
+    """The influencer's queued or running job of this kind, ignoring jobs that went stale."""
+    return (
+        db.query(WorkflowJob)
+        .filter(WorkflowJob.kind == kind)
+        .filter(WorkflowJob.influencer_id == influencer_id)
+        .filter(WorkflowJob.status.in_(ACTIVE_STATUSES))
+        .filter(WorkflowJob.updated_at >= datetime.utcnow() - STALE_AFTER)
+        .first()
+    )
+
+
+def fail_interrupted_workflows(db) -> List[WorkflowJob]:
+    """
+    Marks jobs left queued or running by a previous process as failed; call at startup,
+    before any new job is created. Returns them so callers can start replacements.
+    """
+    jobs = db.query(WorkflowJob).filter(WorkflowJob.status.in_(ACTIVE_STATUSES)).all()
+    now = datetime.utcnow()
+    for job in jobs:
+        job.status = WorkflowStatus.FAILED
+        job.error = "Interrupted by a server restart"
+        job.finished_at = now
+    db.commit()
+    if jobs:
+        logger.warning(f"Marked {len(jobs)} interrupted workflow jobs as failed")
+    return jobs
+
+
+class WorkflowTracker:
+    """Step reporter handed to a running workflow. Each update commits on its own session."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+
+    def _update(self, **fields):
+        db = get_db_session()
+        try:
+            db.query(WorkflowJob).filter(WorkflowJob.id == self.job_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+    def step(self, name: str):
+        logger.info(f"Workflow {self.job_id}: {name}")
+        self._update(status=WorkflowStatus.RUNNING, step=name)
+
+
+def run_workflow(job_id: int, workflow: Callable[..., Optional[Dict[str, Any]]], *args, **kwargs):
+    """
+    Runs workflow(tracker, *args, **kwargs) and records the outcome.
+    The workflow's return value is stored as the job result.
+    """
+    tracker = WorkflowTracker(job_id)
+    try:
+        tracker.step("started")
+        result = workflow(tracker, *args, **kwargs)
+        tracker._update(status=WorkflowStatus.SUCCEEDED, step="done", result=result, finished_at=datetime.utcnow())
+    except Exception as e:
+        logger.error(f"Workflow {job_id} failed: {e}", exc_info=True)
+        tracker._update(status=WorkflowStatus.FAILED, error=str(e), finished_at=datetime.utcnow())
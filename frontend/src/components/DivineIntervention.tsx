@@ -1,6 +1,9 @@
 "use client";
 import React, { useState, useEffect } from "react";
 
+// Job polling gives up after this many 2s polls (10 minutes)
+const MAX_JOB_POLLS = 300;
+
 const MagicBlob = () => (
 	<div className='relative w-16 h-16 flex items-center justify-center'>
 		<svg className='absolute inset-0 w-full h-full' viewBox='0 0 100 100'>
@@ -99,6 +102,7 @@ const DivineIntervention = ({
 	const [eventDescription, setEventDescription] = useState("");
 	const [intensity, setIntensity] = useState("moderate");
 	const [isExiting, setIsExiting] = useState(false);
+	const [submitError, setSubmitError] = useState<string | null>(null);
 
 	useEffect(() => {
 		if (isOpen) {
@@ -114,6 +118,7 @@ const DivineIntervention = ({
 	const handleOpen = () => {
 		setIsOpen(true);
 		setIsExiting(false);
+		setSubmitError(null);
 	};
 
 	const handleClose = () => {
@@ -125,9 +130,10 @@ const DivineIntervention = ({
 		e.preventDefault();
 		if (!eventDescription.trim() || isLoading) return;
 		setIsLoading(true);
+		setSubmitError(null);
 
 		try {
-			await fetch(
+			const res = await fetch(
 				`/api/backend/influencer/${influencerId}/divine-intervention`,
 				{
 					method: "POST",
@@ -138,10 +144,38 @@ const DivineIntervention = ({
 					}),
 				}
 			);
+			const body = await res.json().catch(() => null);
+			if (!res.ok || !body?.job_id) {
+				throw new Error(
+					typeof body?.detail === "string"
+						? body.detail
+						: `Could not start the intervention (${res.status})`
+				);
+			}
+			// The rewrite and replanning run in the background; wait for the job to settle
+			let job: { status: string; error?: string | null } | null = null;
+			for (let attempt = 0; attempt < MAX_JOB_POLLS; attempt++) {
+				await new Promise((resolve) => setTimeout(resolve, 2000));
+				const jobRes = await fetch(`/api/backend/jobs/${body.job_id}`);
+				if (!jobRes.ok) {
+					throw new Error(`Could not check the intervention (${jobRes.status})`);
+				}
+				job = await jobRes.json();
+				if (job.status === "succeeded" || job.status === "failed") break;
+			}
+			if (job?.status === "failed") {
+				throw new Error(job.error ?? "The intervention failed");
+			}
+			if (job?.status !== "succeeded") {
+				throw new Error("The intervention is still running; check back later");
+			}
 			await onIntervention();
 			handleClose();
 		} catch (error) {
 			console.error("Divine Intervention failed:", error);
+			setSubmitError(
+				error instanceof Error ? error.message : "The intervention failed"
+			);
 		} finally {
 			setIsLoading(false);
 		}
@@ -203,6 +237,9 @@ const DivineIntervention = ({
 									)
 								)}
 							</div>
+							{submitError && (
+								<p className='mb-6 text-sm text-red-300'>{submitError}</p>
+							)}
 							<button
 								type='submit'
 								className='text-white/50 hover:text-white transition-colors'